@@ -0,0 +1,179 @@
+"""Уведомления о новых вакансиях для пользователей с активным поиском.
+
+AudienceIndex - обратный индекс: роль -> (уровень, формат) -> пользователи.
+Для новой вакансии перебираются только роли, которым она подходит, и
+несколько комбинаций уровня и формата, а не все пользователи.
+
+AlertDispatcher копит совпадения по пользователю и отправляет одно сообщение,
+когда поток новых вакансий для него затих: импорт 500 вакансий дает одно
+уведомление, а не 500. Отправка идет через OutboundSender с его лимитами.
+"""
+import asyncio
+import logging
+import threading
+import time
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from callbacks import callback_data
+from outbound import BLOCKED
+from ranking import ROLE_FAMILIES, format_score, level_score
+
+logger = logging.getLogger(__name__)
+
+ALERT_QUIET_SECONDS = 15  # уведомление уходит, если новых совпадений нет столько секунд
+ALERT_MAX_DELAY = 300  # но не позже, чем через столько секунд после первого совпадения
+ALERT_PREVIEW = 3  # вакансий, перечисленных в уведомлении
+
+# Роль вакансии -> роли пользователей, которым она подходит
+ROLE_AUDIENCES = {}
+for _family, _roles in ROLE_FAMILIES.items():
+    for _role in _roles:
+        ROLE_AUDIENCES.setdefault(_role, {_role}).add(_family)
+
+def salary_fits(user_salary_min, vacancy):
+    """Вилка вакансии достает до минимальных ожиданий пользователя (или данных нет)"""
+    vacancy_top = vacancy.get('salary_max') or vacancy.get('salary_min')
+    return not user_salary_min or not vacancy_top or vacancy_top >= user_salary_min
+
+class AudienceIndex:
+    """Пользователи с активным поиском, сгруппированные по профилю"""
+
+    def __init__(self):
+        self._roles = {}  # роль -> {(уровень, формат): {user_id: salary_min}}
+        self._by_user = {}  # user_id -> (роль, уровень, формат)
+        self._lock = threading.RLock()
+        self.loaded = False
+
+    def __len__(self):
+        return len(self._by_user)
+
+    def load(self, users):
+        with self._lock:
+            self._roles = {}
+            self._by_user = {}
+            for user in users:
+                self._add(user)
+            self.loaded = True
+
+    def update(self, user_id, user):
+        """Обновляет пользователя; user=None - убрать из индекса"""
+        with self._lock:
+            self.remove(user_id)
+            if user:
+                self._add(user)
+
+    def remove(self, user_id):
+        with self._lock:
+            key = self._by_user.pop(user_id, None)
+            if key is None:
+                return
+            role, level, work_format = key
+            segment = self._roles[role][(level, work_format)]
+            del segment[user_id]
+            if not segment:
+                del self._roles[role][(level, work_format)]
+
+    def _add(self, user):
+        role = (user['role'] or '').lower()
+        level = (user['level'] or '').lower()
+        work_format = (user['work_format'] or '').lower()
+        self._by_user[user['user_id']] = (role, level, work_format)
+        self._roles.setdefault(role, {}).setdefault((level, work_format), {})[user['user_id']] = user['salary_min']
+
+    def match(self, vacancy):
+        """ID пользователей, профилю которых подходит вакансия"""
+        vacancy_role = (vacancy.get('role') or '').lower()
+        vacancy_level = (vacancy.get('level') or '').lower()
+        vacancy_format = (vacancy.get('work_format') or '').lower()
+        roles = ROLE_AUDIENCES.get(vacancy_role, {vacancy_role}) if vacancy_role else self._roles.keys()
+
+        matched = []
+        with self._lock:
+            for role in roles:
+                for (level, work_format), users in self._roles.get(role, {}).items():
+                    # Те же правила, что в ранжировании ленты: соседний уровень и гибкий формат подходят
+                    if not level_score(level, vacancy_level) or not format_score(work_format, vacancy_format):
+                        continue
+                    matched.extend(
+                        user_id for user_id, salary_min in users.items() if salary_fits(salary_min, vacancy)
+                    )
+        return matched
+
+class AlertDispatcher:
+    """Очередь уведомлений с объединением по пользователю"""
+
+    def __init__(self, db, sender, quiet=ALERT_QUIET_SECONDS, max_delay=ALERT_MAX_DELAY):
+        self.db = db
+        self.sender = sender
+        self.quiet = quiet
+        self.max_delay = max_delay
+        self.pending = {}  # user_id -> [ID вакансий, первое совпадение, последнее совпадение]
+        self._loop = None
+        self._task = None
+        self._sends = set()
+
+    def start(self):
+        """Подписывается на новые вакансии; вызывается из работающего event loop"""
+        self._loop = asyncio.get_running_loop()
+        self.db.sync.add_vacancy_listener(self.on_vacancies)
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """Останавливает отправку; накопленные, но не отправленные уведомления теряются"""
+        tasks = [task for task in (self._task, *self._sends) if task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def on_vacancies(self, vacancies, created):
+        """Слушатель записи вакансий; выполняется в потоке базы"""
+        if not created or self._loop is None:
+            return
+        matches = self.db.sync.match_audience(vacancies)
+        if matches:
+            self._loop.call_soon_threadsafe(self._enqueue, matches)
+
+    def _enqueue(self, matches):
+        now = time.monotonic()
+        for user_id, vacancy_ids in matches.items():
+            entry = self.pending.get(user_id)
+            if entry is None:
+                self.pending[user_id] = [list(vacancy_ids), now, now]
+            else:
+                entry[0].extend(vacancy_ids)
+                entry[2] = now
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(1)
+            now = time.monotonic()
+            ready = [
+                user_id for user_id, (_, first, last) in self.pending.items()
+                if now - last >= self.quiet or now - first >= self.max_delay
+            ]
+            for user_id in ready:
+                vacancy_ids = self.pending.pop(user_id)[0]
+                task = asyncio.create_task(self._send(user_id, vacancy_ids))
+                self._sends.add(task)
+                task.add_done_callback(self._sends.discard)
+
+    async def _send(self, user_id, vacancy_ids):
+        vacancy_ids = sorted(set(vacancy_ids), reverse=True)
+        vacancies = await self.db.get_vacancies_by_ids(vacancy_ids[:ALERT_PREVIEW])
+        if not vacancies:
+            return
+
+        lines = [f"🔔 Новые подходящие вакансии: {len(vacancy_ids)}", ""]
+        lines.extend(f"• {vacancy['title']}" for vacancy in vacancies)
+        if len(vacancy_ids) > len(vacancies):
+            lines.append(f"…и еще {len(vacancy_ids) - len(vacancies)}")
+
+        status, error = await self.sender.send(
+            user_id, '\n'.join(lines),
+            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔍 Открыть ленту", callback_data=callback_data('find_jobs'))]])
+        )
+        if status == BLOCKED:
+            await self.db.mark_users_blocked([user_id])
+        elif error:
+            logger.warning(f"Не удалось отправить уведомление {user_id}: {error}")
@@ -0,0 +1,300 @@
+"""Бенчмарки запросов Smart Job Bot на временной базе.
+
+Запуск:
+    python benchmarks.py feed-hidden --vacancies 50000
+    python benchmarks.py ranking --vacancies 200000
+    python benchmarks.py search --vacancies 100000
+    python benchmarks.py cv --cvs 5000
+    python benchmarks.py load --users 500 --concurrency 50
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import job_bot
+from job_bot import DatabaseManager, vacancy_fingerprint
+from ranking import base_score
+
+ROLES = ['backend', 'frontend', 'fullstack', 'devops', 'ai', 'design', 'product']
+LEVELS = ['junior', 'middle', 'senior', 'lead']
+FORMATS = ['remote', 'hybrid', 'office']
+PROFILE = {'role': 'backend', 'level': 'middle', 'work_format': 'remote'}
+TAGS = [
+    'python', 'sql', 'docker', 'kubernetes', 'aws', 'go', 'java', 'react', 'typescript', 'node',
+    'django', 'fastapi', 'postgresql', 'redis', 'kafka', 'terraform', 'figma', 'pytorch', 'spark', 'linux',
+]
+
+def temp_database():
+    """Создает DatabaseManager на временном файле"""
+    path = os.path.join(tempfile.mkdtemp(prefix='jobbot-bench-'), 'bench.db')
+    return DatabaseManager(path)
+
+def fill_vacancies(db, count, seed=42, profile_share=0.3):
+    """Быстро заполняет таблицу вакансий; доля profile_share точно подходит под PROFILE"""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        if rng.random() < profile_share:
+            segment = (PROFILE['role'], PROFILE['level'], PROFILE['work_format'])
+        else:
+            segment = (rng.choice(ROLES), rng.choice(LEVELS), rng.choice(FORMATS))
+        vacancy = {
+            'title': f"{rng.choice(ROLES).title()} Engineer #{i}",
+            'company': f"Company {rng.randrange(count // 10 + 1)}",
+            'apply_url': f"https://example.com/jobs/{i}",
+        }
+        salary_min = rng.choice([None, 2000, 3000, 4000, 5000])
+        vacancy.update({
+            'tags': ','.join(rng.sample(TAGS, rng.randint(1, 6))),
+            'description_short': 'Backend services ' * rng.randint(1, 8),
+            'salary_min': salary_min,
+            'salary_max': salary_min and salary_min + rng.choice([1000, 2000, 3000]),
+        })
+        rows.append((
+            vacancy['title'], vacancy['company'], *segment, vacancy['apply_url'],
+            vacancy['tags'], vacancy['description_short'], vacancy['salary_min'], vacancy['salary_max'],
+            f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:00:00",
+            vacancy_fingerprint(vacancy), base_score(vacancy), 'bench'
+        ))
+
+    with db.transaction() as conn:
+        conn.executemany('''
+            INSERT INTO vacancies (title, company, role, level, work_format, apply_url, tags,
+                                   description_short, salary_min, salary_max, created_at,
+                                   fingerprint, relevance_score, source)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+    db.connection.execute('ANALYZE')
+
+def measure(func, repeat):
+    """Возвращает (p50, p95) времени вызова в миллисекундах"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
+
+def walk_feed(db, user, pages):
+    """Листает ленту как show_feed; возвращает время страниц с номерами из pages (мс) и последний курсор"""
+    timings = {}
+    cursor = None
+    for page in range(1, max(pages) + 1):
+        started = time.perf_counter()
+        vacancies = db.get_ranked_vacancies(user, limit=job_bot.FEED_PAGE_SIZE + 1, after_id=cursor)
+        if page in pages:
+            timings[page] = (time.perf_counter() - started) * 1000
+        if len(vacancies) <= job_bot.FEED_PAGE_SIZE:
+            break
+        cursor = vacancies[job_bot.FEED_PAGE_SIZE - 1]['id']
+    return timings, cursor
+
+def bench_feed_hidden(args):
+    """Время страниц ранжированной ленты по глубине при росте истории скрытий"""
+    db = temp_database()
+    fill_vacancies(db, args.vacancies)
+    matching = [row[0] for row in db.connection.execute(
+        'SELECT id FROM vacancies WHERE role = ? AND level = ? AND work_format = ?',
+        (PROFILE['role'], PROFILE['level'], PROFILE['work_format'])
+    )]
+    pages = sorted(set(args.pages))
+    print(f"Вакансий: {args.vacancies}, подходят под профиль: {len(matching)}")
+    print(f"{'скрыто':>8} {'стр.1 p50 мс':>13} " + ' '.join(f"{f'стр.{page} мс':>12}" for page in pages)
+          + f" {'без обхода мс':>14}")
+
+    rng = random.Random(7)
+    for user_id, hidden in enumerate(args.hidden, start=1):
+        user = dict(PROFILE, user_id=user_id)
+        hidden_ids = rng.sample(matching, min(hidden, len(matching)))
+        with db.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO user_actions (user_id, vacancy_id, action) VALUES (?, ?, 'hidden')",
+                [(user_id, vacancy_id) for vacancy_id in hidden_ids]
+            )
+        db.exclusions.discard(user_id)
+        p50, _ = measure(lambda: db.get_ranked_vacancies(user), args.repeat)
+        timings, cursor = walk_feed(db, user, pages)
+
+        # Курсор без сохраненного обхода (после перезапуска): перебор всего, что выше него
+        db.feed_sessions.discard(user_id)
+        started = time.perf_counter()
+        db.get_ranked_vacancies(user, after_id=cursor)
+        cold = (time.perf_counter() - started) * 1000
+        print(f"{hidden:>8} {p50:>13.3f} " + ' '.join(
+            f"{timings[page]:>12.3f}" if page in timings else f"{'-':>12}" for page in pages
+        ) + f" {cold:>14.1f}")
+    db.close()
+
+def bench_ranking(args):
+    """Ранжированная лента: top-k слияние сегментов против полной сортировки каталога"""
+    from ranking import UserProfile
+
+    db = temp_database()
+    fill_vacancies(db, args.vacancies)
+    db.compact_vacancies()
+    started = time.perf_counter()
+    index = db._ranking_index()
+    print(f"Вакансий: {len(index)}, загрузка индекса: {time.perf_counter() - started:.2f} с")
+
+    profiles = {
+        'без навыков': {'role': 'backend', 'level': 'middle', 'work_format': 'remote'},
+        'навыки': {'role': 'engineering', 'level': 'middle', 'work_format': 'remote',
+                   'cv_analysis': {'skills': ['python', 'sql']}},
+        'навыки+зарплата': {'role': 'backend', 'level': 'senior', 'work_format': 'remote',
+                            'salary_min': 3000, 'salary_max': 5000,
+                            'cv_analysis': {'skills': ['python', 'django', 'docker', 'aws']}},
+    }
+    deep = max(args.pages)
+    print(f"{'профиль':>16} {'top-k p50 мс':>13} {f'стр.{deep} мс':>12} {f'стр.{deep} заново мс':>19} "
+          f"{'сортировка мс':>14}")
+    for name, user in profiles.items():
+        profile = UserProfile(user)
+        p50, _ = measure(lambda: index.top_k(profile, job_bot.FEED_PAGE_SIZE), args.repeat)
+        # Глубокая страница: продолжение обхода против нового обхода с курсором
+        scan = index.scan(profile)
+        for _ in range(deep - 1):
+            last = scan.next(job_bot.FEED_PAGE_SIZE)
+        started = time.perf_counter()
+        scan.next(job_bot.FEED_PAGE_SIZE)
+        deep_ms = (time.perf_counter() - started) * 1000
+        restart_p50, _ = measure(
+            lambda: index.top_k(profile, job_bot.FEED_PAGE_SIZE, after=last[-1]), 3
+        ) if last else (0.0, 0.0)
+        sort_p50, _ = measure(
+            lambda: sorted(index._by_id.values(), key=profile.score, reverse=True)[:job_bot.FEED_PAGE_SIZE],
+            3
+        )
+        print(f"{name:>16} {p50:>13.3f} {deep_ms:>12.3f} {restart_p50:>19.3f} {sort_p50:>14.1f}")
+    db.close()
+
+def bench_search(args):
+    """Полнотекстовый поиск FTS5 с BM25 против сканирования LIKE '%term%'"""
+    from job_bot import SEARCH_COLUMNS, SEARCH_PAGE_SIZE, search_match_expression
+
+    db = temp_database()
+    fill_vacancies(db, args.vacancies)
+    print(f"Вакансий: {args.vacancies}")
+
+    like_where = ' OR '.join(f"{column} LIKE ?" for column in SEARCH_COLUMNS)
+
+    def like_search(term, limit=SEARCH_PAGE_SIZE):
+        return db.fetchall(
+            f"SELECT * FROM vacancies WHERE {like_where} ORDER BY created_at DESC, id DESC LIMIT ?",
+            [f'%{term}%'] * len(SEARCH_COLUMNS) + [limit]
+        )
+
+    def like_scan(term):
+        # Любое ранжирование по LIKE требует просмотреть все совпадения
+        return db.connection.execute(
+            f"SELECT COUNT(*) FROM vacancies WHERE {like_where}", [f'%{term}%'] * len(SEARCH_COLUMNS)
+        ).fetchone()
+
+    print("LIKE-страница - первые совпадения по дате без ранжирования, LIKE-скан - все совпадения")
+    print(f"{'запрос':>18} {'найдено':>8} {'FTS p50 мс':>11} {'стр.2 p50 мс':>13} "
+          f"{'LIKE-стр. мс':>13} {'LIKE-скан мс':>13}")
+    for term in ('kafka', 'python', 'design engineer', 'services', 'no-such-word'):
+        found = db.connection.execute(
+            'SELECT COUNT(*) FROM vacancies_fts WHERE vacancies_fts MATCH ?', (search_match_expression(term),)
+        ).fetchone()[0]
+        # Первая страница - снимок результатов и их загрузка, следующая - только загрузка из снимка
+        p50, _ = measure(lambda: db.get_search_page(1, db.start_search(1, term).search_id), args.repeat)
+        search_id = db.start_search(1, term).search_id
+        next_p50, _ = measure(lambda: db.get_search_page(1, search_id, SEARCH_PAGE_SIZE), args.repeat)
+        like_repeat = max(3, args.repeat // 20)
+        like_p50, _ = measure(lambda: like_search(term.split()[0]), like_repeat)
+        scan_p50, _ = measure(lambda: like_scan(term.split()[0]), like_repeat)
+        print(f"{term:>18} {found:>8} {p50:>11.3f} {next_p50:>13.3f} {like_p50:>13.3f} {scan_p50:>13.3f}")
+    db.close()
+
+def synthetic_cv(rng):
+    """Резюме на ~2-4 КБ: навыки вперемешку с обычным текстом"""
+    from cv_analysis import SKILLS
+
+    filler = ('Worked on distributed systems and internal tooling for the product team. '
+              'Отвечал за разработку сервисов, ревью кода и наставничество. ')
+    parts = [f"{rng.choice(['Junior', 'Middle', 'Senior', 'Lead'])} developer, "
+             f"{rng.randint(1, 15)}+ years of experience."]
+    synonyms = [synonym for names in SKILLS.values() for synonym in names]
+    for _ in range(rng.randint(10, 20)):
+        parts.append(filler * rng.randint(1, 2))
+        parts.append(', '.join(rng.sample(synonyms, 3)) + '.')
+    return ' '.join(parts)
+
+def bench_cv(args):
+    """Пропускная способность разбора резюме: один процесс и пул процессов"""
+    from cv_analysis import CVAnalyzer, analyze_cv, get_matcher
+
+    rng = random.Random(42)
+    texts = [synthetic_cv(rng) for _ in range(args.cvs)]
+    size = sum(map(len, texts)) / len(texts)
+    get_matcher()
+    print(f"Резюме: {len(texts)}, средний размер: {size / 1024:.1f} КБ")
+
+    started = time.perf_counter()
+    for text in texts:
+        analyze_cv(text)
+    elapsed = time.perf_counter() - started
+    print(f"{'1 процесс':>16}: {len(texts) / elapsed:>8.0f} резюме/с")
+
+    cpus = os.cpu_count() or 1
+    if cpus < 2:
+        # Процессы пула делят один процессор: замер показывает накладные расходы, а не ускорение
+        print("Доступен один процессор: пул не ускоряет разбор, замер - только для накладных расходов")
+    for workers in sorted({2, max(2, cpus)}):
+        analyzer = CVAnalyzer(workers)
+        analyzer.analyze_all(texts[:workers * 64])  # запуск процессов не входит в замер
+        started = time.perf_counter()
+        analyzer.analyze_all(texts)
+        elapsed = time.perf_counter() - started
+        analyzer.close()
+        label = f"пул x{workers}" + (f" на {cpus} CPU" if workers > cpus else '')
+        print(f"{label:>16}: {len(texts) / elapsed:>8.0f} резюме/с")
+
+def bench_load(args):
+    """Пропускная способность и задержки обработчиков под нагрузкой виртуальных пользователей"""
+    import asyncio
+    import json
+    from loadtest import LoadTest
+
+    load_test = LoadTest(
+        users=args.users, concurrency=args.concurrency, actions=args.actions, vacancies=args.vacancies,
+        broadcasts=args.broadcasts, api_latency=args.api_latency / 1000,
+    )
+    asyncio.run(load_test.run())
+    print(load_test.report())
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as output:
+            json.dump(load_test.results(), output, ensure_ascii=False, indent=2)
+
+BENCHMARKS = {
+    'feed-hidden': bench_feed_hidden,
+    'ranking': bench_ranking,
+    'search': bench_search,
+    'cv': bench_cv,
+    'load': bench_load,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки Smart Job Bot")
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('--vacancies', type=int, default=50000)
+    parser.add_argument('--hidden', type=int, nargs='+', default=[0, 100, 1000, 5000, 10000])
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--pages', type=int, nargs='+', default=[2, 100, 1000],
+                        help="номера страниц ленты для замера (feed-hidden, ranking)")
+    parser.add_argument('--cvs', type=int, default=5000)
+    parser.add_argument('--users', type=int, default=200, help="виртуальных пользователей (load)")
+    parser.add_argument('--concurrency', type=int, default=50, help="одновременно активных пользователей (load)")
+    parser.add_argument('--actions', type=int, default=20, help="действий пользователя после анкеты (load)")
+    parser.add_argument('--broadcasts', type=int, default=1, help="рассылок администратора (load)")
+    parser.add_argument('--api-latency', type=float, default=0.0, help="имитация задержки Bot API, мс (load)")
+    parser.add_argument('--json', metavar='FILE', help="сохранить итог в JSON (load)")
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args)
+
+if __name__ == "__main__":
+    main()
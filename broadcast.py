@@ -0,0 +1,155 @@
+"""Фоновые рассылки администратора.
+
+Рассылка - задание в таблице broadcasts со списком получателей в
+broadcast_recipients (статус на каждого). Отправка идет через OutboundSender
+пачками в фоне; результаты сохраняются небольшими порциями, поэтому после
+перезапуска бот продолжает с неотправленных получателей. Ход рассылки виден в
+сообщении администратору, которое обновляется по мере отправки.
+"""
+import asyncio
+import logging
+import time
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest, TelegramError
+
+from callbacks import callback_data
+from outbound import FAILED
+
+logger = logging.getLogger(__name__)
+
+BROADCAST_BATCH = 200  # получателей, читаемых из базы за раз
+BROADCAST_FLUSH_EVERY = 25  # результатов между записями в базу
+BROADCAST_PROGRESS_INTERVAL = 5.0  # секунд между обновлениями сообщения о ходе
+
+class BroadcastEngine:
+    """Запуск, выполнение и возобновление рассылок"""
+
+    def __init__(self, db, sender):
+        self.db = db
+        self.sender = sender
+        self._tasks = {}
+
+    async def start(self, admin_chat_id, text):
+        """Создает задание рассылки по всем доступным пользователям и запускает его"""
+        broadcast_id, total = await self.db.create_broadcast(text, admin_chat_id)
+        message = await self.sender.bot.send_message(
+            chat_id=admin_chat_id,
+            text=self.progress_text({'id': broadcast_id, 'status': 'running', 'total': total,
+                                     'sent_count': 0, 'blocked_count': 0, 'failed_count': 0}),
+            reply_markup=self.progress_keyboard(broadcast_id),
+        )
+        await self.db.set_broadcast_progress_message(broadcast_id, message.message_id)
+        self._spawn(broadcast_id)
+        return broadcast_id
+
+    async def resume(self):
+        """Продолжает рассылки, прерванные перезапуском"""
+        for broadcast in await self.db.get_running_broadcasts():
+            logger.info(f"Возобновление рассылки {broadcast['id']}")
+            self._spawn(broadcast['id'])
+
+    async def cancel(self, broadcast_id):
+        """Останавливает рассылку; отправленное остается отправленным"""
+        await self.db.finish_broadcast(broadcast_id, 'cancelled')
+        task = self._tasks.get(broadcast_id)
+        if task:
+            task.cancel()
+        await self.report(await self.db.get_broadcast(broadcast_id))
+
+    async def shutdown(self):
+        """Прерывает выполняемые рассылки при остановке бота; они продолжатся после запуска"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _spawn(self, broadcast_id):
+        if broadcast_id in self._tasks:
+            return
+        # Не application.create_task: приложение ждет такие задачи при остановке
+        task = asyncio.create_task(self.run(broadcast_id))
+        self._tasks[broadcast_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(broadcast_id, None))
+
+    async def run(self, broadcast_id):
+        """Отправляет рассылку всем получателям со статусом pending"""
+        broadcast = await self.db.get_broadcast(broadcast_id)
+        results = []
+        sends = set()
+        last_report = time.monotonic()
+        after_user_id = 0
+
+        try:
+            while True:
+                recipients = await self.db.get_pending_recipients(broadcast_id, after_user_id, BROADCAST_BATCH)
+                if not recipients:
+                    break
+                after_user_id = recipients[-1]
+
+                # Одновременность и темп ограничивает OutboundSender
+                sends = {asyncio.ensure_future(self._send(broadcast, user_id, results)) for user_id in recipients}
+                while sends:
+                    _, sends = await asyncio.wait(sends, timeout=1.0, return_when=asyncio.FIRST_COMPLETED)
+                    if len(results) >= BROADCAST_FLUSH_EVERY:
+                        flushed, results[:] = results[:], []
+                        await self.db.save_broadcast_results(broadcast_id, flushed)
+                    if time.monotonic() - last_report >= BROADCAST_PROGRESS_INTERVAL:
+                        await self.report(await self.db.get_broadcast(broadcast_id))
+                        last_report = time.monotonic()
+        finally:
+            # При остановке сохраняем все завершенные отправки; прерванные
+            # остаются pending и после перезапуска уйдут повторно
+            for send in sends:
+                send.cancel()
+            if results:
+                await self.db.save_broadcast_results(broadcast_id, results[:])
+
+        await self.db.finish_broadcast(broadcast_id, 'done')
+        await self.report(await self.db.get_broadcast(broadcast_id))
+
+    async def _send(self, broadcast, user_id, results):
+        try:
+            status, error = await self.sender.send(user_id, broadcast['text'], parse_mode='Markdown')
+        except TelegramError as e:
+            status, error = FAILED, e.message
+        except Exception as e:
+            # Иначе получатель остался бы pending в завершенной рассылке и не получил бы ее и после перезапуска
+            logger.exception(f"Рассылка {broadcast['id']}: ошибка отправки пользователю {user_id}")
+            status, error = FAILED, f"{type(e).__name__}: {e}"
+        results.append((user_id, status, error))
+
+    async def report(self, broadcast):
+        """Обновляет сообщение администратора о ходе рассылки"""
+        if not broadcast or not broadcast.get('progress_message_id'):
+            return
+        try:
+            await self.sender.bot.edit_message_text(
+                chat_id=broadcast['admin_chat_id'],
+                message_id=broadcast['progress_message_id'],
+                text=self.progress_text(broadcast),
+                reply_markup=self.progress_keyboard(broadcast['id']) if broadcast['status'] == 'running' else None,
+            )
+        except BadRequest as e:
+            # "message is not modified" и удаленное сообщение не мешают рассылке
+            logger.debug(f"Не удалось обновить ход рассылки {broadcast['id']}: {e.message}")
+        except TelegramError as e:
+            logger.warning(f"Не удалось обновить ход рассылки {broadcast['id']}: {e.message}")
+
+    @staticmethod
+    def progress_text(broadcast):
+        done = broadcast['sent_count'] + broadcast['blocked_count'] + broadcast['failed_count']
+        status = {'running': '⏳ идет', 'done': '✅ завершена', 'cancelled': '⏹ остановлена'}
+        return (
+            f"📢 Рассылка #{broadcast['id']}: {status.get(broadcast['status'], broadcast['status'])}\n\n"
+            f"Обработано: {done} из {broadcast['total']}\n"
+            f"✅ Доставлено: {broadcast['sent_count']}\n"
+            f"🚫 Заблокировали бота: {broadcast['blocked_count']}\n"
+            f"⚠️ Ошибки: {broadcast['failed_count']}"
+        )
+
+    @staticmethod
+    def progress_keyboard(broadcast_id):
+        return InlineKeyboardMarkup([[
+            InlineKeyboardButton("⏹ Остановить", callback_data=callback_data('broadcast_stop', broadcast_id))
+        ]])
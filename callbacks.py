@@ -0,0 +1,228 @@
+"""Маршрутизация нажатий inline-кнопок.
+
+callback_data - версия формата, код маршрута и аргументы через ':':
+'1ap:2s' - отклик на вакансию 100. Целые аргументы записываются в base36,
+поэтому даже с несколькими аргументами данные намного короче 64 байт лимита
+Telegram. Таблица CALLBACK_ROUTES задает код и типы аргументов маршрута;
+обработчики привязывает бот через CallbackRouter.add, разбор нажатия - один
+поиск по коду в словаре.
+
+Кнопки другой версии формата (в том числе старого вида 'apply_100') и
+неизвестные коды не игнорируются: пользователь получает ответ, что кнопка
+устарела, а роутер считает такие нажатия вместе со временем и ошибками
+каждого маршрута.
+"""
+import logging
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+CALLBACK_VERSION = '1'
+CALLBACK_MAX_BYTES = 64  # лимит callback_data в Bot API
+CALLBACK_SEPARATOR = ':'
+
+# Имя маршрута -> (код в callback_data, типы аргументов). Коды не меняются и
+# не переиспользуются: несовместимое изменение - новая CALLBACK_VERSION
+CALLBACK_ROUTES = {
+    'main_menu': ('mm', ()),
+    'setup_profile': ('sp', ()),
+    'role': ('ro', (str,)),
+    'level': ('lv', (str,)),
+    'work_format': ('wf', (str,)),
+    'location_remote': ('lr', ()),
+    'consent_yes': ('cy', ()),
+    'consent_no': ('cn', ()),
+    'find_jobs': ('fj', ()),
+    'feed_page': ('fp', (int,)),
+    'search_page': ('ss', (int, int)),  # снимок поиска и смещение; прежние 'sr' и 'sq' - курсоры по ID и рангу
+    'apply': ('ap', (int,)),
+    'save': ('sv', (int,)),
+    'unsave': ('us', (int,)),
+    'hide': ('hd', (int,)),
+    'saved_list': ('sl', ()),
+    'saved_page': ('sg', (int,)),
+    'premium_info': ('pi', ()),
+    'buy_premium': ('bp', ()),
+    'tools_menu': ('tm', ()),
+    'help_menu': ('hm', ()),
+    'update_cv': ('uc', ()),
+    'setup_filters': ('sf', ()),
+    'toggle_search': ('ts', ()),
+    'admin_stats': ('as', ()),
+    'admin_perf': ('pf', ()),
+    'admin_broadcast': ('ab', ()),
+    'admin_add_vacancy': ('aa', ()),
+    'admin_import': ('ai', ()),
+    'broadcast_stop': ('bs', (int,)),
+}
+ROUTES_BY_CODE = {code: (name, types) for name, (code, types) in CALLBACK_ROUTES.items()}
+
+STALE_TEXT = "⌛ Эта кнопка устарела. Откройте меню заново: /start"
+FORBIDDEN_TEXT = "❌ Нет доступа"
+ERROR_TEXT = "⚠️ Не получилось, попробуйте еще раз"
+
+class CallbackError(Exception):
+    """callback_data не удалось разобрать"""
+
+class StaleCallback(CallbackError):
+    """Кнопка другой версии формата"""
+
+class UnknownCallback(CallbackError):
+    """Версия текущая, но маршрут или аргументы не распознаны"""
+
+def encode_cursor(value):
+    """Кодирует неотрицательное целое (ID, курсор пагинации) в base36 для callback_data"""
+    digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+    encoded = ''
+    while True:
+        value, remainder = divmod(value, 36)
+        encoded = digits[remainder] + encoded
+        if not value:
+            return encoded
+
+def callback_data(name, *args):
+    """callback_data для кнопки маршрута name; необязательные хвостовые аргументы можно опустить"""
+    code, types = CALLBACK_ROUTES[name]
+    if len(args) > len(types):
+        raise ValueError(f"Маршрут {name} принимает {len(types)} аргументов")
+
+    parts = [CALLBACK_VERSION + code]
+    for value, kind in zip(args, types):
+        if value is None:
+            parts.append('')
+        elif kind is int:
+            parts.append(encode_cursor(value))
+        else:
+            value = str(value)
+            if CALLBACK_SEPARATOR in value:
+                raise ValueError(f"Аргумент маршрута {name} содержит '{CALLBACK_SEPARATOR}'")
+            parts.append(value)
+
+    data = CALLBACK_SEPARATOR.join(parts).rstrip(CALLBACK_SEPARATOR)
+    if len(data.encode()) > CALLBACK_MAX_BYTES:
+        raise ValueError(f"callback_data маршрута {name} длиннее {CALLBACK_MAX_BYTES} байт")
+    return data
+
+def parse_callback(data):
+    """(имя маршрута, аргументы) из callback_data; StaleCallback или UnknownCallback для чужих данных"""
+    if not data or not data.startswith(CALLBACK_VERSION):
+        raise StaleCallback(data)
+    head, *raw_args = data[len(CALLBACK_VERSION):].split(CALLBACK_SEPARATOR)
+    route = ROUTES_BY_CODE.get(head)
+    if route is None or len(raw_args) > len(route[1]):
+        raise UnknownCallback(data)
+
+    name, types = route
+    args = []
+    for raw, kind in zip(raw_args, types):
+        if not raw:
+            args.append(None)
+        elif kind is int:
+            try:
+                args.append(int(raw, 36))
+            except ValueError:
+                raise UnknownCallback(data) from None
+        else:
+            args.append(raw)
+    return name, args
+
+class RouteStats:
+    """Время и ошибки обработчика маршрута"""
+
+    __slots__ = ('calls', 'errors', 'seconds', 'max_seconds')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+
+    def record(self, seconds, failed):
+        self.calls += 1
+        self.errors += failed
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+class Route:
+    __slots__ = ('name', 'handler', 'toast', 'admin', 'stats')
+
+    def __init__(self, name, handler, toast, admin):
+        self.name = name
+        self.handler = handler
+        self.toast = toast
+        self.admin = admin
+        self.stats = RouteStats()
+
+class CallbackRouter:
+    """Таблица обработчиков нажатий с учетом времени и ошибок по маршрутам"""
+
+    def __init__(self, is_admin=lambda user_id: False):
+        self.is_admin = is_admin
+        self.routes = {}
+        self.rejected = Counter(stale=0, unknown=0, forbidden=0)
+
+    def add(self, name, handler, toast=False, admin=False):
+        """Привязывает handler(query, context, *args) к маршруту.
+
+        Нажатие подтверждается (query.answer) один раз: обычные маршруты -
+        сразу, чтобы у кнопки не крутились часики; toast-маршруты - после
+        обработчика, текстом, который он вернул. admin - только для ADMIN_USERS.
+        """
+        if name not in CALLBACK_ROUTES:
+            raise KeyError(f"Маршрута {name} нет в CALLBACK_ROUTES")
+        self.routes[name] = Route(name, handler, toast, admin)
+
+    async def dispatch(self, update, context):
+        query = update.callback_query
+        try:
+            name, args = parse_callback(query.data)
+            route = self.routes.get(name)
+            if route is None:
+                raise UnknownCallback(query.data)
+        except StaleCallback:
+            self.rejected['stale'] += 1
+            await query.answer(STALE_TEXT, show_alert=True)
+            return
+        except UnknownCallback:
+            self.rejected['unknown'] += 1
+            logger.warning(f"Неизвестная кнопка {query.data!r} от {query.from_user.id}")
+            await query.answer(STALE_TEXT, show_alert=True)
+            return
+
+        if route.admin and not self.is_admin(query.from_user.id):
+            self.rejected['forbidden'] += 1
+            await query.answer(FORBIDDEN_TEXT)
+            return
+
+        if not route.toast:
+            await query.answer()
+
+        started = time.perf_counter()
+        failed = True
+        try:
+            toast = await route.handler(query, context, *args)
+            failed = False
+        finally:
+            route.stats.record(time.perf_counter() - started, failed)
+            if route.toast:
+                await query.answer(ERROR_TEXT if failed else toast)
+
+    def report(self):
+        """Строки статистики по маршрутам, самые нагруженные сверху"""
+        lines = []
+        for route in sorted(self.routes.values(), key=lambda route: -route.stats.seconds):
+            stats = route.stats
+            if not stats.calls:
+                continue
+            lines.append(
+                f"{route.name}: {stats.calls} нажатий, среднее {stats.seconds / stats.calls * 1000:.0f} мс, "
+                f"максимум {stats.max_seconds * 1000:.0f} мс, ошибок {stats.errors}"
+            )
+        rejected = self.rejected
+        if any(rejected.values()):
+            lines.append(
+                f"отклонено: устаревших {rejected['stale']}, неизвестных {rejected['unknown']}, "
+                f"без доступа {rejected['forbidden']}"
+            )
+        return lines
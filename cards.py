@@ -0,0 +1,196 @@
+"""Кэш готовых карточек вакансий.
+
+Карточка - Markdown-текст и клавиатура сообщения о вакансии. Текст зависит
+только от вакансии и варианта показа (лента или сохраненные, premium или free),
+поэтому собирается один раз и берется из LRU-кэша по (ID вакансии, вариант).
+Клавиатура ленты зависит еще от того, может ли пользователь откликнуться и
+сохранена ли у него вакансия: для каждого из четырех сочетаний она строится
+при первом показе и хранится в той же записи.
+
+Все значения из вакансии экранируются, поэтому '*' или '_' в названии больше
+не ломают отправку. Карточка помнит поля вакансии, из которых собрана, и
+собирается заново, если переданная вакансия с ними не совпадает: так в кэше
+не задерживается текст, прочитанный из базы до изменения вакансии, в каком бы
+порядке ни выполнились чтение, сброс и сборка. Изменение вакансии (слушатель
+записи с created=False) сразу освобождает ее карточки.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.helpers import escape_markdown
+
+from callbacks import callback_data
+
+CARD_CACHE_SIZE = 5000  # карточек в кэше; одна вакансия дает до пяти вариантов
+
+# Поля вакансии, от которых зависят тексты карточек
+CARD_FIELDS = ('title', 'company', 'salary_min', 'salary_max', 'currency', 'location', 'work_format',
+               'description_short', 'requirements', 'apply_url', 'contacts')
+
+def md(value, default=''):
+    """Значение вакансии для Markdown-текста"""
+    return escape_markdown(str(value), version=1) if value not in (None, '') else default
+
+def salary_line(vacancy):
+    if vacancy.get('salary_min') and vacancy.get('salary_max'):
+        return f"💵 **Salary:** {vacancy['salary_min']} - {vacancy['salary_max']} {md(vacancy.get('currency'), 'USD')}\n"
+    return ""
+
+def company_line(vacancy, premium):
+    return f"🏢 **Company:** {md(vacancy.get('company'))}" if premium else "🏢 **Company:** [Premium only]"
+
+def render_feed(vacancy, premium):
+    return f"""🚀 **{md(vacancy['title'])}**
+
+{company_line(vacancy, premium)}
+{salary_line(vacancy)}📍 **Location:** {md(vacancy.get('location'))} | {md(vacancy.get('work_format'), 'Remote')}
+
+📝 **Description:** {md(vacancy.get('description_short'))}
+
+🔧 **Requirements:** {md(vacancy.get('requirements'))}"""
+
+def render_saved(vacancy, premium):
+    return f"""⭐ **Сохраненная вакансия**
+
+🚀 **{md(vacancy['title'])}**
+
+{company_line(vacancy, premium)}
+{salary_line(vacancy)}📍 **Location:** {md(vacancy.get('location'))}
+
+📝 **Description:** {md(vacancy.get('description_short'))}"""
+
+def render_apply(vacancy):
+    if vacancy.get('apply_url'):
+        apply_text = f"📨 **Ссылка для отклика:** {md(vacancy['apply_url'])}"
+    elif vacancy.get('contacts'):
+        apply_text = f"📧 **Контакты:** {md(vacancy['contacts'])}"
+    else:
+        apply_text = "ℹ️ Контактная информация не указана"
+    return (
+        f"📨 **Отклик на вакансию**\n\n"
+        f"**{md(vacancy['title'])}** at {md(vacancy.get('company'))}\n\n"
+        f"{apply_text}"
+    )
+
+RENDERERS = {
+    'feed_premium': lambda vacancy: render_feed(vacancy, True),
+    'feed_free': lambda vacancy: render_feed(vacancy, False),
+    'saved_premium': lambda vacancy: render_saved(vacancy, True),
+    'saved_free': lambda vacancy: render_saved(vacancy, False),
+    'apply': render_apply,
+}
+
+def feed_keyboard(vacancy_id, can_apply, saved):
+    if can_apply:
+        apply_button = InlineKeyboardButton("📨 Apply", callback_data=callback_data('apply', vacancy_id))
+    else:
+        apply_button = InlineKeyboardButton("🔒 Apply (Premium)", callback_data=callback_data('premium_info'))
+    return InlineKeyboardMarkup([[
+        apply_button,
+        InlineKeyboardButton("💚 Saved" if saved else "❤️ Save", callback_data=callback_data('save', vacancy_id)),
+        InlineKeyboardButton("👎 Hide", callback_data=callback_data('hide', vacancy_id)),
+    ]])
+
+def saved_keyboard(vacancy_id):
+    return InlineKeyboardMarkup([[
+        InlineKeyboardButton("📨 Apply", callback_data=callback_data('apply', vacancy_id)),
+        InlineKeyboardButton("🗑️ Удалить", callback_data=callback_data('unsave', vacancy_id)),
+    ]])
+
+def card_source(vacancy):
+    """Значения полей, из которых собирается карточка"""
+    return tuple(vacancy.get(field) for field in CARD_FIELDS)
+
+class Card:
+    __slots__ = ('text', 'markups', 'source')
+
+    def __init__(self, text, source):
+        self.text = text
+        self.markups = {}
+        self.source = source
+
+class VacancyCards:
+    """LRU-кэш карточек по (ID вакансии, вариант) со счетчиками попаданий и времени сборки"""
+
+    def __init__(self, maxsize=CARD_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._cards = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.render_seconds = 0.0
+
+    def __len__(self):
+        return len(self._cards)
+
+    def _card(self, vacancy, variant):
+        key = (vacancy['id'], variant)
+        source = card_source(vacancy)
+        with self._lock:
+            card = self._cards.get(key)
+            # Карточка из другой версии вакансии (прочитанной до или после изменения) - промах
+            if card is not None and card.source == source:
+                self._cards.move_to_end(key)
+                self.hits += 1
+                return card
+            self.misses += 1
+
+        started = time.perf_counter()
+        card = Card(RENDERERS[variant](vacancy), source)
+        elapsed = time.perf_counter() - started
+
+        with self._lock:
+            self.render_seconds += elapsed
+            self._cards[key] = card
+            self._cards.move_to_end(key)
+            while len(self._cards) > self.maxsize:
+                self._cards.popitem(last=False)
+                self.evictions += 1
+        return card
+
+    def feed(self, vacancy, premium, can_apply, saved):
+        """Текст и клавиатура карточки в ленте"""
+        card = self._card(vacancy, 'feed_premium' if premium else 'feed_free')
+        state = (can_apply, saved)
+        markup = card.markups.get(state)
+        if markup is None:
+            markup = card.markups[state] = feed_keyboard(vacancy['id'], can_apply, saved)
+        return card.text, markup
+
+    def saved(self, vacancy, premium):
+        """Текст и клавиатура сохраненной вакансии"""
+        card = self._card(vacancy, 'saved_premium' if premium else 'saved_free')
+        markup = card.markups.get('saved')
+        if markup is None:
+            markup = card.markups['saved'] = saved_keyboard(vacancy['id'])
+        return card.text, markup
+
+    def apply(self, vacancy):
+        """Текст подтверждения отклика без строки об оставшихся откликах"""
+        return self._card(vacancy, 'apply').text
+
+    def invalidate(self, vacancy_ids):
+        vacancy_ids = set(vacancy_ids)
+        with self._lock:
+            stale = [key for key in self._cards if key[0] in vacancy_ids]
+            for key in stale:
+                del self._cards[key]
+            self.invalidations += len(stale)
+
+    def on_vacancies(self, vacancies, created):
+        """Слушатель записи вакансий: измененные вакансии собираются заново"""
+        if not created:
+            self.invalidate(vacancy['id'] for vacancy in vacancies)
+
+    def report(self):
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups * 100 if lookups else 0.0
+        render_ms = self.render_seconds / self.misses * 1000 if self.misses else 0.0
+        return (
+            f"карточек {len(self)} из {self.maxsize}, попаданий {hit_rate:.0f}% ({self.hits} из {lookups}), "
+            f"сборка {render_ms:.2f} мс, вытеснено {self.evictions}, сброшено {self.invalidations}"
+        )
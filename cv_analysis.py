@@ -0,0 +1,247 @@
+"""Извлечение навыков, опыта и уровня из текста резюме.
+
+Словарь навыков с синонимами, маркеры уровня и слова "лет/years" собраны в
+один автомат Ахо-Корасик, поэтому резюме разбирается за один линейный проход
+независимо от размера словаря. Канонические имена навыков совпадают с тегами
+вакансий - их использует ранжирование ленты (ranking.UserProfile).
+
+Разбор - чистая функция analyze_cv; CVAnalyzer выполняет ее в пуле процессов,
+чтобы не занимать event loop бота.
+"""
+import asyncio
+import multiprocessing
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+ANALYZER_VERSION = 2
+CV_ANALYSIS_WORKERS = 2
+MAX_EXPERIENCE_YEARS = 40
+
+# Синонимы короче этого совпадают с обычными словами ("ts", "ml" как миллилитры),
+# поэтому короткие сокращения допускаются только внутри фразы с контекстом
+MIN_ALIAS_LENGTH = 3
+
+# Канонический навык -> синонимы (в нижнем регистре)
+SKILLS = {
+    'python': ['python', 'python3', 'питон'],
+    'django': ['django', 'джанго'],
+    'fastapi': ['fastapi'],
+    'flask': ['flask'],
+    'java': ['java', 'джава'],
+    'kotlin': ['kotlin'],
+    'go': ['golang', 'go developer', 'go-разработчик'],
+    'javascript': ['javascript', 'ecmascript', 'vanilla js'],
+    'typescript': ['typescript'],
+    'react': ['react', 'reactjs', 'react.js'],
+    'vue': ['vue', 'vuejs', 'vue.js'],
+    'node': ['node', 'nodejs', 'node.js'],
+    'sql': ['sql'],
+    'postgresql': ['postgresql', 'postgres', 'постгрес'],
+    'mysql': ['mysql'],
+    'mongodb': ['mongodb', 'mongo'],
+    'redis': ['redis'],
+    'kafka': ['kafka'],
+    'docker': ['docker', 'докер'],
+    'kubernetes': ['kubernetes', 'k8s', 'кубернетес'],
+    'terraform': ['terraform'],
+    'aws': ['aws', 'amazon web services'],
+    'gcp': ['gcp', 'google cloud'],
+    'linux': ['linux', 'линукс'],
+    'devops': ['devops', 'ci/cd', 'cicd'],
+    'machine-learning': ['machine learning', 'машинное обучение', 'mlops', 'ml engineer', 'ml models'],
+    'pytorch': ['pytorch'],
+    'tensorflow': ['tensorflow'],
+    'spark': ['spark', 'pyspark'],
+    'data-science': ['data science', 'data scientist'],
+    'figma': ['figma', 'фигма'],
+    'ui': ['user interface', 'ui design', 'ui designer'],
+    'ux': ['user experience', 'ux design', 'ux designer', 'ux research'],
+    'agile': ['agile', 'scrum', 'kanban'],
+    'management': ['management', 'менеджмент', 'управление командой'],
+}
+
+# Маркеры уровня: чем выше ранг, тем сильнее сигнал
+SENIORITY = {
+    'junior': ['junior', 'джуниор', 'intern', 'стажер', 'стажёр', 'trainee'],
+    'middle': ['middle', 'мидл'],
+    'senior': ['senior', 'сеньор', 'синьор', 'ведущий'],
+    'lead': ['lead', 'team lead', 'tech lead', 'тимлид', 'техлид', 'head of', 'principal', 'architect', 'архитектор'],
+}
+SENIORITY_RANKS = {'junior': 0, 'middle': 1, 'senior': 2, 'lead': 3}
+
+# Слова после числа лет опыта: "5 лет", "3+ years", "2 года"
+YEAR_WORDS = ['year', 'years', 'yrs', 'лет', 'год', 'года']
+
+# Число перед словом "лет": "5", "5+", "3.5", "10 +"
+YEARS_NUMBER = re.compile(r'(?<![\d.,])(\d{1,2}(?:[.,]\d)?)\s*\+?\s*$')
+
+class AhoCorasick:
+    """Автомат Ахо-Корасик: все вхождения словаря в текст за один проход.
+
+    Совпадения учитываются только целыми словами, чтобы "go" не находился
+    в "google", а "java" - в "javascript".
+    """
+
+    __slots__ = ('_goto', '_fail', '_output')
+
+    def __init__(self, patterns):
+        """patterns - пары (строка, значение)"""
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+
+        for pattern, value in patterns:
+            state = 0
+            for char in pattern:
+                following = self._goto[state].get(char)
+                if following is None:
+                    following = len(self._goto)
+                    self._goto[state][char] = following
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                state = following
+            self._output[state].append((len(pattern), value))
+
+        # Ссылки неудач строятся обходом в ширину
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for char, following in self._goto[state].items():
+                queue.append(following)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(char, 0)
+                self._fail[following] = fail if fail != following else 0
+                self._output[following] = self._output[following] + self._output[self._fail[following]]
+
+    def iter_matches(self, text):
+        """Пары (начало, конец, значение) для совпадений целыми словами"""
+        goto, fail, output = self._goto, self._fail, self._output
+        length = len(text)
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if not output[state]:
+                continue
+            end = position + 1
+            if end < length and is_word_char(text[end]):
+                continue
+            for size, value in output[state]:
+                start = end - size
+                if start == 0 or not is_word_char(text[start - 1]):
+                    yield start, end, value
+
+    def longest_matches(self, text):
+        """Совпадения без перекрытий: из пересекающихся берется самое длинное левое.
+
+        "team lead" дает один маркер уровня, а не "team lead" и "lead".
+        """
+        matches = sorted(self.iter_matches(text), key=lambda match: (match[0], -match[1]))
+        covered = 0
+        for start, end, value in matches:
+            if start >= covered:
+                covered = end
+                yield start, end, value
+
+def is_word_char(char):
+    return char.isalnum() or char == '_'
+
+def build_matcher():
+    """Автомат по словарям навыков, уровней и слов опыта"""
+    patterns = []
+    for skill, synonyms in SKILLS.items():
+        short = [synonym for synonym in synonyms if len(synonym) < MIN_ALIAS_LENGTH]
+        if short:
+            raise ValueError(f"Слишком короткие синонимы навыка {skill}: {short}")
+        patterns.extend((synonym, ('skill', skill)) for synonym in synonyms)
+    for level, markers in SENIORITY.items():
+        patterns.extend((marker, ('level', level)) for marker in markers)
+    patterns.extend((word, ('years', None)) for word in YEAR_WORDS)
+    return AhoCorasick(patterns)
+
+_matcher = None
+
+def get_matcher():
+    """Автомат строится один раз на процесс"""
+    global _matcher
+    if _matcher is None:
+        _matcher = build_matcher()
+    return _matcher
+
+def analyze_cv(text):
+    """Структурированный разбор резюме для users.cv_analysis.
+
+    Навыки идут по убыванию числа упоминаний; experience - максимальное
+    найденное число лет опыта (None, если не указано); seniority - самый
+    высокий найденный маркер уровня.
+    """
+    text = (text or '').lower()
+    counts = {}
+    levels = set()
+    years = []
+
+    for start, _, (kind, value) in get_matcher().longest_matches(text):
+        if kind == 'skill':
+            counts[value] = counts.get(value, 0) + 1
+        elif kind == 'level':
+            levels.add(value)
+        else:
+            # Число ищем только в нескольких символах перед словом "лет"
+            found = YEARS_NUMBER.search(text, max(0, start - 8), start)
+            if found:
+                value = float(found.group(1).replace(',', '.'))
+                if 0 < value <= MAX_EXPERIENCE_YEARS:
+                    years.append(value)
+
+    experience = max(years) if years else None
+    if experience is not None and experience.is_integer():
+        experience = int(experience)
+    return {
+        'skills': sorted(counts, key=lambda skill: (-counts[skill], skill)),
+        'experience': experience,
+        'seniority': max(levels, key=SENIORITY_RANKS.get) if levels else None,
+        'version': ANALYZER_VERSION,
+    }
+
+def analyze_many(texts):
+    """Разбор пачки резюме в одном процессе (меньше накладных расходов на передачу)"""
+    return [analyze_cv(text) for text in texts]
+
+class CVAnalyzer:
+    """Разбор резюме в пуле процессов"""
+
+    def __init__(self, workers=CV_ANALYSIS_WORKERS):
+        self.workers = workers
+        self._pool = None
+
+    @property
+    def pool(self):
+        # Пул создается при первом резюме; spawn - потому что процесс бота многопоточный
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._pool
+
+    async def run(self, func, *args):
+        """Выполняет функцию модуля в пуле процессов, не блокируя event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.pool, func, *args)
+
+    async def analyze(self, text):
+        """Разбор одного резюме"""
+        return await self.run(analyze_cv, text)
+
+    def analyze_all(self, texts, batch_size=64):
+        """Разбор множества резюме: пачки распределяются по процессам, порядок сохраняется"""
+        texts = list(texts)
+        batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+        return [analysis for batch in self.pool.map(analyze_many, batches) for analysis in batch]
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
@@ -0,0 +1,452 @@
+"""Синтетическая база с распределениями, похожими на рабочие.
+
+Заполняет таблицы users, subscriptions, vacancies, user_actions (с журналом
+applications) и payments новой базы:
+
+- пользователи приходят с ростом к концу периода, роли, уровни и форматы - в
+  пропорциях реальной аудитории, навыки из резюме - из набора роли;
+- активность пользователей и популярность вакансий и компаний распределены
+  по Парето: малая доля пользователей дает большую часть действий;
+- действия идут день за днем в порядке времени (ID растут вместе с
+  created_at), пользователь действует только после регистрации, а вакансии
+  выбираются среди опубликованных за последние VACANCY_WINDOW_DAYS дней;
+- отклики учитывают квоту: бесплатный пользователь тратит FREE_APPLICATIONS,
+  Premium откликается без списания только в оплаченный период; часть Premium
+  уже истекла, и после окончания квота снова FREE_APPLICATIONS, как после
+  expire_premium. У каждого Premium есть история платежей.
+
+Строки пишутся пачками executemany в больших транзакциях. На время загрузки
+индексы и триггеры таблиц снимаются и создаются заново в конце (полнотекстовый
+индекс перестраивается одной командой), journal - без fsync. Один и тот же
+--seed с одним --end дает одинаковую базу.
+
+    python dataset.py synthetic.db --users 200000 --vacancies 1000000 --actions 5000000
+"""
+import argparse
+import heapq
+import json
+import os
+import random
+import time
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from itertools import accumulate
+
+from cv_analysis import ANALYZER_VERSION
+from job_bot import FREE_APPLICATIONS, PREMIUM_DAYS, DatabaseManager, vacancy_fingerprint
+from ranking import ROLE_FAMILIES, base_score
+
+DATASET_BATCH_SIZE = 50000
+DATASET_DAYS = 365
+VACANCY_WINDOW_DAYS = 30  # пользователи действуют в основном со свежими вакансиями
+PREMIUM_EXPIRED_SHARE = 0.3  # доля Premium, уже истекших к концу периода
+PREMIUM_PRICE = 4.99
+USER_ID_BASE = 100000000  # ID Telegram девятизначные и больше
+
+# Таблицы, которые генератор заполняет; их индексы и триггеры снимаются на время загрузки
+LOADED_TABLES = ('users', 'subscriptions', 'vacancies', 'user_actions', 'applications', 'payments')
+
+# Роли онбординга (их выбирают пользователи) и роли вакансий с долями
+USER_ROLES = {'engineering': 45, 'ai': 12, 'product': 10, 'design': 8, 'marketing': 8, 'sales': 7,
+              'content': 5, 'support': 5}
+VACANCY_ROLES = {
+    'backend': 20, 'frontend': 12, 'fullstack': 10, 'devops': 7, 'mobile': 5, 'qa': 5,
+    'ml': 5, 'data-science': 4, 'data': 4, 'ai': 2, 'design': 5, 'ux': 2, 'product': 5, 'project': 2,
+    'marketing': 4, 'growth': 1, 'content': 2, 'sales': 3, 'business-development': 1, 'support': 2,
+    'customer-success': 1,
+}
+LEVELS = {'junior': 25, 'middle': 40, 'senior': 27, 'lead': 8}
+WORK_FORMATS = {'remote': 55, 'hybrid': 30, 'office': 13, 'contract': 2}
+ACTIONS = {'saved': 40, 'hidden': 42, 'applied': 18}
+UNSAVE_SHARE = 0.15  # часть сохранений позже убирается
+SOURCES = {'hh': 35, 'linkedin': 25, 'remote_board': 20, 'import': 15, 'manual': 5}
+CITIES = ['Berlin', 'Warsaw', 'Amsterdam', 'London', 'Lisbon', 'Tbilisi', 'Belgrade', 'Almaty', 'Dubai', 'Limassol']
+INDUSTRIES = ['fintech', 'e-commerce', 'saas', 'gamedev', 'edtech', 'healthtech', 'adtech', 'logistics']
+SALARY_BASE = {'junior': 1500, 'middle': 3000, 'senior': 5000, 'lead': 7000}
+
+# Навыки (ключи cv_analysis.SKILLS) по ролям онбординга
+FAMILY_SKILLS = {
+    'engineering': ['python', 'django', 'fastapi', 'flask', 'java', 'kotlin', 'go', 'javascript', 'typescript',
+                    'react', 'vue', 'node', 'sql', 'postgresql', 'mysql', 'mongodb', 'redis', 'kafka', 'docker',
+                    'kubernetes', 'terraform', 'aws', 'gcp', 'linux', 'devops'],
+    'ai': ['python', 'machine-learning', 'pytorch', 'tensorflow', 'spark', 'data-science', 'sql', 'aws', 'gcp',
+           'docker'],
+    'design': ['figma', 'ui', 'ux', 'agile'],
+    'product': ['agile', 'management', 'sql', 'ux', 'figma'],
+    'marketing': ['management', 'agile', 'sql'],
+    'content': ['management', 'agile'],
+    'sales': ['management', 'agile'],
+    'support': ['sql', 'management'],
+}
+# Роль вакансии -> роль онбординга, к которой она относится
+VACANCY_FAMILY = {role: family for family, roles in ROLE_FAMILIES.items() for role in roles}
+
+def weighted(table):
+    """(значения, накопленные веса) для rng.choices"""
+    return list(table), list(accumulate(table.values()))
+
+def timestamp(seconds):
+    """Время в формате CURRENT_TIMESTAMP (UTC)"""
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(seconds))
+
+def pick(rng, cumulative, lo, hi):
+    """Индекс из [lo, hi) с весами, заданными накопленными суммами"""
+    low = cumulative[lo - 1] if lo else 0.0
+    return bisect_right(cumulative, low + rng.random() * (cumulative[hi - 1] - low), lo, hi - 1)
+
+class DatasetGenerator:
+    """Заполнение пустой базы синтетическими данными"""
+
+    def __init__(self, db, seed=42, end=None, days=DATASET_DAYS, premium_ratio=0.08,
+                 batch_size=DATASET_BATCH_SIZE):
+        self.db = db
+        self.rng = random.Random(seed)
+        end = end or date.today()
+        self.end = datetime.combine(end, datetime.min.time()).timestamp()
+        self.start = self.end - days * 86400
+        self.premium_ratio = premium_ratio
+        self.batch_size = batch_size
+        self.counts = {}
+
+        # Заполняются по ходу генерации: время создания (по возрастанию) и накопленные веса выбора
+        self.user_ids = []
+        self.user_created = []
+        self.user_activity = []
+        self.user_premium = []  # None, 'active' или 'expired'
+        self.user_premium_start = []  # начало оплаченного периода Premium (inf без Premium)
+        self.user_premium_until = []  # окончание Premium (inf без Premium)
+        self.user_premium_months = []  # оплаченных месяцев
+        self.user_family = []
+        self.vacancy_ids = []
+        self.vacancy_created = []
+        self.vacancy_popularity = []
+
+    def _spread(self, count, skew):
+        """count отсортированных моментов периода; skew > 1 сдвигает их к концу"""
+        span = self.end - self.start
+        return sorted(self.start + span * self.rng.random() ** (1 / skew) for _ in range(count))
+
+    def _write(self, table, columns, rows):
+        """Вставляет строки пачками по batch_size; rows - итератор кортежей"""
+        sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+        total = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                with self.db.transaction() as conn:
+                    conn.executemany(sql, batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            with self.db.transaction() as conn:
+                conn.executemany(sql, batch)
+            total += len(batch)
+        self.counts[table] = self.counts.get(table, 0) + total
+        return total
+
+    @contextmanager
+    def bulk_load(self):
+        """Снимает индексы и триггеры загружаемых таблиц и восстанавливает их после загрузки"""
+        conn = self.db.connection
+        placeholders = ', '.join('?' * len(LOADED_TABLES))
+        objects = conn.execute(f'''
+            SELECT type, name, sql FROM sqlite_master
+            WHERE type IN ('index', 'trigger') AND sql IS NOT NULL AND tbl_name IN ({placeholders})
+        ''', LOADED_TABLES).fetchall()
+        conn.execute('PRAGMA synchronous = OFF')
+        with self.db.transaction():
+            for kind, name, _ in objects:
+                conn.execute(f'DROP {kind.upper()} {name}')
+        try:
+            yield
+        finally:
+            with self.db.transaction():
+                for _, _, sql in objects:
+                    conn.execute(sql)
+                # Триггеры полнотекстового индекса не работали во время загрузки
+                conn.execute("INSERT INTO vacancies_fts (vacancies_fts) VALUES ('rebuild')")
+            conn.execute('PRAGMA synchronous = NORMAL')
+            conn.execute('ANALYZE')
+
+    def users(self, count):
+        rng = self.rng
+        roles, role_weights = weighted(USER_ROLES)
+        levels, level_weights = weighted(LEVELS)
+        formats, format_weights = weighted(WORK_FORMATS)
+        next_id = USER_ID_BASE
+
+        def rows():
+            nonlocal next_id
+            for created in self._spread(count, skew=2.0):
+                next_id += rng.randint(1, 50)
+                role = rng.choices(roles, cum_weights=role_weights)[0]
+                level = rng.choices(levels, cum_weights=level_weights)[0]
+                work_format = rng.choices(formats, cum_weights=format_weights)[0]
+                skills = sorted(rng.sample(FAMILY_SKILLS[role], min(len(FAMILY_SKILLS[role]), rng.randint(2, 8))))
+                salary_min = SALARY_BASE[level] + rng.randrange(0, 2000, 250) if rng.random() < 0.7 else None
+                experience = {'junior': 1, 'middle': 3, 'senior': 6, 'lead': 9}[level] + rng.randint(0, 3)
+                cv_analysis = {'skills': skills, 'experience': experience, 'seniority': level,
+                               'version': ANALYZER_VERSION}
+                blocked_at = timestamp(created + rng.random() * (self.end - created)) if rng.random() < 0.03 else None
+
+                self.user_ids.append(next_id)
+                self.user_created.append(created)
+                self.user_activity.append(rng.paretovariate(1.16))
+                self.user_family.append(role)
+                status = (None if rng.random() >= self.premium_ratio
+                          else 'expired' if rng.random() < PREMIUM_EXPIRED_SHARE else 'active')
+                self.user_premium.append(status)
+                self._premium_period(status, created)
+                yield (
+                    next_id, f"user{next_id}", rng.choice(['Alex', 'Maria', 'Ivan', 'Anna', 'Dmitry', 'Olga', 'Sam']),
+                    None, role, level, work_format,
+                    'Remote' if work_format == 'remote' else rng.choice(CITIES),
+                    salary_min, salary_min and salary_min + rng.randrange(1000, 4000, 500), 'USD' if salary_min else None,
+                    f"{level.title()} {role} specialist, {experience} years: {', '.join(skills)}",
+                    json.dumps(cv_analysis), rng.random() < 0.9, timestamp(created), timestamp(created),
+                    rng.random() < 0.95, blocked_at,
+                )
+
+        return self._write('users', (
+            'user_id', 'username', 'first_name', 'last_name', 'role', 'level', 'work_format', 'location',
+            'salary_min', 'salary_max', 'currency', 'cv_text', 'cv_analysis', 'search_active', 'created_at',
+            'last_activity', 'consent_given', 'blocked_at',
+        ), rows())
+
+    def _premium_period(self, status, created):
+        """Срок Premium решается до действий: отклики вне него списывают бесплатную квоту"""
+        rng = self.rng
+        if status is None:
+            start = until = float('inf')
+            months = 0
+        else:
+            # Premium оплачивается помесячно; истекший закончился до конца периода
+            if status == 'active':
+                until = self.end + rng.uniform(1, PREMIUM_DAYS) * 86400
+            else:
+                until = rng.uniform(created, self.end)
+            months = min(1 + int(rng.expovariate(0.5)), max(1, int((until - created) // (PREMIUM_DAYS * 86400))))
+            start = max(created, until - months * PREMIUM_DAYS * 86400)
+        self.user_premium_start.append(start)
+        self.user_premium_until.append(until)
+        self.user_premium_months.append(months)
+
+    def vacancies(self, count):
+        rng = self.rng
+        roles, role_weights = weighted(VACANCY_ROLES)
+        levels, level_weights = weighted(LEVELS)
+        formats, format_weights = weighted(WORK_FORMATS)
+        sources, source_weights = weighted(SOURCES)
+        companies = max(1, count // 20)
+        first_id = (self.db.connection.execute('SELECT MAX(id) FROM vacancies').fetchone()[0] or 0) + 1
+
+        def rows():
+            for number, created in enumerate(self._spread(count, skew=1.5)):
+                vacancy_id = first_id + number
+                role = rng.choices(roles, cum_weights=role_weights)[0]
+                level = rng.choices(levels, cum_weights=level_weights)[0]
+                work_format = rng.choices(formats, cum_weights=format_weights)[0]
+                # Популярность компаний по Парето: крупные публикуют много вакансий
+                company = min(companies, int(rng.paretovariate(1.1))) - 1
+                skills = FAMILY_SKILLS[VACANCY_FAMILY.get(role, 'engineering')]
+                tags = rng.sample(skills, min(len(skills), rng.randint(2, 6)))
+                salary_min = SALARY_BASE[level] + rng.randrange(0, 2500, 250) if rng.random() < 0.65 else None
+                vacancy = {
+                    'title': f"{level.title()} {role.replace('-', ' ').title()} Engineer"
+                             if VACANCY_FAMILY.get(role) in ('engineering', 'ai')
+                             else f"{level.title()} {role.replace('-', ' ').title()} Specialist",
+                    'company': f"Company {company}",
+                    'apply_url': f"https://jobs.example.com/{company}/{vacancy_id}" if rng.random() < 0.85 else '',
+                    'contacts': '' if rng.random() < 0.85 else f"hr{company}@example.com",
+                    'salary_min': salary_min,
+                    'salary_max': salary_min and salary_min + rng.randrange(1000, 3000, 500),
+                    'tags': ','.join(tags),
+                    'description_short': f"{role.replace('-', ' ').title()} team, {rng.choice(INDUSTRIES)} product. "
+                                         f"Stack: {', '.join(tags)}.",
+                    'requirements': f"{ {'junior': 1, 'middle': 3, 'senior': 5, 'lead': 7}[level] }+ years, "
+                                    f"{', '.join(tags[:3])}",
+                }
+                if not vacancy['apply_url'] and not vacancy['contacts']:
+                    vacancy['contacts'] = f"hr{company}@example.com"
+                if not vacancy['apply_url']:
+                    # Отпечаток учитывает ссылку; без нее вакансию различает номер в названии
+                    vacancy['title'] += f" #{vacancy_id}"
+
+                self.vacancy_ids.append(vacancy_id)
+                self.vacancy_created.append(created)
+                self.vacancy_popularity.append(rng.paretovariate(1.5))
+                yield (
+                    vacancy_id, vacancy['title'], vacancy['company'], vacancy['salary_min'], vacancy['salary_max'],
+                    ('EUR' if rng.random() < 0.15 else 'USD') if salary_min else None,
+                    'Remote' if work_format == 'remote' else rng.choice(CITIES), work_format,
+                    vacancy['description_short'], vacancy['requirements'], vacancy['apply_url'],
+                    vacancy['contacts'], vacancy['tags'], rng.choice(INDUSTRIES), role, level,
+                    rng.choices(sources, cum_weights=source_weights)[0], base_score(vacancy),
+                    vacancy_fingerprint(vacancy), timestamp(created),
+                )
+
+        return self._write('vacancies', (
+            'id', 'title', 'company', 'salary_min', 'salary_max', 'currency', 'location', 'work_format',
+            'description_short', 'requirements', 'apply_url', 'contacts', 'tags', 'industry', 'role', 'level',
+            'source', 'relevance_score', 'fingerprint', 'created_at',
+        ), rows())
+
+    def actions(self, count):
+        """Действия пользователей день за днем; возвращает число действий"""
+        rng = self.rng
+        actions, action_weights = weighted(ACTIONS)
+        user_weights = list(accumulate(self.user_activity))
+        vacancy_weights = list(accumulate(self.vacancy_popularity))
+        # Списанные отклики до начала Premium и после его окончания: при окончании квота восстанавливается
+        charged_before = [0] * len(self.user_ids)
+        charged_after = [0] * len(self.user_ids)
+        applied = set()
+        applications = []
+        last_activity = {}
+        unsaves = []  # отложенные отмены сохранения: куча (время, пользователь, вакансия)
+
+        # Действий в день - пропорционально числу уже зарегистрированных пользователей
+        days = int((self.end - self.start) // 86400)
+        day_users = [bisect_left(self.user_created, self.start + day * 86400) for day in range(days)]
+        per_day = sum(day_users) or 1
+
+        def rows():
+            for day, users in enumerate(day_users):
+                day_start = self.start + day * 86400
+                vacancies = bisect_left(self.vacancy_created, day_start)
+                if not users or not vacancies:
+                    continue
+                window = bisect_left(self.vacancy_created, day_start - VACANCY_WINDOW_DAYS * 86400)
+                if window >= vacancies:
+                    window = 0
+
+                day_end = day_start + 86400
+                day_rows = []
+                for _ in range(round(count * users / per_day)):
+                    user = pick(rng, user_weights, 0, users)
+                    vacancy = pick(rng, vacancy_weights, window, vacancies)
+                    moment = day_start + rng.random() * 86400
+                    action = rng.choices(actions, cum_weights=action_weights)[0]
+                    user_id, vacancy_id = self.user_ids[user], self.vacancy_ids[vacancy]
+
+                    if action == 'applied':
+                        premium = self.user_premium_start[user] <= moment < self.user_premium_until[user]
+                        charged = charged_before if moment < self.user_premium_start[user] else charged_after
+                        if (user_id, vacancy_id) in applied or (not premium and charged[user] >= FREE_APPLICATIONS):
+                            action = 'saved'
+                        else:
+                            applied.add((user_id, vacancy_id))
+                            charged[user] += not premium
+                            applications.append((user_id, vacancy_id, not premium, timestamp(moment)))
+                    day_rows.append((moment, user_id, vacancy_id, action))
+                    if action == 'saved' and rng.random() < UNSAVE_SHARE:
+                        later = min(moment + rng.random() * 7 * 86400, self.end - 1)
+                        heapq.heappush(unsaves, (later, user_id, vacancy_id))
+                    last_activity[user] = max(last_activity.get(user, 0), moment)
+
+                # Отмены, время которых пришлось на этот день, включая только что отложенные
+                while unsaves and unsaves[0][0] < day_end:
+                    moment, user_id, vacancy_id = heapq.heappop(unsaves)
+                    day_rows.append((moment, user_id, vacancy_id, 'unsaved'))
+
+                day_rows.sort()
+                for moment, user_id, vacancy_id, action in day_rows:
+                    yield user_id, vacancy_id, action, timestamp(moment)
+
+                if len(applications) >= self.batch_size:
+                    self._write('applications', ('user_id', 'vacancy_id', 'charged', 'created_at'), applications)
+                    applications.clear()
+
+        total = self._write('user_actions', ('user_id', 'vacancy_id', 'action', 'created_at'), rows())
+        self._write('applications', ('user_id', 'vacancy_id', 'charged', 'created_at'), applications)
+
+        with self.db.transaction() as conn:
+            conn.executemany(
+                'UPDATE users SET last_activity = ? WHERE user_id = ?',
+                ((timestamp(moment), self.user_ids[user]) for user, moment in last_activity.items())
+            )
+        self._charged = charged_before, charged_after
+        return total
+
+    def subscriptions(self):
+        """Подписки всех пользователей и платежи Premium"""
+        rng = self.rng
+        charged_before, charged_after = getattr(self, '_charged', None) or ([0] * len(self.user_ids),) * 2
+        payments = []
+
+        def rows():
+            for user, user_id in enumerate(self.user_ids):
+                status = self.user_premium[user]
+                created = self.user_created[user]
+                if status is None:
+                    yield (user_id, False, None, FREE_APPLICATIONS - charged_before[user], timestamp(created),
+                           timestamp(created))
+                    continue
+
+                until, months = self.user_premium_until[user], self.user_premium_months[user]
+                for month in range(months):
+                    paid = until - (month + 1) * PREMIUM_DAYS * 86400
+                    if paid < created:
+                        paid = created
+                    if rng.random() < 0.05:
+                        payments.append((user_id, f"pay_{rng.getrandbits(64):016x}", PREMIUM_PRICE, 'USD',
+                                         'failed', timestamp(paid - 3600)))
+                    payments.append((user_id, f"pay_{rng.getrandbits(64):016x}", PREMIUM_PRICE, 'USD',
+                                     'succeeded', timestamp(paid)))
+                free = FREE_APPLICATIONS - (charged_before if status == 'active' else charged_after)[user]
+                yield (user_id, status == 'active', datetime.fromtimestamp(until).isoformat(timespec='seconds'),
+                       free, timestamp(created), timestamp(max(created, until - PREMIUM_DAYS * 86400)))
+
+        self._write('subscriptions', ('user_id', 'is_premium', 'premium_until', 'free_applications', 'created_at',
+                                      'updated_at'), rows())
+        payments.sort(key=lambda payment: payment[5])
+        self._write('payments', ('user_id', 'payment_id', 'amount', 'currency', 'status', 'created_at'), payments)
+
+def generate(path, users, vacancies, actions, seed=42, end=None, days=DATASET_DAYS, premium_ratio=0.08,
+             batch_size=DATASET_BATCH_SIZE, report=print):
+    """Создает базу path и заполняет ее; возвращает {таблица: строк}"""
+    db = DatabaseManager(path)
+    try:
+        if db.connection.execute('SELECT COUNT(*) FROM users').fetchone()[0]:
+            raise SystemExit(f"В базе {path} уже есть пользователи: генератор заполняет только новую базу")
+        # Демонстрационные вакансии получают время создания базы - с ними результат не повторялся бы
+        with db.transaction() as conn:
+            conn.execute('DELETE FROM vacancies')
+        generator = DatasetGenerator(db, seed=seed, end=end, days=days, premium_ratio=premium_ratio,
+                                     batch_size=batch_size)
+        started = time.perf_counter()
+        with generator.bulk_load():
+            for name, step, size in (('users', generator.users, users), ('vacancies', generator.vacancies, vacancies),
+                                     ('user_actions', generator.actions, actions)):
+                step_started = time.perf_counter()
+                rows = step(size)
+                elapsed = time.perf_counter() - step_started
+                report(f"{name}: {rows} строк за {elapsed:.1f} с ({rows / elapsed if elapsed else 0:.0f} строк/с)")
+            generator.subscriptions()
+            report("Индексы, триггеры и полнотекстовый индекс восстанавливаются...")
+        report(f"Готово за {time.perf_counter() - started:.1f} с, размер базы "
+               f"{os.path.getsize(path) / 1024 / 1024:.0f} МБ")
+        return generator.counts
+    finally:
+        db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Синтетическая база Smart Job Bot")
+    parser.add_argument('database', help="путь к новой базе SQLite")
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--vacancies', type=int, default=100000)
+    parser.add_argument('--actions', type=int, default=500000, help="примерное число действий пользователей")
+    parser.add_argument('--premium-ratio', type=float, default=0.08, help="доля пользователей с Premium")
+    parser.add_argument('--days', type=int, default=DATASET_DAYS, help="длина периода данных в днях")
+    parser.add_argument('--end', type=date.fromisoformat, help="последний день периода (по умолчанию сегодня)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--batch-size', type=int, default=DATASET_BATCH_SIZE)
+    args = parser.parse_args()
+    counts = generate(args.database, args.users, args.vacancies, args.actions, seed=args.seed, end=args.end,
+                      days=args.days, premium_ratio=args.premium_ratio, batch_size=args.batch_size)
+    print(', '.join(f"{table}: {rows}" for table, rows in counts.items()))
+
+if __name__ == '__main__':
+    main()
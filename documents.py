@@ -0,0 +1,243 @@
+"""Загрузка и разбор файлов резюме (PDF, DOCX, DOC).
+
+Файл скачивается потоково с ограничением размера, текст извлекается и
+анализируется в пуле процессов CVAnalyzer, результат кэшируется в таблице
+cv_files по file_unique_id: повторная загрузка того же файла ничего не стоит.
+
+Источник файлов подменяемый: TelegramDocumentSource качает через Bot API,
+FixtureDocumentSource читает из локальной папки (fixtures/documents) и
+заменяет Telegram при проверках:
+
+    python documents.py fixtures/documents
+"""
+import asyncio
+import io
+import os
+import re
+import sys
+import zipfile
+import zlib
+from pathlib import Path
+from xml.etree import ElementTree
+
+import httpx
+
+from cv_analysis import analyze_cv
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # pypdf необязателен, есть упрощенный разбор
+    PdfReader = None
+
+CV_EXTENSIONS = ('.pdf', '.doc', '.docx')
+MAX_CV_FILE_SIZE = 5 * 1024 * 1024  # байт
+MAX_CV_TEXT = 100000  # символов текста резюме в базе
+DOCUMENT_WORKERS = 2  # одновременных скачиваний и разборов
+DOCUMENT_QUEUE_LIMIT = 50  # резюме в обработке, сверх которых новые отклоняются
+DOWNLOAD_CHUNK = 64 * 1024
+FIXTURES_DIR = Path(__file__).parent / 'fixtures' / 'documents'
+
+class DocumentError(Exception):
+    """Файл резюме не удалось обработать; текст - для пользователя"""
+
+class DocumentTooLarge(DocumentError):
+    pass
+
+class DocumentQueueFull(DocumentError):
+    pass
+
+class TelegramDocumentSource:
+    """Скачивание файлов через Bot API"""
+
+    def __init__(self, bot):
+        self.bot = bot
+
+    async def fetch(self, file_id, max_size):
+        buffer = io.BytesIO()
+        await self.download(file_id, buffer, max_size)
+        return buffer.getvalue()
+
+    async def download(self, file_id, out, max_size):
+        """Потоково пишет файл в out, прерываясь на превышении max_size"""
+        telegram_file = await self.bot.get_file(file_id)
+        if telegram_file.file_size and telegram_file.file_size > max_size:
+            raise DocumentTooLarge(f"Файл больше {max_size / (1024 * 1024):g} МБ")
+
+        if not telegram_file.file_path.startswith(('http://', 'https://')):
+            # Локальный Bot API сервер отдает путь к файлу на диске
+            out.write(read_capped(Path(telegram_file.file_path), max_size))
+            return
+
+        written = 0
+        async with httpx.AsyncClient(timeout=30) as client:
+            async with client.stream('GET', telegram_file.file_path) as response:
+                response.raise_for_status()
+                async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK):
+                    written += len(chunk)
+                    if written > max_size:
+                        raise DocumentTooLarge(f"Файл больше {max_size / (1024 * 1024):g} МБ")
+                    out.write(chunk)
+
+class FixtureDocumentSource:
+    """Файлы из локальной папки: file_id - имя файла"""
+
+    def __init__(self, directory=FIXTURES_DIR):
+        self.directory = Path(directory)
+
+    async def fetch(self, file_id, max_size):
+        return read_capped(self.directory / file_id, max_size)
+
+def read_capped(path, max_size):
+    if path.stat().st_size > max_size:
+        raise DocumentTooLarge(f"Файл больше {max_size / (1024 * 1024):g} МБ")
+    return path.read_bytes()
+
+class DocumentProcessor:
+    """Очередь разбора резюме с ограниченным числом одновременных задач"""
+
+    def __init__(self, db, analyzer, max_size=MAX_CV_FILE_SIZE,
+                 workers=DOCUMENT_WORKERS, queue_limit=DOCUMENT_QUEUE_LIMIT):
+        self.db = db
+        self.analyzer = analyzer
+        self.max_size = max_size
+        self.queue_limit = queue_limit
+        self._slots = asyncio.Semaphore(workers)
+        self.pending = 0
+
+    async def process(self, source, file_id, file_unique_id, file_name):
+        """Текст и разбор резюме: {'cv_text', 'cv_analysis', 'cached'}"""
+        cached = await self.db.get_cv_file(file_unique_id)
+        if cached:
+            return {'cv_text': cached['cv_text'], 'cv_analysis': cached['cv_analysis'], 'cached': True}
+
+        if self.pending >= self.queue_limit:
+            raise DocumentQueueFull("Слишком много резюме в обработке, попробуйте через минуту")
+
+        self.pending += 1
+        try:
+            async with self._slots:
+                data = await source.fetch(file_id, self.max_size)
+                cv_text, cv_analysis = await self.analyzer.run(parse_document, data, file_name)
+        finally:
+            self.pending -= 1
+
+        if not cv_text.strip():
+            raise DocumentError("Не удалось извлечь текст из файла. Отправьте резюме текстом")
+
+        await self.db.save_cv_file(file_unique_id, file_name, cv_text, cv_analysis)
+        return {'cv_text': cv_text, 'cv_analysis': cv_analysis, 'cached': False}
+
+def parse_document(data, file_name):
+    """Извлекает текст и разбирает резюме; выполняется в процессе пула"""
+    text = extract_text(data, file_name)[:MAX_CV_TEXT]
+    return text, analyze_cv(text)
+
+def extract_text(data, file_name):
+    """Текст документа по расширению; нераспознанный файл дает пустую строку"""
+    extension = os.path.splitext(file_name or '')[1].lower()
+    try:
+        if extension == '.docx':
+            text = extract_docx(data)
+        elif extension == '.pdf':
+            text = extract_pdf(data)
+        elif extension == '.doc':
+            text = extract_doc(data)
+        else:
+            text = data.decode('utf-8', errors='ignore')
+    except Exception:
+        # Файл приходит от пользователя: битый документ - пустой текст, а не падение процесса пула
+        return ''
+    return normalize_text(text)
+
+def normalize_text(text):
+    lines = (' '.join(line.split()) for line in text.splitlines())
+    return '\n'.join(line for line in lines if line)
+
+WORD_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+def extract_docx(data):
+    """DOCX: текст абзацев из word/document.xml"""
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        root = ElementTree.fromstring(archive.read('word/document.xml'))
+
+    paragraphs = []
+    for paragraph in root.iter(f'{WORD_NS}p'):
+        parts = []
+        for node in paragraph.iter():
+            if node.tag == f'{WORD_NS}t' and node.text:
+                parts.append(node.text)
+            elif node.tag in (f'{WORD_NS}tab', f'{WORD_NS}br'):
+                parts.append(' ')
+        paragraphs.append(''.join(parts))
+    return '\n'.join(paragraphs)
+
+PDF_STREAM = re.compile(rb'<<(.*?)>>\s*stream\r?\n(.*?)\r?\nendstream', re.S)
+PDF_TEXT_TOKEN = re.compile(rb'\((?:\\.|[^\\)])*\)|\[|\]|T\*|Td|TD|Tj|TJ|\'|"|ET')
+PDF_ESCAPES = {b'n': b'\n', b'r': b'\r', b't': b'\t', b'b': b'\b', b'f': b'\f'}
+
+def extract_pdf(data):
+    """PDF: через pypdf, если установлен, иначе упрощенный разбор потоков"""
+    if PdfReader is not None:
+        reader = PdfReader(io.BytesIO(data))
+        return '\n'.join(page.extract_text() or '' for page in reader.pages)
+
+    # Без pypdf: строки операторов Tj/TJ из несжатых и FlateDecode потоков.
+    # Шрифты со своими кодировками так не читаются - это упрощенный запасной вариант
+    lines = []
+    for header, stream in PDF_STREAM.findall(data):
+        if b'/FlateDecode' in header:
+            try:
+                stream = zlib.decompress(stream)
+            except zlib.error:
+                continue
+        line = []
+        for token in PDF_TEXT_TOKEN.findall(stream):
+            if token.startswith(b'('):
+                line.append(unescape_pdf_string(token[1:-1]))
+            elif token in (b'T*', b'Td', b'TD', b"'", b'"', b'ET') and line:
+                lines.append(''.join(line))
+                line = []
+        if line:
+            lines.append(''.join(line))
+    return '\n'.join(lines)
+
+def unescape_pdf_string(raw):
+    result = bytearray()
+    position = 0
+    while position < len(raw):
+        byte = raw[position:position + 1]
+        if byte == b'\\' and position + 1 < len(raw):
+            following = raw[position + 1:position + 2]
+            octal = re.match(rb'[0-7]{1,3}', raw[position + 1:position + 4])
+            if octal:
+                result.append(int(octal.group(), 8) & 0xFF)
+                position += 1 + len(octal.group())
+                continue
+            result += PDF_ESCAPES.get(following, following)
+            position += 2
+            continue
+        result += byte
+        position += 1
+    if result.startswith(b'\xfe\xff'):
+        return result[2:].decode('utf-16-be', errors='ignore')
+    return result.decode('latin-1')
+
+DOC_UTF16_RUN = re.compile(rb'(?:[\x20-\x7e\n\r\t]\x00|[\x00-\xff][\x04]){4,}')
+DOC_ASCII_RUN = re.compile(rb'[\x20-\x7e\n\r\t]{6,}')
+
+def extract_doc(data):
+    """DOC (Word 97-2003): текстовые фрагменты UTF-16 и ASCII из бинарного файла"""
+    runs = [run.decode('utf-16-le', errors='ignore') for run in DOC_UTF16_RUN.findall(data)]
+    if not runs:
+        runs = [run.decode('ascii') for run in DOC_ASCII_RUN.findall(data)]
+    return '\n'.join(runs)
+
+def main(directory):
+    """Разбирает все резюме из папки так же, как бот разбирает загрузки"""
+    for path in sorted(Path(directory).iterdir()):
+        if path.suffix.lower() in CV_EXTENSIONS:
+            text, analysis = parse_document(path.read_bytes(), path.name)
+            print(f"{path.name}: {len(text)} символов, {analysis}")
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else FIXTURES_DIR)
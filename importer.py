@@ -0,0 +1,135 @@
+"""Массовый импорт вакансий из CSV и JSONL.
+
+Файл читается построчно, каждая строка проверяется и нормализуется, затем
+строки пачками по IMPORT_BATCH_SIZE уходят в DatabaseManager.upsert_vacancies
+(executemany в одной транзакции, дедупликация по отпечатку вакансии). В памяти
+держится только текущая пачка, поэтому файл на 100 тыс. строк не требует
+больше памяти, чем на 100 строк. Индексация и уведомления срабатывают один раз
+на пачку.
+
+    python job_bot.py --import-vacancies vacancies.csv
+"""
+import csv
+import json
+import os
+from collections import Counter
+
+IMPORT_BATCH_SIZE = 1000
+IMPORT_MAX_FILE_SIZE = 20 * 1024 * 1024  # предел скачивания файлов Bot API
+IMPORT_EXTENSIONS = ('.csv', '.jsonl', '.ndjson')
+IMPORT_ERROR_SAMPLES = 5  # сколько ошибок показать в итоге
+
+WORK_FORMATS = ('remote', 'hybrid', 'office', 'contract')
+TEXT_LIMITS = {
+    'title': 200, 'company': 200, 'location': 200, 'industry': 100, 'role': 50, 'level': 50,
+    'currency': 10, 'work_format': 20, 'apply_url': 500, 'contacts': 500, 'tags': 500,
+    'description_short': 2000, 'requirements': 2000,
+}
+
+class ImportSummary:
+    """Итог импорта: счетчики и примеры ошибок"""
+
+    def __init__(self):
+        self.counts = Counter(inserted=0, updated=0, skipped=0, failed=0)
+        self.errors = []
+
+    def fail(self, line, reason):
+        self.counts['failed'] += 1
+        if len(self.errors) < IMPORT_ERROR_SAMPLES:
+            self.errors.append(f"строка {line}: {reason}")
+
+    def __str__(self):
+        lines = [
+            f"➕ Добавлено: {self.counts['inserted']}",
+            f"♻️ Обновлено: {self.counts['updated']}",
+            f"⏭ Пропущено (без изменений и повторы): {self.counts['skipped']}",
+            f"❌ С ошибками: {self.counts['failed']}",
+        ]
+        if self.errors:
+            lines.append('')
+            lines.extend(self.errors)
+        return '\n'.join(lines)
+
+def iter_rows(path):
+    """Пары (номер строки, dict) из CSV или JSONL; битая строка JSON дает (номер, ValueError)"""
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, newline='', encoding='utf-8-sig') as source:
+        if extension == '.csv':
+            reader = csv.DictReader(source)
+            for row in reader:
+                yield reader.line_num, row
+            return
+
+        for line_number, line in enumerate(source, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_number, ValueError(f"некорректный JSON ({e.msg})")
+                continue
+            yield line_number, row if isinstance(row, dict) else ValueError("ожидается объект JSON")
+
+def parse_salary(value):
+    if value in (None, ''):
+        return None
+    salary = int(float(str(value).replace(' ', '').replace(',', '')))
+    if salary < 0:
+        raise ValueError("отрицательная зарплата")
+    return salary
+
+def normalize_row(row, source='import'):
+    """Проверенная и нормализованная вакансия; ValueError с причиной для плохой строки"""
+    row = {str(key).strip().lower(): value for key, value in row.items() if key is not None}
+    vacancy = {}
+    for field, limit in TEXT_LIMITS.items():
+        value = row.get(field)
+        if isinstance(value, list) and field == 'tags':
+            value = ','.join(map(str, value))
+        value = ' '.join(str(value).split()) if value not in (None, '') else ''
+        vacancy[field] = value[:limit]
+
+    if not vacancy['title']:
+        raise ValueError("нет названия")
+    if not (vacancy['company'] or vacancy['apply_url'] or vacancy['contacts']):
+        raise ValueError("нет компании, ссылки или контактов")
+
+    try:
+        vacancy['salary_min'] = parse_salary(row.get('salary_min'))
+        vacancy['salary_max'] = parse_salary(row.get('salary_max'))
+    except ValueError as e:
+        raise ValueError(f"некорректная зарплата ({e})")
+    if vacancy['salary_min'] and vacancy['salary_max'] and vacancy['salary_min'] > vacancy['salary_max']:
+        vacancy['salary_min'], vacancy['salary_max'] = vacancy['salary_max'], vacancy['salary_min']
+
+    vacancy['work_format'] = vacancy['work_format'].lower() if row.get('work_format') else 'remote'
+    if vacancy['work_format'] not in WORK_FORMATS:
+        raise ValueError(f"неизвестный формат работы '{vacancy['work_format']}'")
+    vacancy['role'] = vacancy['role'].lower()
+    vacancy['level'] = vacancy['level'].lower()
+    vacancy['tags'] = ','.join(tag.strip().lower() for tag in vacancy['tags'].split(',') if tag.strip())
+    vacancy['currency'] = vacancy['currency'].upper() or 'USD'
+    vacancy['location'] = vacancy['location'] or 'Remote'
+    vacancy['source'] = str(row.get('source') or source)[:50]
+    return vacancy
+
+def import_vacancies(db, path, batch_size=IMPORT_BATCH_SIZE, source='import'):
+    """Импортирует файл в базу (синхронный DatabaseManager). Возвращает ImportSummary"""
+    summary = ImportSummary()
+    batch = []
+    for line, row in iter_rows(path):
+        if isinstance(row, Exception):
+            summary.fail(line, row)
+            continue
+        try:
+            batch.append(normalize_row(row, source))
+        except ValueError as e:
+            summary.fail(line, e)
+            continue
+        if len(batch) >= batch_size:
+            summary.counts.update(db.upsert_vacancies(batch))
+            batch = []
+
+    if batch:
+        summary.counts.update(db.upsert_vacancies(batch))
+    return summary
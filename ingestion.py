@@ -0,0 +1,421 @@
+"""Регулярная загрузка вакансий из внешних источников.
+
+Источник - адаптер (HttpFeedSource или FileFeedSource) с одним или
+несколькими адресами. Для каждого адреса в таблице ingestion_sources хранится
+состояние: ETag / Last-Modified (или отметка файла) для условного запроса и
+high-water mark - наибольшее значение поля обновления среди загруженных
+элементов. Неизменившийся адрес отвечает 304 и не разбирается, уже
+загруженные элементы отбрасываются до записи в базу. Запросы к одному
+источнику ограничены его concurrency, одновременно работающие источники -
+INGEST_CONCURRENCY.
+
+Поля элемента переводятся в схему вакансии по карте fields (пути через точку),
+дальше - та же проверка, что при импорте файлов (importer.normalize_row), и
+пакетная запись upsert_vacancies.
+
+Источники описываются в JSON-файле (INGESTION_SOURCES_FILE), пример -
+fixtures/feeds/sources.json. Проверка без сети: локальный HTTP-сервер отдает
+fixtures/feeds, источники загружаются во временную базу дважды - второй проход
+должен получить 304 и ничего не записать:
+
+    python ingestion.py fixtures/feeds/sources.json
+"""
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import httpx
+
+from importer import IMPORT_BATCH_SIZE, iter_rows, normalize_row
+
+logger = logging.getLogger(__name__)
+
+INGEST_INTERVAL = 900  # секунд между загрузками источника по умолчанию
+INGEST_FIRST_DELAY = 30  # секунд после запуска бота до первой загрузки
+INGEST_CONCURRENCY = 2  # источников, загружаемых одновременно
+SOURCE_CONCURRENCY = 2  # одновременных запросов к одному источнику
+HTTP_TIMEOUT = 20
+USER_AGENT = 'SmartJobBot/1.0 (+vacancy ingestion)'
+FEEDS_DIR = Path(__file__).parent / 'fixtures' / 'feeds'
+
+class FeedError(Exception):
+    """Адрес источника не удалось загрузить или разобрать"""
+
+def resolve(item, path):
+    """Значение по пути через точку ('salary.from'); None, если его нет"""
+    value = item
+    for key in path.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+def marker_key(value):
+    """Ключ сравнения отметок обновления: числа - как числа, остальное - как строки (ISO 8601)"""
+    try:
+        return 0, float(value), ''
+    except (TypeError, ValueError):
+        return 1, 0.0, str(value)
+
+class FeedSource:
+    """Базовый адаптер источника: адреса, карта полей, лимиты"""
+
+    def __init__(self, name, locations, fields=None, updated_field='updated_at',
+                 interval=INGEST_INTERVAL, concurrency=SOURCE_CONCURRENCY):
+        self.name = name
+        self.locations = list(locations)
+        self.fields = fields or {}
+        self.updated_field = updated_field
+        self.interval = interval
+        self.concurrency = concurrency
+        self._slots = None
+
+    async def fetch(self, location, state):
+        """Элементы адреса и новые валидаторы; (None, state) - адрес не изменился"""
+        raise NotImplementedError
+
+    async def fetch_limited(self, location, state):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+        async with self._slots:
+            return await self.fetch(location, state)
+
+    async def close(self):
+        pass
+
+    def marker(self, item):
+        return resolve(item, self.updated_field)
+
+    def map_item(self, item):
+        """Строка для normalize_row: поля из карты fields, остальные - под своими именами"""
+        row = {key: value for key, value in item.items() if not isinstance(value, dict)}
+        for field, path in self.fields.items():
+            row[field] = resolve(item, path)
+        return row
+
+class HttpFeedSource(FeedSource):
+    """JSON по HTTP: список элементов или объект со списком в items_key.
+
+    Повторный запрос условный (If-None-Match / If-Modified-Since); если задан
+    since_param, high-water mark передается серверу и в ответе остаются только
+    новые элементы. transport подменяет сеть (httpx.MockTransport) в проверках.
+    """
+
+    def __init__(self, name, urls, items_key='items', since_param=None, transport=None, **kwargs):
+        super().__init__(name, urls, **kwargs)
+        self.items_key = items_key
+        self.since_param = since_param
+        self.transport = transport
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=HTTP_TIMEOUT, transport=self.transport, follow_redirects=True,
+                headers={'User-Agent': USER_AGENT},
+            )
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def fetch(self, location, state):
+        headers = {}
+        if state.get('etag'):
+            headers['If-None-Match'] = state['etag']
+        if state.get('last_modified'):
+            headers['If-Modified-Since'] = state['last_modified']
+        params = {}
+        if self.since_param and state.get('high_water') is not None:
+            params[self.since_param] = state['high_water']
+
+        try:
+            response = await self.client.get(location, headers=headers, params=params)
+            if response.status_code == 304:
+                return None, state
+            response.raise_for_status()
+            payload = response.json()
+        except httpx.HTTPStatusError as e:
+            raise FeedError(f"{location}: HTTP {e.response.status_code}") from e
+        except httpx.HTTPError as e:
+            raise FeedError(f"{location}: {type(e).__name__} {e}") from e
+        except ValueError as e:
+            raise FeedError(f"{location}: некорректный JSON ({e})") from e
+
+        items = payload.get(self.items_key) if isinstance(payload, dict) else payload
+        if not isinstance(items, list):
+            raise FeedError(f"{location}: нет списка элементов '{self.items_key}'")
+
+        validators = {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+        }
+        return items, {key: value for key, value in validators.items() if value}
+
+class FileFeedSource(FeedSource):
+    """Локальные файлы JSON, JSONL или CSV; изменение определяется по времени и размеру файла"""
+
+    async def fetch(self, location, state):
+        try:
+            stat = os.stat(location)
+        except OSError as e:
+            raise FeedError(f"{location}: {e.strerror}") from e
+        version = f"{stat.st_mtime_ns}-{stat.st_size}"
+        if state.get('version') == version:
+            return None, state
+
+        try:
+            items = await asyncio.to_thread(self.read, location)
+        except (OSError, ValueError) as e:
+            raise FeedError(f"{location}: {e}") from e
+        return items, {'version': version}
+
+    @staticmethod
+    def read(location):
+        if location.lower().endswith('.json'):
+            with open(location, encoding='utf-8-sig') as source:
+                payload = json.load(source)
+            return payload.get('items', []) if isinstance(payload, dict) else payload
+        return [row for _, row in iter_rows(location) if isinstance(row, dict)]
+
+SOURCE_TYPES = {'http': HttpFeedSource, 'file': FileFeedSource}
+
+def load_sources(path, base_url=None):
+    """Адаптеры из JSON-описания.
+
+    Каждый источник: {"name", "type": "http"|"file", "urls"|"paths", ...} плюс
+    необязательные fields, updated_field, interval, concurrency, items_key,
+    since_param. Пути файлов - относительно файла описания; '{base_url}' в
+    адресах заменяется на base_url (локальный сервер в проверках).
+    """
+    path = Path(path)
+    with open(path, encoding='utf-8') as config:
+        specs = json.load(config)
+
+    sources = []
+    for spec in specs:
+        spec = dict(spec)
+        kind = spec.pop('type', 'http')
+        if kind == 'file':
+            locations = [str(path.parent / location) for location in spec.pop('paths')]
+        else:
+            locations = spec.pop('urls')
+            if base_url:
+                locations = [url.replace('{base_url}', base_url) for url in locations]
+        sources.append(SOURCE_TYPES[kind](spec.pop('name'), locations, **spec))
+    return sources
+
+class SourceRun:
+    """Счетчики одной загрузки источника"""
+
+    def __init__(self, name):
+        self.name = name
+        self.counts = Counter(fetched=0, stale=0, inserted=0, updated=0, skipped=0, failed=0)
+        self.not_modified = 0
+        self.errors = []
+        self.started = time.monotonic()
+        self.seconds = 0.0
+
+    @property
+    def throughput(self):
+        return self.counts['fetched'] / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        counts = self.counts
+        line = (
+            f"{self.name}: получено {counts['fetched']} за {self.seconds:.2f} с "
+            f"({self.throughput:.0f}/с), старых {counts['stale']}, новых {counts['inserted']}, "
+            f"обновлено {counts['updated']}, без изменений {counts['skipped']}, "
+            f"с ошибками {counts['failed']}, без изменений по адресу {self.not_modified}"
+        )
+        if self.errors:
+            line += f", ошибок загрузки {len(self.errors)}: {self.errors[-1]}"
+        return line
+
+class IngestionScheduler:
+    """Загрузка источников по расписанию на job queue бота"""
+
+    def __init__(self, db, sources, concurrency=INGEST_CONCURRENCY):
+        self.db = db
+        self.sources = list(sources)
+        self.last_runs = {}
+        self._slots = None
+        self._running = set()
+        self._tasks = []
+        self.concurrency = concurrency
+
+    def start(self, job_queue=None):
+        """Планирует загрузки; без job queue (PTB без [job-queue]) - собственными задачами asyncio"""
+        for index, source in enumerate(self.sources):
+            first = INGEST_FIRST_DELAY + index * 5  # источники не стартуют одновременно
+            if job_queue is not None:
+                job_queue.run_repeating(
+                    self._job, interval=source.interval, first=first,
+                    name=f'ingest:{source.name}', data=source,
+                )
+            else:
+                self._tasks.append(asyncio.create_task(self._loop(source, first)))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for source in self.sources:
+            await source.close()
+
+    async def _job(self, context):
+        await self.run_source(context.job.data)
+
+    async def _loop(self, source, first):
+        await asyncio.sleep(first)
+        while True:
+            await self.run_source(source)
+            await asyncio.sleep(source.interval)
+
+    async def run_all(self):
+        """Загружает все источники один раз; список SourceRun"""
+        runs = await asyncio.gather(*(self.run_source(source) for source in self.sources))
+        return [run for run in runs if run]
+
+    async def run_source(self, source):
+        """Одна загрузка источника; пропускается, если предыдущая еще идет"""
+        if source.name in self._running:
+            logger.info(f"Источник {source.name}: предыдущая загрузка еще идет, пропуск")
+            return None
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+
+        self._running.add(source.name)
+        try:
+            async with self._slots:
+                run = SourceRun(source.name)
+                state = await self.db.get_ingestion_state(source.name)
+                results = await asyncio.gather(
+                    *(self._ingest_location(source, location, state.get(location, {}), run)
+                      for location in source.locations)
+                )
+                state.update((location, new) for location, new in zip(source.locations, results) if new)
+                run.seconds = time.monotonic() - run.started
+                await self.db.save_ingestion_run(source.name, state, run.counts, run.not_modified,
+                                                 run.errors, run.seconds)
+        finally:
+            self._running.discard(source.name)
+
+        self.last_runs[source.name] = run
+        log = logger.warning if run.errors else logger.info
+        log(f"Загрузка вакансий: {run}")
+        return run
+
+    async def _ingest_location(self, source, location, state, run):
+        """Загружает один адрес; новое состояние адреса или None, если его не надо менять"""
+        try:
+            items, validators = await source.fetch_limited(location, state)
+        except FeedError as e:
+            run.errors.append(str(e))
+            return None
+        if items is None:
+            run.not_modified += 1
+            return None
+
+        high_water = state.get('high_water')
+        newest = high_water
+        batch = []
+        for item in items:
+            run.counts['fetched'] += 1
+            if not isinstance(item, dict):
+                run.counts['failed'] += 1
+                continue
+            marker = source.marker(item)
+            if marker is not None:
+                # Равную отметку пропускать нельзя: в ту же секунду могли выйти еще вакансии
+                if high_water is not None and marker_key(marker) < marker_key(high_water):
+                    run.counts['stale'] += 1
+                    continue
+                if newest is None or marker_key(marker) > marker_key(newest):
+                    newest = marker
+            try:
+                batch.append(normalize_row(source.map_item(item), source.name))
+            except ValueError:
+                run.counts['failed'] += 1
+                continue
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                run.counts.update(await self.db.upsert_vacancies(batch))
+                batch = []
+        if batch:
+            run.counts.update(await self.db.upsert_vacancies(batch))
+
+        return {**validators, 'high_water': newest}
+
+    async def report(self):
+        """Сводка по источникам для администратора: последняя загрузка и итоги за все время"""
+        lines = []
+        for stats in await self.db.get_ingestion_stats():
+            rate = stats['fetched_count'] / stats['total_seconds'] if stats['total_seconds'] else 0
+            lines.append(
+                f"• {stats['name']}: загрузок {stats['runs']}, ошибок {stats['errors']}, "
+                f"новых {stats['inserted_count']}, обновлено {stats['updated_count']}, "
+                f"{rate:.0f} элементов/с, последняя {stats['last_run_at']}"
+                + (f" (ошибка: {stats['last_error']})" if stats['last_error'] else '')
+            )
+        return '\n'.join(lines)
+
+class FixtureHandler(SimpleHTTPRequestHandler):
+    """Отдает файлы с Last-Modified и отвечает 304 на If-Modified-Since"""
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+class FixtureServer:
+    """Локальный HTTP-сервер над папкой с лентами вместо внешнего API"""
+
+    def __init__(self, directory=FEEDS_DIR):
+        handler = partial(FixtureHandler, directory=str(directory))
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+async def check_sources(db, config, base_url):
+    scheduler = IngestionScheduler(db, load_sources(config, base_url))
+    try:
+        for attempt in ('первый проход', 'повторный проход'):
+            print(f"— {attempt}")
+            for run in await scheduler.run_all():
+                print(run)
+    finally:
+        await scheduler.stop()
+
+def main(config):
+    """Загружает источники из описания во временную базу через локальный сервер"""
+    from job_bot import AsyncDatabase, DatabaseManager
+
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as directory, FixtureServer(Path(config).parent) as server:
+        db = AsyncDatabase(DatabaseManager(os.path.join(directory, 'ingestion.db')))
+        try:
+            asyncio.run(check_sources(db, config, server.base_url))
+            print(f"Вакансий в базе: {db.sync.get_stats()['vacancies_count']}")
+        finally:
+            db.close()
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else FEEDS_DIR / 'sources.json')
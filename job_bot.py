@@ -1,8 +1,23 @@
 import logging
+import os
 import sqlite3
 import json
 import asyncio
+import re
+import argparse
+import hashlib
+import secrets
+import threading
+import functools
+import tempfile
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+from itertools import islice
 from telegram import (
     Update, 
     InlineKeyboardButton, 
@@ -19,6 +34,29 @@ from telegram.ext import (
     ContextTypes,
     ConversationHandler
 )
+from telegram.error import BadRequest
+from telegram.helpers import escape_markdown
+
+from cv_analysis import ANALYZER_VERSION, CVAnalyzer
+from documents import (
+    CV_EXTENSIONS,
+    MAX_CV_FILE_SIZE,
+    DocumentError,
+    DocumentProcessor,
+    TelegramDocumentSource,
+)
+from alerts import AlertDispatcher, AudienceIndex
+from callbacks import CallbackRouter, callback_data
+from cards import VacancyCards
+from broadcast import BroadcastEngine
+from importer import IMPORT_EXTENSIONS, IMPORT_MAX_FILE_SIZE, import_vacancies
+from ingestion import IngestionScheduler, load_sources
+from metrics import Metrics
+from outbound import OutboundSender
+from persistence import SQLitePersistence
+from premium import PremiumSweeper
+from ranking import RelevanceIndex, UserProfile, base_score
+from webhook import MAX_CONCURRENT_UPDATES, WEBHOOK_PORT, PerUserUpdateProcessor, WebhookServer, serve_webhook
 
 # Настройка логирования
 logging.basicConfig(
@@ -28,25 +66,359 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Конфигурация
-BOT_TOKEN = "# BOT_TOKEN = "YOUR_BOT_TOKEN_HERE"
+BOT_TOKEN = "YOUR_BOT_TOKEN_HERE"
 DB_PATH = "jobs.db"
 ADMIN_USERS = []  # Добавьте ваш user_id через @userinfobot
+INGESTION_SOURCES_FILE = "ingestion_sources.json"  # внешние источники вакансий (пример: fixtures/feeds/sources.json)
+WEBHOOK_URL = None  # публичный HTTPS-адрес webhook, например "https://bot.example.com/telegram"
+WEBHOOK_SECRET = None  # секрет в заголовке X-Telegram-Bot-Api-Secret-Token
+METRICS_ENABLED = False  # метрики производительности (включаются и флагом --metrics)
+METRICS_FILE = "metrics.prom"  # файл с метриками в формате Prometheus; None - не записывать
+
+# Настройки SQLite: соединения живут весь срок работы потока
+SQLITE_BUSY_TIMEOUT = 30  # секунд ожидания блокировки записи
+SQLITE_STATEMENT_CACHE = 256  # подготовленных запросов на соединение
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -16000,  # ~16 МБ страничного кэша
+    'mmap_size': 134217728,  # 128 МБ memory-mapped I/O
+    'temp_store': 'MEMORY',
+}
+DB_EXECUTOR_WORKERS = 4  # потоков для запросов к базе из обработчиков
+
+SAMPLE_SEED_MARKER = 'sample_vacancies_seeded'
+FEED_PAGE_SIZE = 5
+SAVED_PAGE_SIZE = 10
+SEARCH_PAGE_SIZE = 5
+FREE_APPLICATIONS = 10
+PREMIUM_DAYS = 30
+# Premium действует, пока premium_until в будущем (строки ISO 8601 сравниваются как даты)
+PREMIUM_ACTIVE_SQL = "is_premium AND (premium_until IS NULL OR premium_until > ?)"
+
+# Поля профиля, которые save_user может перезаписать
+USER_PROFILE_FIELDS = (
+    'username', 'first_name', 'last_name', 'role', 'level', 'work_format', 'location',
+    'salary_min', 'salary_max', 'currency', 'cv_text', 'cv_analysis', 'last_activity'
+)
+
+# Скрытые и откликнутые вакансии не показываются в ленте
+EXCLUDED_ACTIONS = ('hidden', 'applied')
+EXCLUSION_CACHE_USERS = 10000  # сколько пользователей держать в кэше исключений
+FEED_SESSION_USERS = 1000  # сколько обходов ранжированной ленты держать между страницами
+EXCLUSION_MERGE_MIN = 64  # сколько новых ID копить, прежде чем вливать их в массив
+
+# Полнотекстовый поиск: веса столбцов BM25 в порядке столбцов vacancies_fts
+SEARCH_COLUMNS = ('title', 'company', 'description_short', 'requirements', 'tags')
+SEARCH_WEIGHTS = (10.0, 3.0, 1.0, 2.0, 5.0)
+SEARCH_SNIPPET_TOKENS = 12
+# Границы совпадения в сниппете; заменяются на разметку после экранирования текста
+SNIPPET_OPEN, SNIPPET_CLOSE = '\x02', '\x03'
+SEARCH_MAX_RESULTS = 1000  # сколько результатов запроса запоминать для листания
+SEARCH_SESSION_USERS = 1000  # сколько снимков поиска держать между страницами
 
 # Состояния для ConversationHandler
 ROLE, LEVEL, FORMAT, LOCATION, SALARY, CV_UPLOAD = range(6)
 
+class ExclusionSet:
+    """Компактное множество ID вакансий: отсортированный массив int64 и бинарный поиск.
+    
+    Новые ID копятся в небольшом множестве recent и вливаются в массив пачкой,
+    когда их становится больше восьмой части массива, поэтому добавление не
+    сдвигает массив каждый раз. Слияние сначала подменяет массив, потом recent:
+    читающий поток без блокировки видит ID хотя бы в одном из них.
+    """
+    
+    __slots__ = ('ids', 'recent')
+    
+    def __init__(self, ids=()):
+        self.ids = array('q', sorted(set(ids)))
+        self.recent = set()
+    
+    def __contains__(self, vacancy_id):
+        if vacancy_id in self.recent:
+            return True
+        ids = self.ids
+        index = bisect_left(ids, vacancy_id)
+        return index < len(ids) and ids[index] == vacancy_id
+    
+    def __len__(self):
+        return len(self.ids) + len(self.recent)
+    
+    def add(self, vacancy_id):
+        """Добавляет ID; вызывается под блокировкой ExclusionCache"""
+        if vacancy_id in self:
+            return
+        self.recent.add(vacancy_id)
+        if len(self.recent) > max(EXCLUSION_MERGE_MIN, len(self.ids) // 8):
+            self.ids = array('q', sorted(self.ids + array('q', self.recent)))
+            self.recent = set()
+
+class LRUCache:
+    """Потокобезопасный LRU-словарь ограниченного размера"""
+    
+    def __init__(self, max_items):
+        self.max_items = max_items
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+    
+    def put(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+    
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+class ExclusionCache(LRUCache):
+    """Исключения ленты (ExclusionSet) недавних пользователей.
+    
+    Множество загружается из базы один раз и дальше обновляется при каждом
+    скрытии или отклике, поэтому страницы ленты не перечитывают историю.
+    """
+    
+    def __init__(self, max_users=EXCLUSION_CACHE_USERS):
+        super().__init__(max_users)
+        self._loading = {}  # user_id -> ID, отмеченные, пока множество читается из базы
+    
+    def load(self, user_id, read_ids):
+        """Множество пользователя; read_ids читает его из базы вне блокировки кэша"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                self._entries.move_to_end(user_id)
+                return entry
+            self._loading.setdefault(user_id, set())
+        
+        entry = ExclusionSet(read_ids())
+        with self._lock:
+            # Скрытия, записанные во время чтения, могли в него не попасть
+            for vacancy_id in self._loading.pop(user_id, ()):
+                entry.add(vacancy_id)
+        self.put(user_id, entry)
+        return entry
+    
+    def note(self, user_id, vacancy_id):
+        """Учитывает новое скрытие или отклик; потоки базы вызывают его одновременно"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                entry.add(vacancy_id)
+            elif user_id in self._loading:
+                self._loading[user_id].add(vacancy_id)
+
+class FeedSession:
+    """Обход ранжированной ленты пользователя и уже отданные страницы.
+    
+    Курсор кнопки "Вперед" - ID последней показанной вакансии. Если он есть в
+    results, продолжение берется из уже найденного и дальше из scan, без
+    повторного перебора вакансий выше курсора; так же работают и старые
+    кнопки, нажатые повторно.
+    """
+    
+    def __init__(self, scan, profile_key):
+        self.scan = scan
+        self.profile_key = profile_key
+        self.results = []  # (оценка, id) в порядке ленты
+        self.positions = {}  # id -> позиция в results
+        self._lock = threading.Lock()
+    
+    def page(self, after_id, limit, exclude):
+        """Следующие limit пар (оценка, id) после вакансии after_id (None - с начала)"""
+        with self._lock:
+            start = self.positions[after_id] + 1 if after_id else 0
+            found = []
+            for item in islice(self.results, start, None):
+                if len(found) == limit:
+                    return found
+                if item[1] not in exclude:
+                    found.append(item)
+            while len(found) < limit:
+                more = self.scan.next(limit - len(found))
+                if not more:
+                    break
+                for item in more:
+                    self.positions[item[1]] = len(self.results)
+                    self.results.append(item)
+                found.extend(more)
+            return found
+
+class SearchSession:
+    """Снимок результатов поиска: ID вакансий в порядке BM25 на момент запроса.
+    
+    Оценки BM25 зависят от статистики всего индекса, поэтому любая запись
+    вакансий между нажатиями сдвигает их. Страницы берутся по смещению в
+    снимке, как лента из FeedSession: новые вакансии в выдачу не попадают,
+    результаты не пропускаются и не повторяются. search_id в кнопке привязывает
+    ее к запросу, для которого она показана.
+    """
+    
+    __slots__ = ('search_id', 'text', 'ids')
+    
+    def __init__(self, text, ids):
+        self.search_id = secrets.randbits(32)
+        self.text = text
+        self.ids = ids
+
+def search_match_expression(text):
+    """Запрос пользователя в выражение FTS5: все слова обязательны, каждое как префикс.
+    
+    Слова берутся в кавычки, поэтому операторы и спецсимволы FTS5 из ввода
+    не интерпретируются. Пустой запрос дает None.
+    """
+    words = re.findall(r'\w+', text.lower())
+    return ' '.join(f'"{word}"*' for word in words) or None
+
+def format_search_snippet(snippet):
+    """Сниппет поиска для Markdown: текст экранируется, совпадения выделяются жирным"""
+    text = escape_markdown(' '.join(snippet.split()), version=1)
+    return text.replace(SNIPPET_OPEN, '*').replace(SNIPPET_CLOSE, '*')
+
+def vacancy_fingerprint(vacancy):
+    """Ключ дедупликации вакансии: хэш нормализованных названия, компании и ссылки"""
+    parts = [
+        re.sub(r'\s+', ' ', str(vacancy.get(field) or '')).strip().lower()
+        for field in ('title', 'company', 'apply_url')
+    ]
+    return hashlib.blake2b('\x1f'.join(parts).encode('utf-8'), digest_size=16).hexdigest()
+
 class DatabaseManager:
     def __init__(self, db_path="jobs.db"):
         self.db_path = db_path
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self.exclusions = ExclusionCache()
+        self.feed_sessions = LRUCache(FEED_SESSION_USERS)
+        self.search_sessions = LRUCache(SEARCH_SESSION_USERS)
+        self.ranking = RelevanceIndex()
+        self._ranking_lock = threading.Lock()
+        self.audience = AudienceIndex()
+        self._vacancy_listeners = [self._index_vacancies]
         self.init_database()
     
+    def _connect(self):
+        """Открывает соединение и применяет настройки SQLite"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=SQLITE_BUSY_TIMEOUT,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=SQLITE_STATEMENT_CACHE
+        )
+        conn.row_factory = sqlite3.Row
+        for name, value in SQLITE_PRAGMAS.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+    
+    @property
+    def connection(self):
+        """Долгоживущее соединение текущего потока"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            self._local.depth = 0
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+    
+    @contextmanager
+    def transaction(self):
+        """Транзакция на соединении потока. Вложенные блоки входят во внешнюю транзакцию"""
+        conn = self.connection
+        if self._local.depth:
+            self._local.depth += 1
+            try:
+                yield conn
+            finally:
+                self._local.depth -= 1
+            return
+        
+        conn.execute('BEGIN IMMEDIATE')
+        self._local.depth = 1
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            self._local.depth = 0
+    
+    def fetchone(self, query, params=()):
+        """Возвращает одну строку запроса как dict"""
+        row = self.connection.execute(query, params).fetchone()
+        return dict(row) if row else None
+    
+    def fetchall(self, query, params=()):
+        """Возвращает все строки запроса как список dict"""
+        return [dict(row) for row in self.connection.execute(query, params)]
+    
+    def close(self):
+        """Закрывает все открытые соединения"""
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+    
+    # Миграции схемы по порядку; номер применённой хранится в PRAGMA user_version
+    MIGRATIONS = [
+        '_migrate_base_schema',
+        '_migrate_query_indexes',
+        '_migrate_unique_vacancies',
+        '_migrate_vacancy_fingerprint',
+        '_migrate_keyset_indexes',
+        '_migrate_provision_subscriptions',
+        '_migrate_relevance_scores',
+        '_migrate_vacancy_search',
+        '_migrate_cv_files',
+        '_migrate_broadcasts',
+        '_migrate_ingestion_sources',
+        '_migrate_applications',
+        '_migrate_premium_expiry',
+        '_migrate_conversation_state',
+    ]
+    
     def init_database(self):
         """Инициализация базы данных"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        if self.schema_version() < len(self.MIGRATIONS):
+            self.migrate()
         
+        # Тестовые вакансии добавляются один раз на базу
+        if not self.get_meta(SAMPLE_SEED_MARKER):
+            self.add_sample_vacancies()
+    
+    def schema_version(self):
+        """Текущая версия схемы"""
+        return self.connection.execute('PRAGMA user_version').fetchone()[0]
+    
+    def migrate(self):
+        """Применяет недостающие миграции, каждую в своей транзакции"""
+        for version, name in enumerate(self.MIGRATIONS, start=1):
+            with self.transaction() as conn:
+                # Версию перечитываем под блокировкой записи: другой процесс мог успеть раньше
+                if self.schema_version() >= version:
+                    continue
+                logger.info(f"Миграция схемы {version}: {name}")
+                getattr(self, name)(conn)
+                conn.execute(f'PRAGMA user_version = {version}')
+    
+    def _migrate_base_schema(self, conn):
+        """Создает таблицы схемы"""
         # Таблица пользователей
-        cursor.execute('''
+        conn.execute('''
             CREATE TABLE IF NOT EXISTS users (
                 user_id INTEGER PRIMARY KEY,
                 username TEXT,
@@ -69,7 +441,7 @@ class DatabaseManager:
         ''')
         
         # Таблица вакансий
-        cursor.execute('''
+        conn.execute('''
             CREATE TABLE IF NOT EXISTS vacancies (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 title TEXT NOT NULL,
@@ -94,7 +466,7 @@ class DatabaseManager:
         ''')
         
         # Таблица подписок
-        cursor.execute('''
+        conn.execute('''
             CREATE TABLE IF NOT EXISTS subscriptions (
                 user_id INTEGER PRIMARY KEY,
                 is_premium BOOLEAN DEFAULT FALSE,
@@ -106,7 +478,7 @@ class DatabaseManager:
         ''')
         
         # Таблица действий пользователей
-        cursor.execute('''
+        conn.execute('''
             CREATE TABLE IF NOT EXISTS user_actions (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 user_id INTEGER,
@@ -117,7 +489,7 @@ class DatabaseManager:
         ''')
         
         # Таблица платежей
-        cursor.execute('''
+        conn.execute('''
             CREATE TABLE IF NOT EXISTS payments (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 user_id INTEGER,
@@ -128,12 +500,281 @@ class DatabaseManager:
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
+    
+    def _migrate_query_indexes(self, conn):
+        """Индексы под запросы ленты, действий пользователей и статистики"""
+        # Лента с фильтрами профиля по дате (до ранжированной ленты)
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_vacancies_profile
+            ON vacancies (role, level, work_format, created_at DESC)
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_vacancies_created ON vacancies (created_at DESC)')
         
-        conn.commit()
-        conn.close()
-        
-        # Добавляем тестовые вакансии
-        self.add_sample_vacancies()
+        # get_user_actions и подсчет откликов в get_stats (покрывающие индексы)
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_user_actions_user
+            ON user_actions (user_id, action, vacancy_id)
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_user_actions_action ON user_actions (action)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_subscriptions_premium ON subscriptions (is_premium)')
+    
+    def _migrate_unique_vacancies(self, conn):
+        """Уникальность вакансий по названию, компании и ссылке"""
+        self._merge_duplicate_vacancies(conn)
+        conn.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS ux_vacancies_identity
+            ON vacancies (title, IFNULL(company, ''), IFNULL(apply_url, ''))
+        ''')
+    
+    def _migrate_vacancy_fingerprint(self, conn):
+        """Ключ дедупликации fingerprint и служебная таблица меток"""
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+        ''')
+        conn.execute('ALTER TABLE vacancies ADD COLUMN fingerprint TEXT')
+        rows = conn.execute('SELECT id, title, company, apply_url FROM vacancies').fetchall()
+        conn.executemany(
+            'UPDATE vacancies SET fingerprint = ? WHERE id = ?',
+            [(vacancy_fingerprint(dict(row)), row['id']) for row in rows]
+        )
+        # Нормализация может склеить записи, которые старый индекс считал разными
+        self._merge_duplicate_vacancies(conn, 'fingerprint')
+        conn.execute('DROP INDEX IF EXISTS ux_vacancies_identity')
+        conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS ux_vacancies_fingerprint ON vacancies (fingerprint)')
+    
+    def _migrate_keyset_indexes(self, conn):
+        """Индексы ленты в порядке курсора (created_at, id)"""
+        conn.execute('DROP INDEX IF EXISTS idx_vacancies_profile')
+        conn.execute('DROP INDEX IF EXISTS idx_vacancies_created')
+        conn.execute('''
+            CREATE INDEX idx_vacancies_profile
+            ON vacancies (role, level, work_format, created_at DESC, id DESC)
+        ''')
+        conn.execute('CREATE INDEX idx_vacancies_created ON vacancies (created_at DESC, id DESC)')
+    
+    def _migrate_provision_subscriptions(self, conn):
+        """Подписки для пользователей, у которых их еще нет"""
+        conn.execute('''
+            INSERT OR IGNORE INTO subscriptions (user_id)
+            SELECT user_id FROM users
+        ''')
+    
+    def _migrate_relevance_scores(self, conn):
+        """Заполняет базовую оценку релевантности для существующих вакансий"""
+        rows = conn.execute('SELECT * FROM vacancies').fetchall()
+        conn.executemany(
+            'UPDATE vacancies SET relevance_score = ? WHERE id = ?',
+            [(base_score(dict(row)), row['id']) for row in rows]
+        )
+    
+    def _migrate_vacancy_search(self, conn):
+        """Полнотекстовый индекс FTS5 по вакансиям, синхронизируемый триггерами"""
+        columns = ', '.join(SEARCH_COLUMNS)
+        new_values = ', '.join(f'new.{column}' for column in SEARCH_COLUMNS)
+        old_values = ', '.join(f'old.{column}' for column in SEARCH_COLUMNS)
+        
+        # External content: текст хранится только в vacancies, в индексе - токены
+        conn.execute(f'''
+            CREATE VIRTUAL TABLE vacancies_fts USING fts5(
+                {columns},
+                content='vacancies', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+            )
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER vacancies_fts_insert AFTER INSERT ON vacancies BEGIN
+                INSERT INTO vacancies_fts (rowid, {columns}) VALUES (new.id, {new_values});
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER vacancies_fts_delete AFTER DELETE ON vacancies BEGIN
+                INSERT INTO vacancies_fts (vacancies_fts, rowid, {columns})
+                VALUES ('delete', old.id, {old_values});
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER vacancies_fts_update AFTER UPDATE OF {columns} ON vacancies BEGIN
+                INSERT INTO vacancies_fts (vacancies_fts, rowid, {columns})
+                VALUES ('delete', old.id, {old_values});
+                INSERT INTO vacancies_fts (rowid, {columns}) VALUES (new.id, {new_values});
+            END
+        ''')
+        conn.execute("INSERT INTO vacancies_fts (vacancies_fts) VALUES ('rebuild')")
+    
+    def _migrate_cv_files(self, conn):
+        """Кэш разобранных файлов резюме по file_unique_id"""
+        conn.execute('''
+            CREATE TABLE cv_files (
+                file_unique_id TEXT PRIMARY KEY,
+                file_name TEXT,
+                cv_text TEXT,
+                cv_analysis TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+    
+    def _migrate_broadcasts(self, conn):
+        """Задания рассылок, статусы получателей и отметка о блокировке бота"""
+        conn.execute('''
+            CREATE TABLE broadcasts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                text TEXT NOT NULL,
+                admin_chat_id INTEGER NOT NULL,
+                progress_message_id INTEGER,
+                status TEXT NOT NULL DEFAULT 'running',
+                total INTEGER NOT NULL DEFAULT 0,
+                sent_count INTEGER NOT NULL DEFAULT 0,
+                blocked_count INTEGER NOT NULL DEFAULT 0,
+                failed_count INTEGER NOT NULL DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                finished_at TIMESTAMP
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE broadcast_recipients (
+                broadcast_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                error TEXT,
+                PRIMARY KEY (broadcast_id, user_id)
+            ) WITHOUT ROWID
+        ''')
+        conn.execute("CREATE INDEX idx_broadcasts_status ON broadcasts (status)")
+        conn.execute('ALTER TABLE users ADD COLUMN blocked_at TIMESTAMP')
+    
+    def _migrate_ingestion_sources(self, conn):
+        """Состояние и счетчики загрузки внешних источников вакансий"""
+        conn.execute('''
+            CREATE TABLE ingestion_sources (
+                name TEXT PRIMARY KEY,
+                state TEXT NOT NULL DEFAULT '{}',
+                runs INTEGER NOT NULL DEFAULT 0,
+                errors INTEGER NOT NULL DEFAULT 0,
+                fetched_count INTEGER NOT NULL DEFAULT 0,
+                inserted_count INTEGER NOT NULL DEFAULT 0,
+                updated_count INTEGER NOT NULL DEFAULT 0,
+                skipped_count INTEGER NOT NULL DEFAULT 0,
+                failed_count INTEGER NOT NULL DEFAULT 0,
+                not_modified_count INTEGER NOT NULL DEFAULT 0,
+                total_seconds REAL NOT NULL DEFAULT 0,
+                last_error TEXT,
+                last_run_at TIMESTAMP
+            )
+        ''')
+    
+    def _migrate_applications(self, conn):
+        """Журнал откликов: одна запись на пару пользователь-вакансия"""
+        conn.execute('''
+            CREATE TABLE applications (
+                user_id INTEGER NOT NULL,
+                vacancy_id INTEGER NOT NULL,
+                charged BOOLEAN,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (user_id, vacancy_id)
+            ) WITHOUT ROWID
+        ''')
+        # Прежние отклики переносятся без отметки о списании: она не сохранялась
+        conn.execute('''
+            INSERT INTO applications (user_id, vacancy_id, charged, created_at)
+            SELECT user_id, vacancy_id, NULL, MIN(created_at) FROM user_actions
+            WHERE action = 'applied' GROUP BY user_id, vacancy_id
+        ''')
+    
+    def _migrate_premium_expiry(self, conn):
+        """Индекс окончаний Premium для фоновой проверки и отметка о напоминании"""
+        conn.execute('ALTER TABLE subscriptions ADD COLUMN reminded_until TIMESTAMP')
+        conn.execute('''
+            CREATE INDEX idx_subscriptions_premium_until ON subscriptions (premium_until) WHERE is_premium
+        ''')
+    
+    def _migrate_conversation_state(self, conn):
+        """Состояние диалогов (user_data, chat_data, bot_data) между перезапусками"""
+        conn.execute('''
+            CREATE TABLE conversation_state (
+                kind TEXT NOT NULL,
+                key INTEGER NOT NULL,
+                data TEXT NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (kind, key)
+            ) WITHOUT ROWID
+        ''')
+    
+    def _merge_duplicate_vacancies(self, conn, key="title, IFNULL(company, ''), IFNULL(apply_url, '')"):
+        """Схлопывает дубликаты вакансий в самую раннюю запись и переносит на неё действия"""
+        conn.execute(f'''
+            CREATE TEMP TABLE vacancy_remap AS
+            SELECT id AS old_id, keep_id AS new_id
+            FROM (SELECT id, MIN(id) OVER (PARTITION BY {key}) AS keep_id FROM vacancies)
+            WHERE id <> keep_id
+        ''')
+        conn.execute('''
+            UPDATE user_actions
+            SET vacancy_id = (SELECT new_id FROM vacancy_remap WHERE old_id = user_actions.vacancy_id)
+            WHERE vacancy_id IN (SELECT old_id FROM vacancy_remap)
+        ''')
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'applications'").fetchone():
+            # Отклик на дубликат становится откликом на оставшуюся вакансию, если его еще нет
+            conn.execute('''
+                UPDATE OR IGNORE applications
+                SET vacancy_id = (SELECT new_id FROM vacancy_remap WHERE old_id = applications.vacancy_id)
+                WHERE vacancy_id IN (SELECT old_id FROM vacancy_remap)
+            ''')
+            conn.execute('DELETE FROM applications WHERE vacancy_id IN (SELECT old_id FROM vacancy_remap)')
+        # После переноса у пользователя могли появиться одинаковые действия над оставшейся вакансией.
+        # Скрытие и отклик повторять незачем - остается первое; для saved/unsaved состояние
+        # определяет последнее действие, поэтому остается оно
+        conn.execute('''
+            DELETE FROM user_actions
+            WHERE vacancy_id IN (SELECT new_id FROM vacancy_remap)
+              AND action IN ('hidden', 'applied', 'saved', 'unsaved')
+              AND id NOT IN (
+                  SELECT MIN(id) FROM user_actions
+                  WHERE vacancy_id IN (SELECT new_id FROM vacancy_remap) AND action IN ('hidden', 'applied')
+                  GROUP BY user_id, vacancy_id, action
+                  UNION ALL
+                  SELECT MAX(id) FROM user_actions
+                  WHERE vacancy_id IN (SELECT new_id FROM vacancy_remap) AND action IN ('saved', 'unsaved')
+                  GROUP BY user_id, vacancy_id
+              )
+        ''')
+        merged = conn.execute(
+            'DELETE FROM vacancies WHERE id IN (SELECT old_id FROM vacancy_remap)'
+        ).rowcount
+        conn.execute('DROP TABLE vacancy_remap')
+        
+        if merged:
+            logger.info(f"Удалено дубликатов вакансий: {merged}")
+        return merged
+    
+    def compact_vacancies(self):
+        """Разовая чистка: схлопывает дубликаты вакансий с одинаковым fingerprint"""
+        with self.transaction() as conn:
+            rows = conn.execute('SELECT id, title, company, apply_url, fingerprint FROM vacancies').fetchall()
+            stale = []
+            for row in rows:
+                fingerprint = vacancy_fingerprint(dict(row))
+                if fingerprint != row['fingerprint']:
+                    stale.append((fingerprint, row['id']))
+            if stale:
+                # Уникальный индекс не даст записать совпадающие ключи до слияния
+                conn.execute('DROP INDEX IF EXISTS ux_vacancies_fingerprint')
+                conn.executemany('UPDATE vacancies SET fingerprint = ? WHERE id = ?', stale)
+            merged = self._merge_duplicate_vacancies(conn, 'fingerprint')
+            conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS ux_vacancies_fingerprint ON vacancies (fingerprint)')
+        return merged
+    
+    def get_meta(self, key):
+        """Читает служебную метку"""
+        row = self.connection.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+    
+    def set_meta(self, key, value):
+        """Записывает служебную метку"""
+        with self.transaction() as conn:
+            conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
     
     def add_sample_vacancies(self):
         """Добавляем примеры вакансий в базу"""
@@ -266,232 +907,835 @@ class DatabaseManager:
             }
         ]
         
-        for vacancy in vacancies:
-            self.save_vacancy(vacancy)
+        with self.transaction():
+            added = sum(1 for vacancy in vacancies if self.save_vacancy(vacancy))
+            self.set_meta(SAMPLE_SEED_MARKER, datetime.now().isoformat())
+        return added
     
     def save_user(self, user_data):
-        """Сохраняет пользователя в базу"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT OR REPLACE INTO users 
-            (user_id, username, first_name, last_name, role, level, work_format, 
-             location, salary_min, salary_max, currency, cv_text, cv_analysis, last_activity)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            user_data['user_id'],
-            user_data.get('username'),
-            user_data.get('first_name'),
-            user_data.get('last_name'),
-            user_data.get('role'),
-            user_data.get('level'),
-            user_data.get('work_format'),
-            user_data.get('location'),
-            user_data.get('salary_min'),
-            user_data.get('salary_max'),
-            user_data.get('currency'),
-            user_data.get('cv_text'),
-            json.dumps(user_data.get('cv_analysis', {})),
-            datetime.now()
-        ))
-        
-        conn.commit()
-        conn.close()
+        """Сохраняет пользователя в базу и заводит ему подписку.
+        
+        Перезаписываются только переданные поля, остальные (согласие, статус
+        поиска, дата регистрации) сохраняются.
+        """
+        user_data = dict(user_data)
+        if 'cv_analysis' in user_data:
+            user_data['cv_analysis'] = json.dumps(user_data['cv_analysis'])
+        user_data['last_activity'] = datetime.now()
+        
+        columns = ['user_id'] + [field for field in USER_PROFILE_FIELDS if field in user_data]
+        updates = ', '.join(f"{field} = excluded.{field}" for field in columns[1:])
+        
+        with self.transaction() as conn:
+            conn.execute(f'''
+                INSERT INTO users ({', '.join(columns)})
+                VALUES ({', '.join('?' * len(columns))})
+                ON CONFLICT (user_id) DO UPDATE SET {updates}, blocked_at = NULL
+            ''', [user_data[field] for field in columns])
+            # Подписка создается при онбординге, чтобы чтение на горячем пути ничего не писало
+            conn.execute('INSERT OR IGNORE INTO subscriptions (user_id) VALUES (?)', (user_data['user_id'],))
+        self._refresh_audience([user_data['user_id']])
     
     def get_user(self, user_id):
         """Получает пользователя по ID"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
-        row = cursor.fetchone()
-        
-        if not row:
-            conn.close()
+        user = self.fetchone('SELECT * FROM users WHERE user_id = ?', (user_id,))
+        if not user:
             return None
         
-        columns = [description[0] for description in cursor.description]
-        user = dict(zip(columns, row))
-        
         if user.get('cv_analysis'):
             try:
                 user['cv_analysis'] = json.loads(user['cv_analysis'])
-            except:
+            except ValueError:
                 user['cv_analysis'] = {}
         
-        conn.close()
         return user
     
+    def set_consent(self, user_id, given=True):
+        """Сохраняет согласие на обработку данных"""
+        with self.transaction() as conn:
+            conn.execute('UPDATE users SET consent_given = ? WHERE user_id = ?', (given, user_id))
+        self._refresh_audience([user_id])
+    
+    def set_search_active(self, user_id, active):
+        """Ставит поиск пользователя на паузу или возобновляет его"""
+        with self.transaction() as conn:
+            conn.execute('UPDATE users SET search_active = ? WHERE user_id = ?', (active, user_id))
+        self._refresh_audience([user_id])
+    
+    def get_unanalyzed_cvs(self, version=ANALYZER_VERSION):
+        """Пары (user_id, cv_text) резюме без разбора текущей версией анализатора"""
+        return [tuple(row) for row in self.connection.execute('''
+            SELECT user_id, cv_text FROM users
+            WHERE cv_text IS NOT NULL
+              AND (json_valid(cv_analysis) IS NOT 1
+                   OR json_extract(cv_analysis, '$.version') IS NOT ?)
+        ''', (version,))]
+    
+    def save_cv_analyses(self, analyses):
+        """Сохраняет разборы резюме пачкой: analyses - пары (user_id, cv_analysis)"""
+        with self.transaction() as conn:
+            conn.executemany(
+                'UPDATE users SET cv_analysis = ? WHERE user_id = ?',
+                [(json.dumps(analysis), user_id) for user_id, analysis in analyses]
+            )
+    
+    def get_cv_file(self, file_unique_id):
+        """Разобранный ранее файл резюме или None"""
+        cv_file = self.fetchone('SELECT * FROM cv_files WHERE file_unique_id = ?', (file_unique_id,))
+        if cv_file:
+            cv_file['cv_analysis'] = json.loads(cv_file['cv_analysis'] or '{}')
+        return cv_file
+    
+    def save_cv_file(self, file_unique_id, file_name, cv_text, cv_analysis):
+        """Кэширует текст и разбор файла резюме"""
+        with self.transaction() as conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO cv_files (file_unique_id, file_name, cv_text, cv_analysis)
+                VALUES (?, ?, ?, ?)
+            ''', (file_unique_id, file_name, cv_text, json.dumps(cv_analysis)))
+    
+    def get_all_user_ids(self):
+        """Получает ID всех пользователей, не заблокировавших бота"""
+        return [row[0] for row in self.connection.execute('SELECT user_id FROM users WHERE blocked_at IS NULL')]
+    
+    def create_broadcast(self, text, admin_chat_id):
+        """Создает задание рассылки со списком получателей. Возвращает (ID, число получателей)"""
+        with self.transaction() as conn:
+            broadcast_id = conn.execute(
+                'INSERT INTO broadcasts (text, admin_chat_id) VALUES (?, ?)', (text, admin_chat_id)
+            ).lastrowid
+            total = conn.execute('''
+                INSERT INTO broadcast_recipients (broadcast_id, user_id)
+                SELECT ?, user_id FROM users WHERE blocked_at IS NULL
+            ''', (broadcast_id,)).rowcount
+            conn.execute('UPDATE broadcasts SET total = ? WHERE id = ?', (total, broadcast_id))
+        return broadcast_id, total
+    
+    def get_broadcast(self, broadcast_id):
+        return self.fetchone('SELECT * FROM broadcasts WHERE id = ?', (broadcast_id,))
+    
+    def get_running_broadcasts(self):
+        return self.fetchall("SELECT * FROM broadcasts WHERE status = 'running' ORDER BY id")
+    
+    def set_broadcast_progress_message(self, broadcast_id, message_id):
+        with self.transaction() as conn:
+            conn.execute('UPDATE broadcasts SET progress_message_id = ? WHERE id = ?', (message_id, broadcast_id))
+    
+    def get_pending_recipients(self, broadcast_id, after_user_id=0, limit=200):
+        """Следующие неотправленные получатели по первичному ключу (broadcast_id, user_id)"""
+        return [row[0] for row in self.connection.execute('''
+            SELECT user_id FROM broadcast_recipients
+            WHERE broadcast_id = ? AND user_id > ? AND status = 'pending'
+            ORDER BY user_id LIMIT ?
+        ''', (broadcast_id, after_user_id, limit))]
+    
+    def save_broadcast_results(self, broadcast_id, results):
+        """Сохраняет результаты отправки (user_id, статус, ошибка) и помечает заблокировавших бота"""
+        counts = {'sent': 0, 'blocked': 0, 'failed': 0}
+        for _, status, _ in results:
+            counts[status] += 1
+        
+        with self.transaction() as conn:
+            conn.executemany('''
+                UPDATE broadcast_recipients SET status = ?, error = ?
+                WHERE broadcast_id = ? AND user_id = ?
+            ''', [(status, error, broadcast_id, user_id) for user_id, status, error in results])
+            conn.execute('''
+                UPDATE broadcasts
+                SET sent_count = sent_count + ?, blocked_count = blocked_count + ?, failed_count = failed_count + ?
+                WHERE id = ?
+            ''', (counts['sent'], counts['blocked'], counts['failed'], broadcast_id))
+            self.mark_users_blocked([user_id for user_id, status, _ in results if status == 'blocked'])
+    
+    def mark_users_blocked(self, user_ids):
+        """Помечает пользователей, заблокировавших бота: рассылки и уведомления их пропускают"""
+        if not user_ids:
+            return
+        with self.transaction() as conn:
+            conn.executemany(
+                'UPDATE users SET blocked_at = CURRENT_TIMESTAMP WHERE user_id = ?',
+                [(user_id,) for user_id in user_ids]
+            )
+        self._refresh_audience(user_ids)
+    
+    def finish_broadcast(self, broadcast_id, status):
+        """Завершает выполняемую рассылку со статусом done или cancelled"""
+        with self.transaction() as conn:
+            conn.execute('''
+                UPDATE broadcasts SET status = ?, finished_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND status = 'running'
+            ''', (status, broadcast_id))
+    
+    def get_ingestion_state(self, name):
+        """Состояние источника по адресам: валидаторы и high-water mark"""
+        row = self.fetchone('SELECT state FROM ingestion_sources WHERE name = ?', (name,))
+        return json.loads(row['state']) if row else {}
+    
+    def save_ingestion_run(self, name, state, counts, not_modified, errors, seconds):
+        """Сохраняет состояние источника после загрузки и добавляет ее к счетчикам"""
+        with self.transaction() as conn:
+            conn.execute('''
+                INSERT INTO ingestion_sources (name) VALUES (?) ON CONFLICT (name) DO NOTHING
+            ''', (name,))
+            conn.execute('''
+                UPDATE ingestion_sources SET
+                    state = ?, runs = runs + 1, errors = errors + ?,
+                    fetched_count = fetched_count + ?, inserted_count = inserted_count + ?,
+                    updated_count = updated_count + ?, skipped_count = skipped_count + ?,
+                    failed_count = failed_count + ?, not_modified_count = not_modified_count + ?,
+                    total_seconds = total_seconds + ?, last_error = ?, last_run_at = CURRENT_TIMESTAMP
+                WHERE name = ?
+            ''', (
+                json.dumps(state), len(errors),
+                counts['fetched'], counts['inserted'], counts['updated'], counts['skipped'],
+                counts['failed'], not_modified, seconds, errors[-1] if errors else None, name
+            ))
+    
+    def get_ingestion_stats(self):
+        """Итоговые счетчики загрузки по источникам"""
+        return self.fetchall('SELECT * FROM ingestion_sources ORDER BY name')
+    
+    def get_conversation_state(self, kind, key):
+        """Сохраненное состояние диалога (JSON) или None"""
+        row = self.connection.execute(
+            'SELECT data FROM conversation_state WHERE kind = ? AND key = ?', (kind, key)
+        ).fetchone()
+        return row[0] if row else None
+    
+    def save_conversation_states(self, changes):
+        """Записывает изменения состояния одной транзакцией: (kind, key, JSON или None для удаления)"""
+        with self.transaction() as conn:
+            conn.executemany('''
+                INSERT INTO conversation_state (kind, key, data) VALUES (?, ?, ?)
+                ON CONFLICT (kind, key) DO UPDATE SET data = excluded.data, updated_at = CURRENT_TIMESTAMP
+            ''', [change for change in changes if change[2] is not None])
+            conn.executemany(
+                'DELETE FROM conversation_state WHERE kind = ? AND key = ?',
+                [(kind, key) for kind, key, data in changes if data is None]
+            )
+    
     def save_vacancy(self, vacancy_data):
-        """Сохраняет вакансию в базу"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT OR IGNORE INTO vacancies 
-            (title, company, salary_min, salary_max, currency, location, work_format,
-             description_short, requirements, apply_url, contacts, tags, industry, role, level, source)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            vacancy_data['title'],
-            vacancy_data.get('company'),
-            vacancy_data.get('salary_min'),
-            vacancy_data.get('salary_max'),
-            vacancy_data.get('currency', 'USD'),
-            vacancy_data.get('location', 'Remote'),
-            vacancy_data.get('work_format', 'remote'),
-            vacancy_data.get('description_short', ''),
-            vacancy_data.get('requirements', ''),
-            vacancy_data.get('apply_url', ''),
-            vacancy_data.get('contacts', ''),
-            vacancy_data.get('tags', ''),
-            vacancy_data.get('industry', ''),
-            vacancy_data.get('role', ''),
-            vacancy_data.get('level', ''),
-            vacancy_data.get('source', 'manual')
-        ))
-        
-        conn.commit()
-        conn.close()
-        return True
+        """Сохраняет вакансию в базу. Возвращает ID новой записи или None, если такая уже есть"""
+        with self.transaction() as conn:
+            cursor = conn.execute('''
+                INSERT INTO vacancies 
+                (title, company, salary_min, salary_max, currency, location, work_format,
+                 description_short, requirements, apply_url, contacts, tags, industry, role, level, source,
+                 fingerprint, relevance_score)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (fingerprint) DO NOTHING
+            ''', (
+                vacancy_data['title'],
+                vacancy_data.get('company'),
+                vacancy_data.get('salary_min'),
+                vacancy_data.get('salary_max'),
+                vacancy_data.get('currency', 'USD'),
+                vacancy_data.get('location', 'Remote'),
+                vacancy_data.get('work_format', 'remote'),
+                vacancy_data.get('description_short', ''),
+                vacancy_data.get('requirements', ''),
+                vacancy_data.get('apply_url', ''),
+                vacancy_data.get('contacts', ''),
+                vacancy_data.get('tags', ''),
+                vacancy_data.get('industry', ''),
+                vacancy_data.get('role', ''),
+                vacancy_data.get('level', ''),
+                vacancy_data.get('source', 'manual'),
+                vacancy_fingerprint(vacancy_data),
+                base_score(vacancy_data)
+            ))
+        
+        if not cursor.rowcount:
+            return None
+        self._notify_vacancies([self.get_vacancy(cursor.lastrowid)])
+        return cursor.lastrowid
     
-    def get_vacancies(self, limit=5, offset=0, filters=None):
-        """Получает вакансии из базы"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        query = "SELECT * FROM vacancies WHERE 1=1"
-        params = []
-        
-        if filters:
-            if filters.get('role'):
-                query += " AND role = ?"
-                params.append(filters['role'])
-            if filters.get('level'):
-                query += " AND level = ?"
-                params.append(filters['level'])
-            if filters.get('work_format'):
-                query += " AND work_format = ?"
-                params.append(filters['work_format'])
+    # Поля вакансии, которые обновляет повторный импорт
+    VACANCY_UPSERT_FIELDS = (
+        'title', 'company', 'salary_min', 'salary_max', 'currency', 'location', 'work_format',
+        'description_short', 'requirements', 'apply_url', 'contacts', 'tags', 'industry', 'role', 'level',
+    )
+    
+    def upsert_vacancies(self, vacancies):
+        """Пакетная запись вакансий: новые добавляются, изменившиеся обновляются.
         
-        query += " ORDER BY created_at DESC LIMIT ? OFFSET ?"
-        params.extend([limit, offset])
+        Дубликаты определяются по отпечатку (vacancy_fingerprint), в том числе
+        внутри пачки - остается последняя версия. Слушатели вызываются один раз
+        на пачку. Возвращает счетчики inserted, updated, skipped.
+        """
+        fields = self.VACANCY_UPSERT_FIELDS
+        batch = {}
+        for vacancy in vacancies:
+            batch[vacancy_fingerprint(vacancy)] = vacancy
+        counts = {'inserted': 0, 'updated': 0, 'skipped': len(vacancies) - len(batch)}
+        
+        with self.transaction() as conn:
+            existing = {}
+            fingerprints = list(batch)
+            # Лимит переменных SQLite: проверяем существующие вакансии порциями
+            for start in range(0, len(fingerprints), 500):
+                chunk = fingerprints[start:start + 500]
+                existing.update(
+                    (row['fingerprint'], row) for row in conn.execute(
+                        f"SELECT id, fingerprint, {', '.join(fields)} FROM vacancies "
+                        f"WHERE fingerprint IN ({', '.join('?' * len(chunk))})", chunk
+                    )
+                )
+            
+            new_rows, changed_rows = [], []
+            for fingerprint, vacancy in batch.items():
+                values = [vacancy.get(field) for field in fields]
+                row = existing.get(fingerprint)
+                if row is None:
+                    new_rows.append((*values, vacancy.get('source', 'import'), fingerprint, base_score(vacancy)))
+                elif values != [row[field] for field in fields]:
+                    changed_rows.append((*values, base_score(vacancy), row['id']))
+                else:
+                    counts['skipped'] += 1
+            
+            conn.executemany(f'''
+                INSERT INTO vacancies ({', '.join(fields)}, source, fingerprint, relevance_score)
+                VALUES ({', '.join('?' * (len(fields) + 3))})
+            ''', new_rows)
+            conn.executemany(f'''
+                UPDATE vacancies SET {', '.join(f'{field} = ?' for field in fields)}, relevance_score = ?
+                WHERE id = ?
+            ''', changed_rows)
+        
+        counts['inserted'] = len(new_rows)
+        counts['updated'] = len(changed_rows)
+        if new_rows:
+            self._notify_vacancies(self._get_vacancies_by_fingerprints([row[-2] for row in new_rows]), created=True)
+        if changed_rows:
+            self._notify_vacancies(self.get_vacancies_by_ids(row[-1] for row in changed_rows), created=False)
+        return counts
+    
+    def _get_vacancies_by_fingerprints(self, fingerprints):
+        vacancies = []
+        for start in range(0, len(fingerprints), 500):
+            chunk = fingerprints[start:start + 500]
+            vacancies.extend(self.fetchall(
+                f"SELECT * FROM vacancies WHERE fingerprint IN ({', '.join('?' * len(chunk))})", chunk
+            ))
+        return vacancies
+    
+    def add_vacancy_listener(self, listener):
+        """Подписка на новые и измененные вакансии.
         
-        cursor.execute(query, params)
-        rows = cursor.fetchall()
+        listener(vacancies, created) вызывается после записи: vacancies - список
+        dict, created - True для новых вакансий и False для обновленных.
+        """
+        self._vacancy_listeners.append(listener)
+    
+    def _notify_vacancies(self, vacancies, created=True):
+        for listener in self._vacancy_listeners:
+            try:
+                listener(vacancies, created)
+            except Exception:
+                logger.exception("Ошибка в обработчике новых вакансий")
+    
+    def _index_vacancies(self, vacancies, created):
+        """Держит индекс ранжирования в актуальном состоянии"""
+        if self.ranking.loaded:
+            for vacancy in vacancies:
+                self.ranking.add(vacancy)
+    
+    def _ranking_index(self):
+        """Индекс ранжирования; загружается при первом обращении"""
+        if not self.ranking.loaded:
+            with self._ranking_lock:
+                if not self.ranking.loaded:
+                    self.ranking.load(self.fetchall('''
+                        SELECT id, role, level, work_format, salary_min, salary_max, tags, relevance_score
+                        FROM vacancies
+                    '''))
+        return self.ranking
+    
+    # Пользователи, которым отправляются уведомления о новых вакансиях
+    AUDIENCE_QUERY = '''
+        SELECT user_id, role, level, work_format, salary_min FROM users
+        WHERE search_active AND consent_given AND blocked_at IS NULL AND role IS NOT NULL
+    '''
+    
+    def _audience_index(self):
+        """Индекс аудитории уведомлений; загружается при первом обращении"""
+        if not self.audience.loaded:
+            with self._ranking_lock:
+                if not self.audience.loaded:
+                    self.audience.load(self.fetchall(self.AUDIENCE_QUERY))
+        return self.audience
+    
+    def _refresh_audience(self, user_ids):
+        """Перечитывает пользователей в индекс аудитории после изменения профиля"""
+        if not self.audience.loaded:
+            return
+        for user_id in user_ids:
+            self.audience.update(user_id, self.fetchone(self.AUDIENCE_QUERY + ' AND user_id = ?', (user_id,)))
+    
+    def match_audience(self, vacancies):
+        """Пользователи, которым подходят вакансии: {user_id: [ID вакансий]}"""
+        index = self._audience_index()
+        matches = {}
+        for vacancy in vacancies:
+            for user_id in index.match(vacancy):
+                matches.setdefault(user_id, []).append(vacancy['id'])
+        return matches
+    
+    def search_vacancy_ids(self, text, limit=SEARCH_MAX_RESULTS):
+        """ID вакансий, подходящих под запрос, лучшие совпадения по BM25 первыми"""
+        match = search_match_expression(text)
+        if not match:
+            return []
+        return [row[0] for row in self.connection.execute(f'''
+            SELECT rowid FROM vacancies_fts
+            WHERE vacancies_fts MATCH ?
+            ORDER BY bm25(vacancies_fts, {', '.join(map(str, SEARCH_WEIGHTS))}), rowid
+            LIMIT ?
+        ''', (match, limit))]
+    
+    def get_search_results(self, text, vacancy_ids):
+        """Вакансии в порядке vacancy_ids с search_snippet - фрагментом с отмеченными совпадениями.
         
-        columns = [description[0] for description in cursor.description]
-        vacancies = [dict(zip(columns, row)) for row in rows]
+        Удаленные вакансии пропускаются; у вакансии, которая после изменения
+        перестала подходить под запрос, search_snippet - None.
+        """
+        vacancies = self.get_vacancies_by_ids(vacancy_ids)
+        if not vacancies:
+            return []
+        
+        ids = [vacancy['id'] for vacancy in vacancies]
+        snippets = dict(self.connection.execute(f'''
+            SELECT rowid, snippet(vacancies_fts, -1, ?, ?, '…', ?)
+            FROM vacancies_fts
+            WHERE vacancies_fts MATCH ? AND rowid IN ({', '.join('?' * len(ids))})
+        ''', [SNIPPET_OPEN, SNIPPET_CLOSE, SEARCH_SNIPPET_TOKENS, search_match_expression(text), *ids]))
+        for vacancy in vacancies:
+            vacancy['search_snippet'] = snippets.get(vacancy['id'])
+        return vacancies
+    
+    def start_search(self, user_id, text):
+        """Новый поиск пользователя: снимок результатов заменяет прежний (SearchSession)"""
+        session = SearchSession(text, self.search_vacancy_ids(text))
+        self.search_sessions.put(user_id, session)
+        return session
+    
+    def get_search_page(self, user_id, search_id, offset=0, limit=SEARCH_PAGE_SIZE):
+        """(вакансии, всего результатов) страницы снимка search_id; None, если снимка уже нет"""
+        session = self.search_sessions.get(user_id)
+        if session is None or session.search_id != search_id:
+            return None
+        return self.get_search_results(session.text, session.ids[offset:offset + limit]), len(session.ids)
+    
+    def get_ranked_vacancies(self, user, limit=FEED_PAGE_SIZE, after_id=None):
+        """Лента, отсортированная по релевантности профилю пользователя.
         
-        conn.close()
+        Скрытые и откликнутые вакансии исключаются; after_id - последняя показанная
+        вакансия. Обход ленты сохраняется между страницами (FeedSession), поэтому
+        глубокая страница стоит как первая. Без сохраненного обхода (перезапуск,
+        вытеснение из кэша, смена профиля) курсором служит оценка after_id.
+        """
+        index = self._ranking_index()
+        profile = UserProfile(user)
+        excluded = self.get_exclusions(user['user_id'])
+        
+        session = self.feed_sessions.get(user['user_id']) if after_id else None
+        if (session is None or session.profile_key != profile.key or session.scan.stale
+                or after_id not in session.positions):
+            after = None
+            if after_id:
+                score = index.score(profile, after_id)
+                after = (score, after_id) if score is not None else None
+            session = FeedSession(index.scan(profile, exclude=excluded, after=after), profile.key)
+            self.feed_sessions.put(user['user_id'], session)
+            after_id = None
+        
+        ranked = session.page(after_id, limit, excluded)
+        scores = dict((vacancy_id, score) for score, vacancy_id in ranked)
+        vacancies = self.get_vacancies_by_ids(vacancy_id for _, vacancy_id in ranked)
+        for vacancy in vacancies:
+            vacancy['match_score'] = scores[vacancy['id']]
         return vacancies
     
+    def get_exclusions(self, user_id):
+        """Скрытые и откликнутые вакансии пользователя (ExclusionSet); из базы - один раз"""
+        placeholders = ', '.join('?' * len(EXCLUDED_ACTIONS))
+        return self.exclusions.load(user_id, lambda: [row[0] for row in self.connection.execute(
+            f"SELECT vacancy_id FROM user_actions WHERE user_id = ? AND action IN ({placeholders})",
+            (user_id, *EXCLUDED_ACTIONS)
+        )])
+    
     def get_vacancy(self, vacancy_id):
         """Получает вакансию по ID"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM vacancies WHERE id = ?', (vacancy_id,))
-        row = cursor.fetchone()
-        
-        if not row:
-            conn.close()
-            return None
-        
-        columns = [description[0] for description in cursor.description]
-        vacancy = dict(zip(columns, row))
-        
-        conn.close()
-        return vacancy
+        return self.fetchone('SELECT * FROM vacancies WHERE id = ?', (vacancy_id,))
+    
+    def get_vacancies_by_ids(self, vacancy_ids):
+        """Получает вакансии по списку ID одним запросом, сохраняя порядок списка"""
+        vacancy_ids = list(vacancy_ids)
+        if not vacancy_ids:
+            return []
+        
+        placeholders = ', '.join('?' * len(vacancy_ids))
+        rows = {
+            row['id']: row
+            for row in self.fetchall(f"SELECT * FROM vacancies WHERE id IN ({placeholders})", vacancy_ids)
+        }
+        return [rows[vacancy_id] for vacancy_id in vacancy_ids if vacancy_id in rows]
     
     def save_user_action(self, user_id, vacancy_id, action):
         """Сохраняет действие пользователя"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO user_actions (user_id, vacancy_id, action)
-            VALUES (?, ?, ?)
-        ''', (user_id, vacancy_id, action))
-        
-        conn.commit()
-        conn.close()
+        with self.transaction() as conn:
+            conn.execute('''
+                INSERT INTO user_actions (user_id, vacancy_id, action)
+                VALUES (?, ?, ?)
+            ''', (user_id, vacancy_id, action))
+        
+        if action in EXCLUDED_ACTIONS:
+            self.exclusions.note(user_id, vacancy_id)
     
     def get_user_actions(self, user_id, action_type=None):
         """Получает действия пользователя"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
         if action_type:
-            cursor.execute('SELECT vacancy_id FROM user_actions WHERE user_id = ? AND action = ?', (user_id, action_type))
+            rows = self.connection.execute(
+                'SELECT vacancy_id FROM user_actions WHERE user_id = ? AND action = ?',
+                (user_id, action_type)
+            )
         else:
-            cursor.execute('SELECT vacancy_id FROM user_actions WHERE user_id = ?', (user_id,))
+            rows = self.connection.execute('SELECT vacancy_id FROM user_actions WHERE user_id = ?', (user_id,))
         
-        results = [row[0] for row in cursor.fetchall()]
-        conn.close()
-        return results
+        return [row[0] for row in rows]
     
-    def get_subscription(self, user_id):
-        """Получает информацию о подписке"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    # Последнее из действий saved/unsaved по вакансии определяет, сохранена ли она
+    SAVED_STATE_QUERY = '''
+        SELECT vacancy_id, last_id FROM (
+            SELECT vacancy_id, action, MAX(id) AS last_id
+            FROM user_actions
+            WHERE user_id = ? AND action IN ('saved', 'unsaved')
+            GROUP BY vacancy_id
+        )
+        WHERE action = 'saved'
+    '''
+    
+    def get_saved_vacancy_ids(self, user_id):
+        """ID вакансий, которые сейчас сохранены у пользователя"""
+        return [row[0] for row in self.connection.execute(self.SAVED_STATE_QUERY, (user_id,))]
+    
+    def get_saved_vacancies(self, user_id, limit=SAVED_PAGE_SIZE, before=None):
+        """Страница сохраненных вакансий, новые сверху.
         
-        cursor.execute('SELECT * FROM subscriptions WHERE user_id = ?', (user_id,))
-        row = cursor.fetchone()
+        Возвращает список пар (курсор, вакансия); курсор - ID действия сохранения,
+        следующая страница запрашивается с before=курсор последней пары.
+        """
+        query = self.SAVED_STATE_QUERY
+        params = [user_id]
+        if before:
+            query += " AND last_id < ?"
+            params.append(before)
+        query += " ORDER BY last_id DESC LIMIT ?"
+        params.append(limit)
+        
+        saved = self.connection.execute(query, params).fetchall()
+        vacancies = {vacancy['id']: vacancy for vacancy in self.get_vacancies_by_ids(row[0] for row in saved)}
+        return [(row[1], vacancies[row[0]]) for row in saved if row[0] in vacancies]
+    
+    def set_saved(self, user_id, vacancy_id, saved=True):
+        """Сохраняет вакансию или убирает из сохраненных. Возвращает False, если состояние не изменилось"""
+        with self.transaction() as conn:
+            row = conn.execute('''
+                SELECT action FROM user_actions
+                WHERE user_id = ? AND vacancy_id = ? AND action IN ('saved', 'unsaved')
+                ORDER BY id DESC LIMIT 1
+            ''', (user_id, vacancy_id)).fetchone()
+            if (row is not None and row[0] == 'saved') == saved:
+                return False
+            self.save_user_action(user_id, vacancy_id, 'saved' if saved else 'unsaved')
+        return True
+    
+    def apply_to_vacancy(self, user_id, vacancy_id):
+        """Отклик на вакансию одной транзакцией.
+        
+        Бесплатный отклик списывается условным UPDATE ... RETURNING: счетчик
+        не уходит ниже нуля и не списывается дважды даже при одновременных
+        нажатиях. Повторный отклик на ту же вакансию ничего не списывает.
+        Возвращает dict: status ('applied', 'repeat', 'no_quota', 'not_found'),
+        vacancy, is_premium и remaining - оставшиеся бесплатные отклики.
+        """
+        now = datetime.now().isoformat(timespec='seconds')
+        with self.transaction() as conn:
+            vacancy = conn.execute('SELECT * FROM vacancies WHERE id = ?', (vacancy_id,)).fetchone()
+            if vacancy is None:
+                return {'status': 'not_found', 'vacancy': None, 'is_premium': False, 'remaining': None}
+            vacancy = dict(vacancy)
+            
+            conn.execute('INSERT OR IGNORE INTO subscriptions (user_id) VALUES (?)', (user_id,))
+            if conn.execute(
+                'SELECT 1 FROM applications WHERE user_id = ? AND vacancy_id = ?', (user_id, vacancy_id)
+            ).fetchone():
+                subscription = conn.execute(
+                    f'SELECT {PREMIUM_ACTIVE_SQL} AS premium, free_applications FROM subscriptions WHERE user_id = ?',
+                    (now, user_id)
+                ).fetchone()
+                return {'status': 'repeat', 'vacancy': vacancy, 'is_premium': bool(subscription['premium']),
+                        'remaining': subscription['free_applications']}
+            
+            # Истекший, но еще не снятый проверкой Premium уже не дает безлимита
+            charge = conn.execute(f'''
+                UPDATE subscriptions
+                SET free_applications = free_applications - (CASE WHEN {PREMIUM_ACTIVE_SQL} THEN 0 ELSE 1 END),
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE user_id = ? AND (({PREMIUM_ACTIVE_SQL}) OR free_applications > 0)
+                RETURNING {PREMIUM_ACTIVE_SQL} AS premium, free_applications
+            ''', (now, user_id, now, now)).fetchone()
+            if charge is None:
+                return {'status': 'no_quota', 'vacancy': vacancy, 'is_premium': False, 'remaining': 0}
+            
+            is_premium = bool(charge['premium'])
+            conn.execute(
+                'INSERT INTO applications (user_id, vacancy_id, charged) VALUES (?, ?, ?)',
+                (user_id, vacancy_id, not is_premium)
+            )
+            conn.execute(
+                "INSERT INTO user_actions (user_id, vacancy_id, action) VALUES (?, ?, 'applied')",
+                (user_id, vacancy_id)
+            )
         
-        if not row:
-            cursor.execute('INSERT INTO subscriptions (user_id, free_applications) VALUES (?, ?)', (user_id, 10))
-            conn.commit()
-            cursor.execute('SELECT * FROM subscriptions WHERE user_id = ?', (user_id,))
-            row = cursor.fetchone()
+        self.exclusions.note(user_id, vacancy_id)
+        return {'status': 'applied', 'vacancy': vacancy, 'is_premium': is_premium,
+                'remaining': charge['free_applications']}
+    
+    def get_subscription(self, user_id):
+        """Получает информацию о подписке (только чтение; без строки - бесплатный тариф).
         
-        columns = [description[0] for description in cursor.description]
-        subscription = dict(zip(columns, row))
-        conn.close()
+        is_premium учитывает premium_until: истекшая подписка уже бесплатная,
+        даже если фоновая проверка еще не сняла флаг в базе.
+        """
+        subscription = self.fetchone('SELECT * FROM subscriptions WHERE user_id = ?', (user_id,))
+        if subscription:
+            until = subscription['premium_until']
+            subscription['is_premium'] = bool(subscription['is_premium']) and (
+                until is None or until > datetime.now().isoformat(timespec='seconds')
+            )
+            return subscription
         
-        return subscription
+        return {
+            'user_id': user_id,
+            'is_premium': False,
+            'premium_until': None,
+            'free_applications': FREE_APPLICATIONS,
+        }
+    
+    def get_user_bundle(self, user_id):
+        """Пользователь и его подписка за одно обращение к пулу базы"""
+        return self.get_user(user_id), self.get_subscription(user_id)
+    
+    def extend_premium(self, user_id, days=PREMIUM_DAYS):
+        """Включает Premium или продлевает действующий на days дней. Возвращает новую дату окончания"""
+        now = datetime.now()
+        with self.transaction() as conn:
+            conn.execute('INSERT OR IGNORE INTO subscriptions (user_id) VALUES (?)', (user_id,))
+            row = conn.execute(f'''
+                SELECT premium_until FROM subscriptions WHERE user_id = ? AND {PREMIUM_ACTIVE_SQL}
+            ''', (user_id, now.isoformat(timespec='seconds'))).fetchone()
+            start = max(now, datetime.fromisoformat(row[0])) if row and row[0] else now
+            until = (start + timedelta(days=days)).isoformat(timespec='seconds')
+            conn.execute('''
+                UPDATE subscriptions SET is_premium = 1, premium_until = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE user_id = ?
+            ''', (until, user_id))
+        return until
+    
+    def expire_premium(self, limit=500):
+        """Снимает истекший Premium пачкой и возвращает бесплатную квоту. ID пользователей"""
+        now = datetime.now().isoformat(timespec='seconds')
+        with self.transaction() as conn:
+            return [row[0] for row in conn.execute('''
+                UPDATE subscriptions
+                SET is_premium = 0, free_applications = ?, reminded_until = NULL, updated_at = CURRENT_TIMESTAMP
+                WHERE user_id IN (
+                    SELECT user_id FROM subscriptions WHERE is_premium AND premium_until <= ? LIMIT ?
+                )
+                RETURNING user_id
+            ''', (FREE_APPLICATIONS, now, limit)).fetchall()]
+    
+    def get_premium_reminders(self, days, after_user_id=0, limit=500):
+        """(user_id, premium_until) подписок, истекающих в ближайшие days дней, без напоминания.
+        
+        Выборка идет по user_id после after_user_id: неотправленные напоминания
+        остаются в выборке, и проверка не должна получать их снова в том же проходе.
+        """
+        now = datetime.now()
+        return [tuple(row) for row in self.connection.execute('''
+            SELECT s.user_id, s.premium_until FROM subscriptions s
+            JOIN users u ON u.user_id = s.user_id
+            WHERE s.is_premium AND s.premium_until > ? AND s.premium_until <= ?
+              AND s.reminded_until IS NOT s.premium_until AND u.blocked_at IS NULL AND s.user_id > ?
+            ORDER BY s.user_id
+            LIMIT ?
+        ''', (now.isoformat(timespec='seconds'), (now + timedelta(days=days)).isoformat(timespec='seconds'),
+              after_user_id, limit))]
+    
+    def mark_premium_reminded(self, reminders):
+        """Отмечает напоминания отправленными: пары (user_id, premium_until)"""
+        with self.transaction() as conn:
+            conn.executemany(
+                'UPDATE subscriptions SET reminded_until = ? WHERE user_id = ?',
+                [(premium_until, user_id) for user_id, premium_until in reminders]
+            )
     
     def update_subscription(self, user_id, updates):
         """Обновляет подписку пользователя"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
         set_clause = ", ".join([f"{key} = ?" for key in updates.keys()])
         values = list(updates.values())
         values.append(user_id)
         
-        cursor.execute(f'UPDATE subscriptions SET {set_clause} WHERE user_id = ?', values)
-        conn.commit()
-        conn.close()
+        with self.transaction() as conn:
+            conn.execute('INSERT OR IGNORE INTO subscriptions (user_id) VALUES (?)', (user_id,))
+            conn.execute(f'UPDATE subscriptions SET {set_clause} WHERE user_id = ?', values)
     
     def get_stats(self):
         """Получает статистику бота"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
+        conn = self.connection
         stats = {}
         
-        cursor.execute('SELECT COUNT(*) FROM users')
-        stats['users_count'] = cursor.fetchone()[0]
+        stats['users_count'] = conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+        stats['vacancies_count'] = conn.execute('SELECT COUNT(*) FROM vacancies').fetchone()[0]
+        stats['premium_count'] = conn.execute(
+            f'SELECT COUNT(*) FROM subscriptions WHERE {PREMIUM_ACTIVE_SQL}',
+            (datetime.now().isoformat(timespec='seconds'),)
+        ).fetchone()[0]
+        stats['applications_count'] = conn.execute('SELECT COUNT(*) FROM applications').fetchone()[0]
         
-        cursor.execute('SELECT COUNT(*) FROM vacancies')
-        stats['vacancies_count'] = cursor.fetchone()[0]
+        return stats
+
+class AsyncDatabase:
+    """Асинхронный фасад над DatabaseManager.
+    
+    Каждый метод менеджера доступен как корутина и выполняется в отдельном
+    пуле потоков, поэтому медленный запрос или ожидание блокировки записи
+    не останавливает event loop. У каждого потока пула свое соединение.
+    """
+    
+    SYNC_ONLY = {'transaction', 'fetchone', 'fetchall', 'close'}
+    
+    def __init__(self, manager, max_workers=DB_EXECUTOR_WORKERS):
+        self.sync = manager
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='db')
+    
+    async def run(self, func, *args, **kwargs):
+        """Выполняет синхронную функцию в пуле потоков базы"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+    
+    def __getattr__(self, name):
+        method = getattr(type(self.sync), name, None)
+        if name.startswith('_') or name in self.SYNC_ONLY or not callable(method):
+            raise AttributeError(name)
         
-        cursor.execute('SELECT COUNT(*) FROM subscriptions WHERE is_premium = 1')
-        stats['premium_count'] = cursor.fetchone()[0]
+        bound = getattr(self.sync, name)
         
-        cursor.execute('SELECT COUNT(*) FROM user_actions WHERE action = "applied"')
-        stats['applications_count'] = cursor.fetchone()[0]
+        @functools.wraps(bound)
+        async def wrapper(*args, **kwargs):
+            return await self.run(bound, *args, **kwargs)
         
-        conn.close()
-        return stats
+        setattr(self, name, wrapper)
+        return wrapper
+    
+    def close(self):
+        """Останавливает пул потоков и закрывает соединения"""
+        self._executor.shutdown(wait=True)
+        self.sync.close()
+
+class RequestScope:
+    """Данные пользователя в пределах одного апдейта.
+    
+    Пользователь и подписка загружаются одним обращением к базе при первом
+    запросе, наборы действий - по требованию; дальше все берется из памяти.
+    """
+    
+    def __init__(self, db, user_id):
+        self.db = db
+        self.user_id = user_id
+        self._bundle = None
+        self._actions = {}
+    
+    async def _load(self):
+        if self._bundle is None:
+            self._bundle = await self.db.get_user_bundle(self.user_id)
+        return self._bundle
+    
+    async def user(self):
+        """Профиль пользователя или None"""
+        return (await self._load())[0]
+    
+    async def subscription(self):
+        """Подписка пользователя"""
+        return (await self._load())[1]
+    
+    async def actions(self, action):
+        """Множество ID вакансий с данным действием пользователя"""
+        if action not in self._actions:
+            self._actions[action] = set(await self.db.get_user_actions(self.user_id, action))
+        return self._actions[action]
+    
+    async def saved_ids(self):
+        """Множество ID вакансий, сохраненных сейчас (с учетом удалений)"""
+        if 'saved' not in self._actions:
+            self._actions['saved'] = set(await self.db.get_saved_vacancy_ids(self.user_id))
+        return self._actions['saved']
 
 class SmartJobBot:
-    def __init__(self, token):
-        self.application = Application.builder().token(token).build()
-        self.db = DatabaseManager(DB_PATH)
+    def __init__(self, token, concurrency=MAX_CONCURRENT_UPDATES, metrics=METRICS_ENABLED, request=None):
+        # Выключенные метрики ничего не оборачивают
+        self.metrics = Metrics(metrics)
+        manager = DatabaseManager(DB_PATH)
+        self.metrics.instrument_methods(manager, 'db', exclude=AsyncDatabase.SYNC_ONLY)
+        self.db = AsyncDatabase(manager)
+        # Анкета и действия администратора (context.user_data) переживают перезапуск
+        self.persistence = SQLitePersistence(self.db)
+        builder = (
+            Application.builder()
+            .token(token)
+            .persistence(self.persistence)
+            # Разные пользователи обрабатываются параллельно, апдейты одного - по порядку
+            .concurrent_updates(PerUserUpdateProcessor(concurrency))
+            .post_init(self.post_init)
+            .post_stop(self.post_stop)
+        )
+        # request подменяет запросы к Bot API (нагрузочный прогон без Telegram, см. loadtest.py)
+        if request is not None:
+            builder.request(request)
+        elif self.metrics.enabled:
+            builder.request(self.metrics.telegram_request())
+        self.application = builder.build()
+        self.cv_analyzer = CVAnalyzer()
+        self.documents = DocumentProcessor(self.db, self.cv_analyzer)
+        self.document_source = TelegramDocumentSource(self.application.bot)
+        self.sender = OutboundSender(self.application.bot)
+        self.broadcasts = BroadcastEngine(self.db, self.sender)
+        self.alerts = AlertDispatcher(self.db, self.sender)
+        self.premium = PremiumSweeper(self.db, self.sender)
+        self.cards = VacancyCards()
+        self.db.sync.add_vacancy_listener(self.cards.on_vacancies)
+        sources = load_sources(INGESTION_SOURCES_FILE) if os.path.exists(INGESTION_SOURCES_FILE) else []
+        self.ingestion = IngestionScheduler(self.db, sources)
         self.setup_handlers()
+        self.metrics.instrument_router(self.router)
+        self.metrics.instrument_application(self.application, skip=(self.router.dispatch,))
+    
+    async def post_init(self, application):
+        """После запуска приложения: продолжаем прерванные рассылки, включаем уведомления и фоновые задачи"""
+        await self.broadcasts.resume()
+        self.alerts.start()
+        self.ingestion.start(application.job_queue)
+        self.premium.start(application.job_queue)
+        self.metrics.start_dump(METRICS_FILE)
+    
+    async def post_stop(self, application):
+        """Перед остановкой: прерываем фоновые рассылки (их прогресс сохранен в базе) и уведомления"""
+        await self.metrics.stop_dump()
+        await self.premium.stop()
+        await self.ingestion.stop()
+        await self.alerts.stop()
+        await self.broadcasts.shutdown()
     
     def setup_handlers(self):
         """Настройка обработчиков команд"""
@@ -500,18 +1744,55 @@ class SmartJobBot:
         self.application.add_handler(CommandHandler("profile", self.profile))
         self.application.add_handler(CommandHandler("feed", self.feed))
         self.application.add_handler(CommandHandler("saved", self.saved))
+        self.application.add_handler(CommandHandler("search", self.search))
         self.application.add_handler(CommandHandler("subscription", self.subscription))
         self.application.add_handler(CommandHandler("tools", self.tools))
         self.application.add_handler(CommandHandler("help", self.help))
         self.application.add_handler(CommandHandler("admin", self.admin))
         
-        # Обработчики callback запросов
-        self.application.add_handler(CallbackQueryHandler(self.handle_callback, pattern="^.*$"))
+        # Обработчики callback запросов: маршрут выбирается по коду из callback_data
+        self.setup_callbacks()
+        self.application.add_handler(CallbackQueryHandler(self.router.dispatch))
         
         # Обработчики сообщений
         self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message))
         self.application.add_handler(MessageHandler(filters.Document.ALL, self.handle_document))
     
+    def setup_callbacks(self):
+        """Таблица обработчиков inline-кнопок; коды и аргументы маршрутов - в callbacks.CALLBACK_ROUTES"""
+        self.router = CallbackRouter(is_admin=lambda user_id: user_id in ADMIN_USERS)
+        add = self.router.add
+        add('main_menu', self.show_main_menu_from_query)
+        add('setup_profile', self.start_onboarding_from_query)
+        add('role', self.handle_role_selection)
+        add('level', self.handle_level_selection)
+        add('work_format', self.handle_format_selection)
+        add('location_remote', self.handle_location_remote)
+        add('consent_yes', self.handle_consent_yes)
+        add('consent_no', self.handle_consent_no)
+        add('find_jobs', self.show_feed_from_query)
+        add('feed_page', self.handle_pagination)
+        add('search_page', self.handle_search_pagination)
+        add('apply', self.handle_apply, toast=True)
+        add('save', self.handle_save, toast=True)
+        add('unsave', self.handle_unsave)
+        add('hide', self.handle_hide, toast=True)
+        add('saved_list', self.show_saved_from_query)
+        add('saved_page', self.show_saved_from_query)
+        add('premium_info', self.show_premium_info)
+        add('buy_premium', self.handle_buy_premium)
+        add('tools_menu', self.show_tools_from_query)
+        add('help_menu', self.show_help_from_query)
+        add('update_cv', self.start_cv_update)
+        add('setup_filters', self.show_filters)
+        add('toggle_search', self.handle_toggle_search, toast=True)
+        add('admin_stats', self.show_admin_stats, admin=True)
+        add('admin_perf', self.show_admin_perf, admin=True)
+        add('admin_broadcast', self.start_admin_broadcast, admin=True)
+        add('admin_add_vacancy', self.start_admin_add_vacancy, admin=True)
+        add('admin_import', self.start_admin_import, admin=True)
+        add('broadcast_stop', self.handle_broadcast_stop, admin=True)
+    
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /start"""
         user = update.effective_user
@@ -524,14 +1805,14 @@ class SmartJobBot:
             'first_name': user.first_name,
             'last_name': user.last_name
         }
-        self.db.save_user(user_data)
+        await self.db.save_user(user_data)
         
         # Проверяем, есть ли уже профиль
-        existing_user = self.db.get_user(user_id)
+        existing_user = await self.db.get_user(user_id)
         
         if existing_user and existing_user.get('role'):
             # Пользователь уже прошел онбординг
-            await self.show_main_menu(update, f"👋 Добро пожаловать назад, {user.first_name}!")
+            await self.show_main_menu(update.message, f"👋 Добро пожаловать назад, {user.first_name}!")
         else:
             # Начинаем онбординг
             await self.start_onboarding(update)
@@ -553,20 +1834,20 @@ class SmartJobBot:
         # Выбор роли
         roles_keyboard = [
             [
-                InlineKeyboardButton("Engineering", callback_data="role_engineering"),
-                InlineKeyboardButton("Product", callback_data="role_product"),
+                InlineKeyboardButton("Engineering", callback_data=callback_data('role', 'engineering')),
+                InlineKeyboardButton("Product", callback_data=callback_data('role', 'product')),
             ],
             [
-                InlineKeyboardButton("AI/ML", callback_data="role_ai"),
-                InlineKeyboardButton("Design", callback_data="role_design"),
+                InlineKeyboardButton("AI/ML", callback_data=callback_data('role', 'ai')),
+                InlineKeyboardButton("Design", callback_data=callback_data('role', 'design')),
             ],
             [
-                InlineKeyboardButton("Marketing", callback_data="role_marketing"),
-                InlineKeyboardButton("Sales", callback_data="role_sales"),
+                InlineKeyboardButton("Marketing", callback_data=callback_data('role', 'marketing')),
+                InlineKeyboardButton("Sales", callback_data=callback_data('role', 'sales')),
             ],
             [
-                InlineKeyboardButton("Content", callback_data="role_content"),
-                InlineKeyboardButton("Support", callback_data="role_support"),
+                InlineKeyboardButton("Content", callback_data=callback_data('role', 'content')),
+                InlineKeyboardButton("Support", callback_data=callback_data('role', 'support')),
             ]
         ]
         
@@ -576,62 +1857,16 @@ class SmartJobBot:
             parse_mode='Markdown'
         )
     
-    async def handle_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Обработчик callback запросов"""
-        query = update.callback_query
-        await query.answer()
-        
-        data = query.data
-        user_id = query.from_user.id
-        
-        if data.startswith('role_'):
-            await self.handle_role_selection(query, context)
-        elif data.startswith('level_'):
-            await self.handle_level_selection(query, context)
-        elif data.startswith('format_'):
-            await self.handle_format_selection(query, context)
-        elif data == 'location_remote':
-            await self.handle_location_remote(query, context)
-        elif data == 'consent_yes':
-            await self.handle_consent_yes(query)
-        elif data == 'consent_no':
-            await self.handle_consent_no(query)
-        elif data.startswith('apply_'):
-            await self.handle_apply(query, context)
-        elif data.startswith('save_'):
-            await self.handle_save(query, context)
-        elif data.startswith('hide_'):
-            await self.handle_hide(query, context)
-        elif data == 'main_menu':
-            await self.show_main_menu_from_query(query)
-        elif data == 'setup_profile':
-            await self.start_onboarding_from_query(query)
-        elif data == 'find_jobs':
-            await self.show_feed_from_query(query)
-        elif data == 'premium_info':
-            await self.show_premium_info(query)
-        elif data == 'buy_premium':
-            await self.handle_buy_premium(query)
-        elif data.startswith('page_'):
-            await self.handle_pagination(query, context)
-        elif data == 'admin_stats':
-            await self.show_admin_stats(query)
-        elif data == 'admin_broadcast':
-            await self.start_admin_broadcast(query, context)
-        elif data == 'admin_add_vacancy':
-            await self.start_admin_add_vacancy(query, context)
-    
-    async def handle_role_selection(self, query, context):
+    async def handle_role_selection(self, query, context, role):
         """Обработка выбора роли"""
-        role = query.data.replace('role_', '')
         context.user_data['role'] = role
         
         # Выбор уровня
         level_keyboard = [
-            [InlineKeyboardButton("Junior", callback_data="level_junior")],
-            [InlineKeyboardButton("Middle", callback_data="level_middle")],
-            [InlineKeyboardButton("Senior", callback_data="level_senior")],
-            [InlineKeyboardButton("Lead", callback_data="level_lead")]
+            [InlineKeyboardButton("Junior", callback_data=callback_data('level', 'junior'))],
+            [InlineKeyboardButton("Middle", callback_data=callback_data('level', 'middle'))],
+            [InlineKeyboardButton("Senior", callback_data=callback_data('level', 'senior'))],
+            [InlineKeyboardButton("Lead", callback_data=callback_data('level', 'lead'))]
         ]
         
         await query.edit_message_text(
@@ -639,17 +1874,16 @@ class SmartJobBot:
             reply_markup=InlineKeyboardMarkup(level_keyboard)
         )
     
-    async def handle_level_selection(self, query, context):
+    async def handle_level_selection(self, query, context, level):
         """Обработка выбора уровня"""
-        level = query.data.replace('level_', '')
         context.user_data['level'] = level
         
         # Выбор формата работы
         format_keyboard = [
-            [InlineKeyboardButton("Remote", callback_data="format_remote")],
-            [InlineKeyboardButton("Hybrid", callback_data="format_hybrid")],
-            [InlineKeyboardButton("Office", callback_data="format_office")],
-            [InlineKeyboardButton("Contract", callback_data="format_contract")]
+            [InlineKeyboardButton("Remote", callback_data=callback_data('work_format', 'remote'))],
+            [InlineKeyboardButton("Hybrid", callback_data=callback_data('work_format', 'hybrid'))],
+            [InlineKeyboardButton("Office", callback_data=callback_data('work_format', 'office'))],
+            [InlineKeyboardButton("Contract", callback_data=callback_data('work_format', 'contract'))]
         ]
         
         await query.edit_message_text(
@@ -657,14 +1891,13 @@ class SmartJobBot:
             reply_markup=InlineKeyboardMarkup(format_keyboard)
         )
     
-    async def handle_format_selection(self, query, context):
+    async def handle_format_selection(self, query, context, work_format):
         """Обработка выбора формата работы"""
-        work_format = query.data.replace('format_', '')
         context.user_data['work_format'] = work_format
         
         # Выбор локации
         location_keyboard = [
-            [InlineKeyboardButton("Remote (любая локация)", callback_data="location_remote")],
+            [InlineKeyboardButton("Remote (любая локация)", callback_data=callback_data('location_remote'))],
         ]
         
         await query.edit_message_text(
@@ -687,8 +1920,16 @@ class SmartJobBot:
         text = update.message.text
         user_id = update.effective_user.id
         
+        # Новое резюме по кнопке "Обновить резюме" в профиле
+        if context.user_data.get('awaiting_cv'):
+            context.user_data.pop('awaiting_cv')
+            cv_analysis = await self.cv_analyzer.analyze(text)
+            await self.db.save_user({'user_id': user_id, 'cv_text': text, 'cv_analysis': cv_analysis})
+            skills = ', '.join(cv_analysis.get('skills', [])[:10]) or "не найдены"
+            await update.message.reply_text(f"📄 Резюме обновлено.\n🔧 Навыки: {skills}")
+        
         # Если пользователь в процессе настройки профиля
-        if 'role' in context.user_data and 'salary_min' not in context.user_data:
+        elif 'role' in context.user_data and 'salary_min' not in context.user_data:
             if text != '-':
                 # Парсим зарплату
                 try:
@@ -734,15 +1975,15 @@ class SmartJobBot:
                 'salary_max': context.user_data.get('salary_max'),
                 'currency': context.user_data.get('currency'),
                 'cv_text': text,
-                'cv_analysis': {'skills': [], 'experience': 'not_analyzed'}
+                'cv_analysis': await self.cv_analyzer.analyze(text)
             }
             
-            self.db.save_user(user_data)
+            await self.db.save_user(user_data)
             
             # Запрашиваем согласие
             consent_keyboard = [
-                [InlineKeyboardButton("✅ Согласен", callback_data="consent_yes")],
-                [InlineKeyboardButton("❌ Не согласен", callback_data="consent_no")]
+                [InlineKeyboardButton("✅ Согласен", callback_data=callback_data('consent_yes'))],
+                [InlineKeyboardButton("❌ Не согласен", callback_data=callback_data('consent_no'))]
             ]
             
             await update.message.reply_text(
@@ -760,23 +2001,16 @@ class SmartJobBot:
                 await update.message.reply_text("❌ Нет доступа")
                 return
             
-            # Получаем всех пользователей
-            all_users = self.get_all_users()
-            success_count = 0
-            
-            for user_id in all_users:
-                try:
-                    await context.bot.send_message(
-                        chat_id=user_id,
-                        text=text,
-                        parse_mode='Markdown'
-                    )
-                    success_count += 1
-                except:
-                    continue
+            # Разметку проверяем на админе: с ошибкой в ней не ушло бы ни одно сообщение
+            try:
+                await update.message.reply_text(text, parse_mode='Markdown')
+            except BadRequest as e:
+                await update.message.reply_text(f"❌ Ошибка разметки, рассылка не начата: {e.message}")
+                return
             
-            await update.message.reply_text(f"✅ Рассылка завершена! Отправлено: {success_count} пользователям")
+            # Рассылка идет в фоне, ход виден в отдельном сообщении
             context.user_data['admin_action'] = None
+            await self.broadcasts.start(update.effective_chat.id, text)
         
         # Обработка добавления вакансии админом
         elif context.user_data.get('admin_action') == 'add_vacancy':
@@ -788,8 +2022,10 @@ class SmartJobBot:
                 # Парсим вакансию из текста
                 vacancy = self.parse_vacancy_from_text(text)
                 if vacancy:
-                    self.db.save_vacancy(vacancy)
-                    await update.message.reply_text("✅ Вакансия успешно добавлена!")
+                    if await self.db.save_vacancy(vacancy):
+                        await update.message.reply_text("✅ Вакансия успешно добавлена!")
+                    else:
+                        await update.message.reply_text("ℹ️ Такая вакансия уже есть в базе")
                 else:
                     await update.message.reply_text("❌ Ошибка при разборе вакансии")
             except Exception as e:
@@ -798,15 +2034,33 @@ class SmartJobBot:
             context.user_data['admin_action'] = None
     
     async def handle_document(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Обработчик документов (резюме)"""
+        """Обработчик документов (резюме или файл импорта вакансий)"""
+        if context.user_data.get('admin_action') == 'import':
+            await self.handle_vacancy_import(update, context)
+            return
+        
+        document = update.message.document
+        if context.user_data.get('awaiting_cv'):
+            error = self.cv_document_error(document)
+            if error:
+                await update.message.reply_text(error)
+                return
+            
+            context.user_data.pop('awaiting_cv')
+            context.application.create_task(
+                self.process_cv_document(update.message, update.effective_user.id, document), update=update
+            )
+            await update.message.reply_text("⏳ Резюме получено и обрабатывается - пришлю результат отдельным сообщением.")
+            return
+        
         if 'role' in context.user_data and 'cv_text' not in context.user_data:
-            document = update.message.document
             file_name = document.file_name
             
-            if file_name and file_name.endswith(('.pdf', '.doc', '.docx')):
-                # В реальном приложении здесь был бы код для скачивания и анализа файла
+            error = self.cv_document_error(document)
+            if not error:
                 context.user_data['cv_text'] = f"Файл резюме: {file_name}"
                 
+                # Текст и разбор резюме сохранит фоновая обработка файла
                 user_id = update.effective_user.id
                 user_data = {
                     'user_id': user_id,
@@ -820,19 +2074,21 @@ class SmartJobBot:
                     'salary_min': context.user_data.get('salary_min'),
                     'salary_max': context.user_data.get('salary_max'),
                     'currency': context.user_data.get('currency'),
-                    'cv_text': f"Файл резюме: {file_name}",
-                    'cv_analysis': {'skills': [], 'experience': 'not_analyzed'}
                 }
                 
-                self.db.save_user(user_data)
+                await self.db.save_user(user_data)
+                context.application.create_task(
+                    self.process_cv_document(update.message, user_id, document), update=update
+                )
                 
                 # Запрашиваем согласие
                 consent_keyboard = [
-                    [InlineKeyboardButton("✅ Согласен", callback_data="consent_yes")],
-                    [InlineKeyboardButton("❌ Не согласен", callback_data="consent_no")]
+                    [InlineKeyboardButton("✅ Согласен", callback_data=callback_data('consent_yes'))],
+                    [InlineKeyboardButton("❌ Не согласен", callback_data=callback_data('consent_no'))]
                 ]
                 
                 await update.message.reply_text(
+                    "⏳ Резюме получено и обрабатывается - пришлю результат отдельным сообщением.\n\n"
                     "📝 **Согласие на обработку персональных данных**\n\n"
                     "Для работы сервиса нам необходимо обрабатывать ваши персональные данные. "
                     "Мы гарантируем конфиденциальность и используем данные только для подбора вакансий.\n\n"
@@ -841,24 +2097,50 @@ class SmartJobBot:
                     parse_mode='Markdown'
                 )
             else:
-                await update.message.reply_text(
-                    "❌ Пожалуйста, загрузите резюме в формате PDF, DOC или DOCX"
-                )
+                await update.message.reply_text(error)
+    
+    @staticmethod
+    def cv_document_error(document):
+        """Почему файл не подходит как резюме; None, если подходит"""
+        if not (document.file_name and document.file_name.lower().endswith(CV_EXTENSIONS)):
+            return "❌ Пожалуйста, загрузите резюме в формате PDF, DOC или DOCX"
+        if document.file_size and document.file_size > MAX_CV_FILE_SIZE:
+            return f"❌ Файл слишком большой. Максимум {MAX_CV_FILE_SIZE // (1024 * 1024)} МБ"
+        return None
     
-    async def handle_consent_yes(self, query):
+    async def process_cv_document(self, message, user_id, document):
+        """Скачивает и разбирает файл резюме в фоне, по готовности пишет пользователю"""
+        try:
+            result = await self.documents.process(
+                self.document_source, document.file_id, document.file_unique_id, document.file_name
+            )
+        except DocumentError as e:
+            await message.reply_text(f"❌ {e}")
+            return
+        except Exception:
+            logger.exception(f"Не удалось обработать резюме {document.file_unique_id}")
+            await message.reply_text("❌ Не удалось обработать файл. Отправьте резюме текстом")
+            return
+        
+        await self.db.save_user({
+            'user_id': user_id,
+            'cv_text': result['cv_text'],
+            'cv_analysis': result['cv_analysis'],
+        })
+        
+        skills = ', '.join(result['cv_analysis'].get('skills', [])[:10]) or "не найдены"
+        await message.reply_text(f"📄 Резюме обработано.\n🔧 Навыки: {skills}")
+    
+    async def handle_consent_yes(self, query, context):
         """Обработка согласия на обработку данных"""
         user_id = query.from_user.id
         
         # Обновляем статус согласия в базе
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute('UPDATE users SET consent_given = TRUE WHERE user_id = ?', (user_id,))
-        conn.commit()
-        conn.close()
+        await self.db.set_consent(user_id)
         
-        await self.show_main_menu_from_query(query, "🎉 Профиль успешно создан! Теперь вы можете искать вакансии.")
+        await self.show_main_menu_from_query(query, context, "🎉 Профиль успешно создан! Теперь вы можете искать вакансии.")
     
-    async def handle_consent_no(self, query):
+    async def handle_consent_no(self, query, context):
         """Обработка отказа от обработки данных"""
         await query.edit_message_text(
             "❌ Для работы бота необходимо согласие на обработку данных. "
@@ -868,12 +2150,12 @@ class SmartJobBot:
     async def show_main_menu(self, update, text):
         """Показывает главное меню"""
         keyboard = [
-            [InlineKeyboardButton("🎯 Профиль", callback_data="setup_profile")],
-            [InlineKeyboardButton("🔍 Лента вакансий", callback_data="find_jobs")],
-            [InlineKeyboardButton("⭐ Сохраненные", callback_data="saved_list")],
-            [InlineKeyboardButton("💎 Подписка", callback_data="premium_info")],
-            [InlineKeyboardButton("🛠 Инструменты", callback_data="tools_menu")],
-            [InlineKeyboardButton("📖 Помощь", callback_data="help_menu")],
+            [InlineKeyboardButton("🎯 Профиль", callback_data=callback_data('setup_profile'))],
+            [InlineKeyboardButton("🔍 Лента вакансий", callback_data=callback_data('find_jobs'))],
+            [InlineKeyboardButton("⭐ Сохраненные", callback_data=callback_data('saved_list'))],
+            [InlineKeyboardButton("💎 Подписка", callback_data=callback_data('premium_info'))],
+            [InlineKeyboardButton("🛠 Инструменты", callback_data=callback_data('tools_menu'))],
+            [InlineKeyboardButton("📖 Помощь", callback_data=callback_data('help_menu'))],
         ]
         
         await update.reply_text(
@@ -882,15 +2164,15 @@ class SmartJobBot:
             parse_mode='Markdown'
         )
     
-    async def show_main_menu_from_query(self, query, text="🏠 **Главное меню**\n\nВыберите раздел:"):
+    async def show_main_menu_from_query(self, query, context, text="🏠 **Главное меню**\n\nВыберите раздел:"):
         """Показывает главное меню из callback query"""
         keyboard = [
-            [InlineKeyboardButton("🎯 Профиль", callback_data="setup_profile")],
-            [InlineKeyboardButton("🔍 Лента вакансий", callback_data="find_jobs")],
-            [InlineKeyboardButton("⭐ Сохраненные", callback_data="saved_list")],
-            [InlineKeyboardButton("💎 Подписка", callback_data="premium_info")],
-            [InlineKeyboardButton("🛠 Инструменты", callback_data="tools_menu")],
-            [InlineKeyboardButton("📖 Помощь", callback_data="help_menu")],
+            [InlineKeyboardButton("🎯 Профиль", callback_data=callback_data('setup_profile'))],
+            [InlineKeyboardButton("🔍 Лента вакансий", callback_data=callback_data('find_jobs'))],
+            [InlineKeyboardButton("⭐ Сохраненные", callback_data=callback_data('saved_list'))],
+            [InlineKeyboardButton("💎 Подписка", callback_data=callback_data('premium_info'))],
+            [InlineKeyboardButton("🛠 Инструменты", callback_data=callback_data('tools_menu'))],
+            [InlineKeyboardButton("📖 Помощь", callback_data=callback_data('help_menu'))],
         ]
         
         await query.edit_message_text(
@@ -899,20 +2181,20 @@ class SmartJobBot:
             parse_mode='Markdown'
         )
     
-    async def start_onboarding_from_query(self, query):
+    async def start_onboarding_from_query(self, query, context):
         """Начинает онбординг из callback query"""
         roles_keyboard = [
             [
-                InlineKeyboardButton("Engineering", callback_data="role_engineering"),
-                InlineKeyboardButton("Product", callback_data="role_product"),
+                InlineKeyboardButton("Engineering", callback_data=callback_data('role', 'engineering')),
+                InlineKeyboardButton("Product", callback_data=callback_data('role', 'product')),
             ],
             [
-                InlineKeyboardButton("AI/ML", callback_data="role_ai"),
-                InlineKeyboardButton("Design", callback_data="role_design"),
+                InlineKeyboardButton("AI/ML", callback_data=callback_data('role', 'ai')),
+                InlineKeyboardButton("Design", callback_data=callback_data('role', 'design')),
             ],
             [
-                InlineKeyboardButton("Marketing", callback_data="role_marketing"),
-                InlineKeyboardButton("Sales", callback_data="role_sales"),
+                InlineKeyboardButton("Marketing", callback_data=callback_data('role', 'marketing')),
+                InlineKeyboardButton("Sales", callback_data=callback_data('role', 'sales')),
             ]
         ]
         
@@ -924,8 +2206,8 @@ class SmartJobBot:
     
     async def profile(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /profile - показывает профиль пользователя"""
-        user_id = update.effective_user.id
-        user = self.db.get_user(user_id)
+        scope = RequestScope(self.db, update.effective_user.id)
+        user = await scope.user()
         
         if not user or not user.get('role'):
             await update.message.reply_text(
@@ -933,8 +2215,15 @@ class SmartJobBot:
             )
             return
         
-        subscription = self.db.get_subscription(user_id)
-        
+        profile_text, keyboard = self.profile_view(user, await scope.subscription())
+        await update.message.reply_text(
+            profile_text,
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode='Markdown'
+        )
+    
+    def profile_view(self, user, subscription):
+        """Текст и клавиатура профиля"""
         profile_text = f"""
 👤 **Ваш профиль:**
 
@@ -950,29 +2239,78 @@ class SmartJobBot:
         """
         
         keyboard = [
-            [InlineKeyboardButton("✏️ Изменить профиль", callback_data="setup_profile")],
-            [InlineKeyboardButton("📄 Обновить резюме", callback_data="update_cv")],
-            [InlineKeyboardButton("⚙️ Настроить фильтры", callback_data="setup_filters")],
+            [InlineKeyboardButton("✏️ Изменить профиль", callback_data=callback_data('setup_profile'))],
+            [InlineKeyboardButton("📄 Обновить резюме", callback_data=callback_data('update_cv'))],
+            [InlineKeyboardButton("⚙️ Настроить фильтры", callback_data=callback_data('setup_filters'))],
             [InlineKeyboardButton("⏸️ Пауза поиска" if user.get('search_active') else "▶️ Возобновить поиск", 
-                                callback_data="toggle_search")],
-            [InlineKeyboardButton("💎 Подписка", callback_data="premium_info")],
-            [InlineKeyboardButton("⬅️ Назад", callback_data="main_menu")]
+                                callback_data=callback_data('toggle_search'))],
+            [InlineKeyboardButton("💎 Подписка", callback_data=callback_data('premium_info'))],
+            [InlineKeyboardButton("⬅️ Назад", callback_data=callback_data('main_menu'))]
         ]
+        return profile_text, keyboard
+    
+    async def start_cv_update(self, query, context):
+        """Ждет новое резюме: следующий текст или файл заменит сохраненное"""
+        context.user_data['awaiting_cv'] = True
+        await query.message.reply_text(
+            "📄 Отправьте новое резюме файлом (PDF, DOC, DOCX) или текстом сообщения"
+        )
+    
+    async def show_filters(self, query, context):
+        """Показывает фильтры ленты: они берутся из профиля"""
+        user = await self.db.get_user(query.from_user.id)
+        if not user or not user.get('role'):
+            await query.message.reply_text("Профиль не настроен. Используйте /start для настройки.")
+            return
         
-        await update.message.reply_text(
+        salary = (f"от {user['salary_min']} {user.get('currency') or ''}".strip()
+                  if user.get('salary_min') else "не важно")
+        filters_text = (
+            "⚙️ **Фильтры ленты**\n\n"
+            f"🎯 Роль: {escape_markdown(user['role'])}\n"
+            f"📊 Уровень: {escape_markdown(user.get('level') or 'любой')}\n"
+            f"📍 Формат: {escape_markdown(user.get('work_format') or 'любой')}\n"
+            f"💰 Зарплата: {escape_markdown(salary)}\n\n"
+            "Лента и уведомления подбирают вакансии по этим параметрам. "
+            "Чтобы изменить их, пройдите настройку профиля заново."
+        )
+        keyboard = [
+            [InlineKeyboardButton("✏️ Изменить профиль", callback_data=callback_data('setup_profile'))],
+            [InlineKeyboardButton("⬅️ Назад", callback_data=callback_data('main_menu'))]
+        ]
+        await query.edit_message_text(
+            filters_text,
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode='Markdown'
+        )
+    
+    async def handle_toggle_search(self, query, context):
+        """Ставит поиск на паузу или возобновляет его и обновляет профиль в сообщении"""
+        scope = RequestScope(self.db, query.from_user.id)
+        user = await scope.user()
+        if not user or not user.get('role'):
+            return "Профиль не настроен. Используйте /start"
+        
+        active = not user.get('search_active')
+        await self.db.set_search_active(user['user_id'], active)
+        user['search_active'] = active
+        
+        profile_text, keyboard = self.profile_view(user, await scope.subscription())
+        await query.edit_message_text(
             profile_text,
             reply_markup=InlineKeyboardMarkup(keyboard),
             parse_mode='Markdown'
         )
+        return "▶️ Поиск возобновлен" if active else "⏸️ Поиск на паузе, уведомления не приходят"
     
     async def feed(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /feed - показывает ленту вакансий"""
-        await self.show_feed(update.message, page=0)
+        await self.show_feed(update.message, update.effective_user.id)
     
-    async def show_feed(self, message, page=0):
-        """Показывает ленту вакансий"""
-        user_id = message.from_user.id
-        user = self.db.get_user(user_id)
+    async def show_feed(self, message, user_id, cursor=None):
+        """Показывает ленту вакансий начиная после вакансии-курсора"""
+        scope = RequestScope(self.db, user_id)
+        user = await scope.user()
         
         if not user or not user.get('role'):
             await message.reply_text(
@@ -980,14 +2318,11 @@ class SmartJobBot:
             )
             return
         
-        # Получаем вакансии с фильтрами по профилю пользователя
-        filters = {
-            'role': user.get('role'),
-            'level': user.get('level'),
-            'work_format': user.get('work_format')
-        }
-        
-        vacancies = self.db.get_vacancies(limit=5, offset=page*5, filters=filters)
+        # Вакансии по релевантности профилю; берем на одну больше,
+        # чтобы знать, есть ли следующая страница
+        vacancies = await self.db.get_ranked_vacancies(user, limit=FEED_PAGE_SIZE + 1, after_id=cursor)
+        has_more = len(vacancies) > FEED_PAGE_SIZE
+        vacancies = vacancies[:FEED_PAGE_SIZE]
         
         if not vacancies:
             await message.reply_text(
@@ -996,15 +2331,16 @@ class SmartJobBot:
             return
         
         for vacancy in vacancies:
-            await self.send_vacancy_message(message, vacancy, user_id)
+            await self.send_vacancy_message(message, vacancy, scope)
         
-        # Пагинация
+        # Пагинация: курсор - ID последней показанной вакансии.
+        # Предыдущие страницы остаются выше в чате, поэтому вместо "Назад" - переход в начало
         pagination_keyboard = []
-        if page > 0:
-            pagination_keyboard.append(InlineKeyboardButton("⬅️ Назад", callback_data=f"page_{page-1}"))
+        if cursor:
+            pagination_keyboard.append(InlineKeyboardButton("⏮ В начало", callback_data=callback_data('feed_page')))
         
-        if len(vacancies) == 5:
-            pagination_keyboard.append(InlineKeyboardButton("Вперед ➡️", callback_data=f"page_{page+1}"))
+        if has_more:
+            pagination_keyboard.append(InlineKeyboardButton("Вперед ➡️", callback_data=callback_data('feed_page', vacancies[-1]['id'])))
         
         if pagination_keyboard:
             await message.reply_text(
@@ -1012,183 +2348,184 @@ class SmartJobBot:
                 reply_markup=InlineKeyboardMarkup([pagination_keyboard])
             )
     
-    async def show_feed_from_query(self, query):
+    async def show_feed_from_query(self, query, context):
         """Показывает ленту из callback query"""
-        await self.show_feed(query.message, page=0)
+        await self.show_feed(query.message, query.from_user.id)
     
-    async def send_vacancy_message(self, message, vacancy, user_id):
-        """Отправляет сообщение с вакансией"""
-        salary_text = ""
-        if vacancy.get('salary_min') and vacancy.get('salary_max'):
-            salary_text = f"💵 **Salary:** {vacancy['salary_min']} - {vacancy['salary_max']} {vacancy.get('currency', 'USD')}\n"
+    async def search(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Команда /search <запрос> - полнотекстовый поиск вакансий"""
+        text = ' '.join(context.args).strip()
+        if not search_match_expression(text):
+            await update.message.reply_text(
+                "🔎 Укажите, что искать: например, /search python remote"
+            )
+            return
         
-        # Проверяем подписку для показа компании
-        subscription = self.db.get_subscription(user_id)
-        company_text = f"🏢 **Company:** {vacancy['company']}" if subscription['is_premium'] else "🏢 **Company:** [Premium only]"
+        # Результаты запоминаются снимком; в callback_data - его номер и смещение
+        session = await self.db.start_search(update.effective_user.id, text)
+        if not session.ids:
+            await update.message.reply_text(f"😔 По запросу «{text}» ничего не найдено.")
+            return
+        await self.show_search(update.message, update.effective_user.id, session.search_id)
+    
+    async def show_search(self, message, user_id, search_id, offset=0):
+        """Показывает страницу снимка результатов поиска, начиная с позиции offset"""
+        scope = RequestScope(self.db, user_id)
         
-        vacancy_text = f"""
-🚀 **{vacancy['title']}**
-
-{company_text}
-{salary_text}📍 **Location:** {vacancy['location']} | {vacancy.get('work_format', 'Remote')}
-
-📝 **Description:** {vacancy.get('description_short', '')}
-
-🔧 **Requirements:** {vacancy.get('requirements', '')}
-        """
+        page = await self.db.get_search_page(user_id, search_id, offset, SEARCH_PAGE_SIZE)
+        if page is None:
+            await message.reply_text("Поиск устарел. Повторите запрос: /search <запрос>")
+            return
+        vacancies, total = page
         
-        keyboard = self.get_vacancy_keyboard(vacancy, user_id)
+        if not vacancies:
+            await message.reply_text("Больше результатов нет.")
+            return
         
-        await message.reply_text(
-            vacancy_text,
-            reply_markup=InlineKeyboardMarkup(keyboard),
-            parse_mode='Markdown'
-        )
-    
-    def get_vacancy_keyboard(self, vacancy, user_id):
-        """Создает клавиатуру для вакансии"""
-        subscription = self.db.get_subscription(user_id)
-        can_apply = subscription['is_premium'] or subscription['free_applications'] > 0
+        for vacancy in vacancies:
+            note = f"🔎 {format_search_snippet(vacancy['search_snippet'])}\n" if vacancy['search_snippet'] else ''
+            await self.send_vacancy_message(message, vacancy, scope, note=note)
         
-        buttons = []
+        pagination_keyboard = []
+        if offset:
+            pagination_keyboard.append(InlineKeyboardButton("⏮ В начало", callback_data=callback_data(
+                'search_page', search_id
+            )))
         
-        if can_apply:
-            buttons.append(InlineKeyboardButton("📨 Apply", callback_data=f"apply_{vacancy['id']}"))
-        else:
-            buttons.append(InlineKeyboardButton("🔒 Apply (Premium)", callback_data="premium_info"))
+        if offset + SEARCH_PAGE_SIZE < total:
+            pagination_keyboard.append(InlineKeyboardButton("Вперед ➡️", callback_data=callback_data(
+                'search_page', search_id, offset + SEARCH_PAGE_SIZE
+            )))
         
-        buttons.extend([
-            InlineKeyboardButton("❤️ Save", callback_data=f"save_{vacancy['id']}"),
-            InlineKeyboardButton("👎 Hide", callback_data=f"hide_{vacancy['id']}")
-        ])
+        if pagination_keyboard:
+            await message.reply_text(
+                "Навигация:",
+                reply_markup=InlineKeyboardMarkup([pagination_keyboard])
+            )
+    
+    async def handle_search_pagination(self, query, context, search_id=None, offset=None):
+        """Обработка пагинации результатов поиска"""
+        if search_id is None:
+            await query.message.reply_text("Поиск устарел. Повторите запрос: /search <запрос>")
+            return
+        await self.show_search(query.message, query.from_user.id, search_id, offset or 0)
+    
+    async def send_vacancy_message(self, message, vacancy, scope, note=''):
+        """Отправляет сообщение с вакансией; note - строка над карточкой (например, сниппет поиска)"""
+        subscription = await scope.subscription()
+        # Компания видна только с Premium; отклик доступен с Premium или пока есть бесплатные
+        premium = subscription['is_premium']
+        can_apply = premium or subscription['free_applications'] > 0
+        vacancy_text, keyboard = self.cards.feed(vacancy, premium, can_apply, vacancy['id'] in await scope.saved_ids())
         
-        return [buttons]
+        await message.reply_text(
+            note + vacancy_text,
+            reply_markup=keyboard,
+            parse_mode='Markdown'
+        )
     
-    async def handle_apply(self, query, context):
-        """Обработка отклика на вакансию"""
-        user_id = query.from_user.id
-        vacancy_id = int(query.data.replace('apply_', ''))
+    async def handle_apply(self, query, context, vacancy_id):
+        """Обработка отклика на вакансию: проверка, списание и запись - одна транзакция"""
+        result = await self.db.apply_to_vacancy(query.from_user.id, vacancy_id)
         
-        subscription = self.db.get_subscription(user_id)
+        if result['status'] == 'not_found':
+            return "Вакансия не найдена"
         
-        if not subscription['is_premium'] and subscription['free_applications'] <= 0:
+        if result['status'] == 'no_quota':
             await query.edit_message_text(
                 "❌ У вас закончились бесплатные отклики!\n\n"
                 "💎 Перейдите на Premium чтобы откликаться без ограничений:",
                 reply_markup=InlineKeyboardMarkup([
-                    [InlineKeyboardButton("💎 Get Premium", callback_data="premium_info")]
+                    [InlineKeyboardButton("💎 Get Premium", callback_data=callback_data('premium_info'))]
                 ])
             )
-            return
-        
-        # Используем отклик
-        if not subscription['is_premium']:
-            self.db.update_subscription(user_id, {'free_applications': subscription['free_applications'] - 1})
-        
-        # Получаем информацию о вакансии
-        vacancy = self.db.get_vacancy(vacancy_id)
-        if not vacancy:
-            await query.answer("Вакансия не найдена")
-            return
-        
-        # Сохраняем действие
-        self.db.save_user_action(user_id, vacancy_id, 'applied')
+            return None
         
-        # Показываем информацию для отклика
-        apply_text = ""
-        if vacancy.get('apply_url'):
-            apply_text = f"📨 **Ссылка для отклика:** {vacancy['apply_url']}"
-        elif vacancy.get('contacts'):
-            apply_text = f"📧 **Контакты:** {vacancy['contacts']}"
+        if result['is_premium']:
+            remaining_text = "Откликов: ∞ (Premium)"
         else:
-            apply_text = "ℹ️ Контактная информация не указана"
-        
-        remaining = self.db.get_subscription(user_id)['free_applications']
-        remaining_text = f"Осталось откликов: {remaining}" if not subscription['is_premium'] else "Откликов: ∞ (Premium)"
+            remaining_text = f"Осталось откликов: {result['remaining']}"
+        if result['status'] == 'repeat':
+            remaining_text = f"Вы уже откликались на эту вакансию, отклик не списан.\n{remaining_text}"
         
+        # Информация для отклика
         await query.edit_message_text(
-            f"📨 **Отклик на вакансию**\n\n"
-            f"**{vacancy['title']}** at {vacancy['company']}\n\n"
-            f"{apply_text}\n\n"
-            f"{remaining_text}",
+            f"{self.cards.apply(result['vacancy'])}\n\n{remaining_text}",
             parse_mode='Markdown'
         )
+        return None
     
-    async def handle_save(self, query, context):
-        """Обработка сохранения вакансии"""
-        user_id = query.from_user.id
-        vacancy_id = int(query.data.replace('save_', ''))
-        
-        self.db.save_user_action(user_id, vacancy_id, 'saved')
-        await query.answer("✅ Вакансия сохранена!")
+    async def handle_save(self, query, context, vacancy_id):
+        """Обработка сохранения вакансии; текст ответа показывает роутер"""
+        if await self.db.set_saved(query.from_user.id, vacancy_id):
+            return "✅ Вакансия сохранена!"
+        return "Вакансия уже в сохраненных"
     
-    async def handle_hide(self, query, context):
+    async def handle_unsave(self, query, context, vacancy_id):
+        """Удаление вакансии из сохраненных"""
+        await self.db.set_saved(query.from_user.id, vacancy_id, saved=False)
+        await query.edit_message_text("🗑️ Вакансия удалена из сохраненных")
+    
+    async def handle_hide(self, query, context, vacancy_id):
         """Обработка скрытия вакансии"""
-        user_id = query.from_user.id
-        vacancy_id = int(query.data.replace('hide_', ''))
-        
-        self.db.save_user_action(user_id, vacancy_id, 'hidden')
-        await query.answer("✅ Вакансия скрыта!")
+        await self.db.save_user_action(query.from_user.id, vacancy_id, 'hidden')
+        return "✅ Вакансия скрыта!"
     
-    async def handle_pagination(self, query, context):
-        """Обработка пагинации"""
-        page = int(query.data.replace('page_', ''))
-        await self.show_feed(query.message, page=page)
+    async def handle_pagination(self, query, context, cursor=None):
+        """Обработка пагинации ленты: курсор - ID последней показанной вакансии"""
+        await self.show_feed(query.message, query.from_user.id, cursor=cursor)
     
     async def saved(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /saved - показывает сохраненные вакансии"""
-        user_id = update.effective_user.id
+        await self.show_saved(update.message, update.effective_user.id)
+    
+    async def show_saved_from_query(self, query, context, cursor=None):
+        """Сохраненные вакансии из callback query"""
+        await self.show_saved(query.message, query.from_user.id, cursor=cursor)
+    
+    async def show_saved(self, message, user_id, cursor=None):
+        """Показывает страницу сохраненных вакансий"""
+        scope = RequestScope(self.db, user_id)
         
-        saved_ids = self.db.get_user_actions(user_id, 'saved')
-        if not saved_ids:
-            await update.message.reply_text("У вас нет сохраненных вакансий.")
+        saved = await self.db.get_saved_vacancies(user_id, limit=SAVED_PAGE_SIZE + 1, before=cursor)
+        if not saved:
+            await message.reply_text(
+                "Больше сохраненных вакансий нет." if cursor else "У вас нет сохраненных вакансий."
+            )
             return
         
-        for vacancy_id in saved_ids[:10]:  # Показываем первые 10
-            vacancy = self.db.get_vacancy(vacancy_id)
-            if vacancy:
-                await self.send_saved_vacancy_message(update.message, vacancy, user_id)
+        for _, vacancy in saved[:SAVED_PAGE_SIZE]:
+            await self.send_saved_vacancy_message(message, vacancy, scope)
+        
+        if len(saved) > SAVED_PAGE_SIZE:
+            await message.reply_text(
+                "Навигация:",
+                reply_markup=InlineKeyboardMarkup([[
+                    InlineKeyboardButton("Еще ➡️", callback_data=callback_data('saved_page', saved[SAVED_PAGE_SIZE - 1][0]))
+                ]])
+            )
     
-    async def send_saved_vacancy_message(self, message, vacancy, user_id):
+    async def send_saved_vacancy_message(self, message, vacancy, scope):
         """Отправляет сохраненную вакансию"""
-        salary_text = ""
-        if vacancy.get('salary_min') and vacancy.get('salary_max'):
-            salary_text = f"💵 **Salary:** {vacancy['salary_min']} - {vacancy['salary_max']} {vacancy.get('currency', 'USD')}\n"
-        
-        subscription = self.db.get_subscription(user_id)
-        company_text = f"🏢 **Company:** {vacancy['company']}" if subscription['is_premium'] else "🏢 **Company:** [Premium only]"
-        
-        vacancy_text = f"""
-⭐ **Сохраненная вакансия**
-
-🚀 **{vacancy['title']}**
-
-{company_text}
-{salary_text}📍 **Location:** {vacancy['location']}
-
-📝 **Description:** {vacancy.get('description_short', '')}
-        """
-        
-        keyboard = [
-            [
-                InlineKeyboardButton("📨 Apply", callback_data=f"apply_{vacancy['id']}"),
-                InlineKeyboardButton("🗑️ Удалить", callback_data=f"unsave_{vacancy['id']}")
-            ]
-        ]
+        subscription = await scope.subscription()
+        vacancy_text, keyboard = self.cards.saved(vacancy, subscription['is_premium'])
         
         await message.reply_text(
             vacancy_text,
-            reply_markup=InlineKeyboardMarkup(keyboard),
+            reply_markup=keyboard,
             parse_mode='Markdown'
         )
     
     async def subscription(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /subscription - показывает информацию о подписке"""
         user_id = update.effective_user.id
-        subscription = self.db.get_subscription(user_id)
+        subscription = await self.db.get_subscription(user_id)
         
         if subscription['is_premium']:
             status_text = "✅ Активна"
+            if subscription['premium_until']:
+                until = datetime.fromisoformat(subscription['premium_until']).strftime('%d.%m.%Y')
+                status_text += f" до {until}"
             applications_text = "Откликов: ∞ (без ограничений)"
         else:
             status_text = "❌ Не активна"
@@ -1212,9 +2549,11 @@ class SmartJobBot:
         
         keyboard = []
         if not subscription['is_premium']:
-            keyboard.append([InlineKeyboardButton("💎 Апгрейд до Premium", callback_data="premium_info")])
+            keyboard.append([InlineKeyboardButton("💎 Апгрейд до Premium", callback_data=callback_data('premium_info'))])
+        else:
+            keyboard.append([InlineKeyboardButton("💳 Продлить Premium", callback_data=callback_data('premium_info'))])
         
-        keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data="main_menu")])
+        keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data=callback_data('main_menu'))])
         
         await update.message.reply_text(
             text,
@@ -1222,7 +2561,7 @@ class SmartJobBot:
             parse_mode='Markdown'
         )
     
-    async def show_premium_info(self, query):
+    async def show_premium_info(self, query, context):
         """Показывает информацию о премиум подписке"""
         premium_text = """
 💎 **Smart Job Bot Premium**
@@ -1240,8 +2579,8 @@ class SmartJobBot:
         """
         
         keyboard = [
-            [InlineKeyboardButton("💳 Купить Premium ($4.99/мес)", callback_data="buy_premium")],
-            [InlineKeyboardButton("⬅️ Назад", callback_data="main_menu")]
+            [InlineKeyboardButton("💳 Купить Premium ($4.99/мес)", callback_data=callback_data('buy_premium'))],
+            [InlineKeyboardButton("⬅️ Назад", callback_data=callback_data('main_menu'))]
         ]
         
         await query.edit_message_text(
@@ -1250,21 +2589,18 @@ class SmartJobBot:
             parse_mode='Markdown'
         )
     
-    async def handle_buy_premium(self, query):
+    async def handle_buy_premium(self, query, context):
         """Обработка покупки премиум подписки"""
         user_id = query.from_user.id
         
         # В реальном приложении здесь была бы интеграция с платежной системой
         # Сейчас просто активируем премиум
-        self.db.update_subscription(user_id, {
-            'is_premium': True,
-            'free_applications': 999,
-            'premium_until': (datetime.now() + timedelta(days=30)).isoformat()
-        })
+        premium_until = await self.db.extend_premium(user_id)
+        until = datetime.fromisoformat(premium_until).strftime('%d.%m.%Y')
         
         await query.edit_message_text(
             "🎉 **Поздравляем!**\n\n"
-            "Вы успешно активировали Premium подписку!\n\n"
+            f"Premium подписка активна до {until}!\n\n"
             "Теперь у вас есть:\n"
             "• 🔓 Неограниченные отклики\n"
             "• 🚀 Ранний доступ к вакансиям\n"
@@ -1278,6 +2614,24 @@ class SmartJobBot:
     
     async def tools(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /tools - показывает дополнительные сервисы"""
+        tools_text, keyboard = self.tools_view()
+        await update.message.reply_text(
+            tools_text,
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode='Markdown'
+        )
+    
+    async def show_tools_from_query(self, query, context):
+        """Дополнительные сервисы из callback query"""
+        tools_text, keyboard = self.tools_view()
+        await query.edit_message_text(
+            tools_text,
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode='Markdown'
+        )
+    
+    def tools_view(self):
+        """Текст и клавиатура дополнительных сервисов"""
         tools_text = """
 🛠 **Дополнительные сервисы**
 
@@ -1311,17 +2665,28 @@ class SmartJobBot:
         """
         
         keyboard = [
-            [InlineKeyboardButton("⬅️ Назад", callback_data="main_menu")]
+            [InlineKeyboardButton("⬅️ Назад", callback_data=callback_data('main_menu'))]
         ]
-        
-        await update.message.reply_text(
-            tools_text,
-            reply_markup=InlineKeyboardMarkup(keyboard),
-            parse_mode='Markdown'
-        )
+        return tools_text, keyboard
     
     async def help(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /help - показывает справку"""
+        help_text, keyboard = self.help_view()
+        await update.message.reply_text(
+            help_text,
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+    
+    async def show_help_from_query(self, query, context):
+        """Справка из callback query"""
+        help_text, keyboard = self.help_view()
+        await query.edit_message_text(
+            help_text,
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+    
+    def help_view(self):
+        """Текст и клавиатура справки"""
         help_text = """
 📖 **Справка по Smart Job Bot**
 
@@ -1330,6 +2695,7 @@ class SmartJobBot:
 /profile - Мой профиль и настройки
 /feed - Лента вакансий
 /saved - Сохраненные вакансии  
+/search - Поиск вакансий по словам
 /subscription - Управление подпиской
 /tools - Дополнительные сервисы
 /help - Эта справка
@@ -1350,13 +2716,9 @@ class SmartJobBot:
         """
         
         keyboard = [
-            [InlineKeyboardButton("⬅️ Назад", callback_data="main_menu")]
+            [InlineKeyboardButton("⬅️ Назад", callback_data=callback_data('main_menu'))]
         ]
-        
-        await update.message.reply_text(
-            help_text,
-            reply_markup=InlineKeyboardMarkup(keyboard)
-        )
+        return help_text, keyboard
     
     async def admin(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /admin - админ панель"""
@@ -1367,9 +2729,11 @@ class SmartJobBot:
             return
         
         keyboard = [
-            [InlineKeyboardButton("📊 Статистика", callback_data="admin_stats")],
-            [InlineKeyboardButton("📢 Рассылка", callback_data="admin_broadcast")],
-            [InlineKeyboardButton("➕ Добавить вакансию", callback_data="admin_add_vacancy")]
+            [InlineKeyboardButton("📊 Статистика", callback_data=callback_data('admin_stats'))],
+            [InlineKeyboardButton("⏱ Производительность", callback_data=callback_data('admin_perf'))],
+            [InlineKeyboardButton("📢 Рассылка", callback_data=callback_data('admin_broadcast'))],
+            [InlineKeyboardButton("➕ Добавить вакансию", callback_data=callback_data('admin_add_vacancy'))],
+            [InlineKeyboardButton("📥 Импорт CSV/JSONL", callback_data=callback_data('admin_import'))]
         ]
         
         await update.message.reply_text(
@@ -1378,9 +2742,9 @@ class SmartJobBot:
             parse_mode='Markdown'
         )
     
-    async def show_admin_stats(self, query):
+    async def show_admin_stats(self, query, context):
         """Показывает статистику для админа"""
-        stats = self.db.get_stats()
+        stats = await self.db.get_stats()
         
         stats_text = f"""
 📊 **Статистика бота**
@@ -1390,8 +2754,16 @@ class SmartJobBot:
 💎 **Премиум:** {stats['premium_count']}
 📨 **Отклики:** {stats['applications_count']}
         """
+        ingestion_report = await self.ingestion.report()
+        if ingestion_report:
+            stats_text += f"\n📡 **Источники:**\n{escape_markdown(ingestion_report)}"
+        stats_text += f"\n🃏 **Карточки:** {escape_markdown(self.cards.report())}"
+        stats_text += f"\n💾 **Состояние диалогов:** {escape_markdown(self.persistence.report())}"
+        callback_report = '\n'.join(self.router.report()[:5])
+        if callback_report:
+            stats_text += f"\n🖱 **Кнопки:**\n{escape_markdown(callback_report)}"
         
-        keyboard = [[InlineKeyboardButton("🔄 Обновить", callback_data="admin_stats")]]
+        keyboard = [[InlineKeyboardButton("🔄 Обновить", callback_data=callback_data('admin_stats'))]]
         
         await query.edit_message_text(
             stats_text,
@@ -1399,6 +2771,31 @@ class SmartJobBot:
             parse_mode='Markdown'
         )
     
+    async def show_admin_perf(self, query, context):
+        """Показывает сводку метрик производительности для админа"""
+        if not self.metrics.enabled:
+            perf_text = "⏱ Метрики выключены. Включите METRICS_ENABLED или запустите бота с --metrics."
+        else:
+            uptime = timedelta(seconds=int(time.time() - self.metrics.started))
+            sections = [f"⏱ **Производительность** (работает {uptime})"]
+            for family, title in (('handler', "🧭 Обработчики"), ('db', "🗄 База данных"), ('telegram', "📡 Bot API")):
+                summary = escape_markdown('\n'.join(self.metrics.summary(family))) or "нет вызовов"
+                sections.append(f"**{title}:**\n{summary}")
+            processor = self.application.update_processor
+            sections.append(
+                f"**🔀 Апдейты:** обрабатывается {processor.processing} из "
+                f"{processor.max_processing}, принято {processor.current_concurrent_updates}"
+            )
+            perf_text = '\n\n'.join(sections)
+        
+        keyboard = [[InlineKeyboardButton("🔄 Обновить", callback_data=callback_data('admin_perf'))]]
+        
+        await query.edit_message_text(
+            perf_text,
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode='Markdown'
+        )
+    
     async def start_admin_broadcast(self, query, context):
         """Начинает процесс рассылки"""
         await query.edit_message_text(
@@ -1407,6 +2804,63 @@ class SmartJobBot:
         )
         context.user_data['admin_action'] = 'broadcast'
     
+    async def handle_broadcast_stop(self, query, context, broadcast_id):
+        """Останавливает рассылку по кнопке в сообщении о ее ходе"""
+        await self.broadcasts.cancel(broadcast_id)
+    
+    async def start_admin_import(self, query, context):
+        """Начинает массовый импорт вакансий из файла"""
+        await query.edit_message_text(
+            "📥 Импорт вакансий\n\n"
+            "Отправьте файл CSV (с заголовком) или JSONL - по объекту JSON на строку.\n"
+            "Поля: title, company, apply_url, contacts, salary_min, salary_max, currency, location, "
+            "work_format, role, level, tags, industry, description_short, requirements"
+        )
+        context.user_data['admin_action'] = 'import'
+    
+    async def handle_vacancy_import(self, update, context):
+        """Принимает файл импорта и запускает его обработку в фоне"""
+        document = update.message.document
+        if update.effective_user.id not in ADMIN_USERS:
+            await update.message.reply_text("❌ Нет доступа")
+            return
+        
+        extension = os.path.splitext(document.file_name or '')[1].lower()
+        if extension not in IMPORT_EXTENSIONS:
+            await update.message.reply_text("❌ Нужен файл .csv или .jsonl")
+            return
+        if document.file_size and document.file_size > IMPORT_MAX_FILE_SIZE:
+            await update.message.reply_text(
+                f"❌ Файл слишком большой. Максимум {IMPORT_MAX_FILE_SIZE // (1024 * 1024)} МБ"
+            )
+            return
+        
+        context.user_data['admin_action'] = None
+        await update.message.reply_text("⏳ Импорт начат, пришлю итог по завершении")
+        context.application.create_task(
+            self.process_vacancy_import(update.message, document, extension), update=update
+        )
+    
+    async def process_vacancy_import(self, message, document, extension):
+        """Скачивает файл во временный файл и импортирует его в потоке базы"""
+        with tempfile.NamedTemporaryFile(suffix=extension, delete=False) as temporary:
+            path = temporary.name
+        try:
+            with open(path, 'wb') as out:
+                await self.document_source.download(document.file_id, out, IMPORT_MAX_FILE_SIZE)
+            summary = await self.db.run(import_vacancies, self.db.sync, path, source='admin_import')
+        except DocumentError as e:
+            await message.reply_text(f"❌ {e}")
+            return
+        except Exception as e:
+            logger.exception(f"Ошибка импорта {document.file_name}")
+            await message.reply_text(f"❌ Импорт прерван: {e}")
+            return
+        finally:
+            os.unlink(path)
+        
+        await message.reply_text(f"✅ Импорт {document.file_name} завершен\n\n{summary}")
+    
     async def start_admin_add_vacancy(self, query, context):
         """Начинает процесс добавления вакансии"""
         await query.edit_message_text(
@@ -1479,24 +2933,90 @@ class SmartJobBot:
         
         return vacancy
     
-    def get_all_users(self):
+    async def get_all_users(self):
         """Получает всех пользователей"""
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute('SELECT user_id FROM users')
-        users = [row[0] for row in cursor.fetchall()]
-        conn.close()
-        return users
-    
-    def run(self):
-        """Запуск бота"""
+        return await self.db.get_all_user_ids()
+    
+    def run(self, webhook=False, webhook_url=WEBHOOK_URL, port=WEBHOOK_PORT):
+        """Запуск бота: polling или прием апдейтов через webhook"""
         print("🤖 Бот запускается...")
         print(f"👤 Админы: {ADMIN_USERS}")
         print("🔗 Напишите боту в Telegram: /start")
-        self.application.run_polling()
+        try:
+            if webhook:
+                server = WebhookServer(self.application, port=port, secret=WEBHOOK_SECRET, metrics=self.metrics)
+                asyncio.run(serve_webhook(self.application, server, webhook_url))
+            else:
+                self.application.run_polling()
+        finally:
+            self.cv_analyzer.close()
+            self.db.close()
+
+async def run_ingestion(db, sources_file):
+    """Однократная загрузка всех источников из файла описания"""
+    scheduler = IngestionScheduler(db, load_sources(sources_file))
+    try:
+        return await scheduler.run_all()
+    finally:
+        await scheduler.stop()
+
+def parse_args():
+    """Аргументы командной строки"""
+    parser = argparse.ArgumentParser(description="Smart Job Bot")
+    parser.add_argument('--seed-samples', action='store_true',
+                        help="добавить тестовые вакансии (повторно не дублируются) и выйти")
+    parser.add_argument('--compact-vacancies', action='store_true',
+                        help="схлопнуть дубликаты вакансий в базе и выйти")
+    parser.add_argument('--analyze-cvs', action='store_true',
+                        help="разобрать сохраненные резюме текущей версией анализатора и выйти")
+    parser.add_argument('--import-vacancies', metavar='FILE',
+                        help="импортировать вакансии из CSV/JSONL и выйти")
+    parser.add_argument('--ingest', nargs='?', const=INGESTION_SOURCES_FILE, metavar='SOURCES',
+                        help="загрузить вакансии из внешних источников один раз и выйти")
+    parser.add_argument('--webhook', action='store_true',
+                        help="принимать апдейты через webhook вместо polling")
+    parser.add_argument('--webhook-url', default=WEBHOOK_URL, metavar='URL',
+                        help="публичный адрес webhook для setWebhook (без него - только локальный прием)")
+    parser.add_argument('--port', type=int, default=WEBHOOK_PORT, help="порт сервера webhook")
+    parser.add_argument('--metrics', action='store_true', default=METRICS_ENABLED,
+                        help=f"собирать метрики производительности ({METRICS_FILE}, /metrics в режиме webhook)")
+    parser.add_argument('--concurrency', type=int, default=MAX_CONCURRENT_UPDATES,
+                        help="сколько апдейтов обрабатывать одновременно")
+    return parser.parse_args()
 
 def main():
     """Основная функция"""
+    args = parse_args()
+    
+    if args.ingest:
+        db = AsyncDatabase(DatabaseManager(DB_PATH))
+        try:
+            for run in asyncio.run(run_ingestion(db, args.ingest)):
+                print(f"📡 {run}")
+        finally:
+            db.close()
+        return
+    
+    if args.seed_samples or args.compact_vacancies or args.analyze_cvs or args.import_vacancies:
+        db = DatabaseManager(DB_PATH)
+        if args.compact_vacancies:
+            print(f"🧹 Удалено дубликатов вакансий: {db.compact_vacancies()}")
+        if args.seed_samples:
+            print(f"🌱 Добавлено тестовых вакансий: {db.add_sample_vacancies()}")
+        if args.analyze_cvs:
+            pending = db.get_unanalyzed_cvs()
+            analyzer = CVAnalyzer()
+            try:
+                analyses = analyzer.analyze_all(cv_text for _, cv_text in pending)
+            finally:
+                analyzer.close()
+            db.save_cv_analyses(zip((user_id for user_id, _ in pending), analyses))
+            print(f"🧠 Разобрано резюме: {len(pending)}")
+        if args.import_vacancies:
+            print(import_vacancies(db, args.import_vacancies))
+        db.close()
+        return
+    
     print("🚀 Запуск Smart Job Bot")
     print("🎯 Создано для @yanovskay_tatsiana")
     
@@ -1505,8 +3025,8 @@ def main():
         print("📱 Добавьте ваш user_id в переменную ADMIN_USERS")
     
     try:
-        bot = SmartJobBot(BOT_TOKEN)
-        bot.run()
+        bot = SmartJobBot(BOT_TOKEN, concurrency=args.concurrency, metrics=args.metrics)
+        bot.run(webhook=args.webhook, webhook_url=args.webhook_url, port=args.port)
     except Exception as e:
         print(f"❌ Ошибка при запуске бота: {e}")
 
@@ -0,0 +1,269 @@
+"""Нагрузочный прогон SmartJobBot без Telegram.
+
+Бот собирается целиком (SmartJobBot, временная база, persistence, обработчик
+апдейтов), но запросы к Bot API уходят в RecordingRequest: он отвечает как
+Telegram, считает вызовы по методам и запоминает кнопки отправленных
+сообщений. Виртуальные пользователи проходят анкету и дальше листают ленту,
+сохраняют, скрывают и откликаются, нажимая кнопки, которые бот им реально
+прислал; администратор запускает рассылку. Апдейты идут через
+update_processor приложения, как при работе с Telegram.
+
+    python benchmarks.py load --users 500 --concurrency 50 --actions 20
+
+Итог - пропускная способность и p50/p95/p99 по шагам (обработчикам);
+--json сохраняет его для сравнения между релизами.
+"""
+import asyncio
+import itertools
+import json
+import os
+import random
+import tempfile
+import time
+import warnings
+from collections import Counter, defaultdict, deque
+
+from telegram import Update
+from telegram.request import BaseRequest
+
+import job_bot
+from benchmarks import fill_vacancies, synthetic_cv
+from callbacks import CallbackError, parse_callback
+
+STUB_TOKEN = '123456:load-test'
+STUB_BOT = {'id': 123456, 'is_bot': True, 'first_name': 'Smart Job Bot', 'username': 'smart_job_bot',
+            'can_join_groups': True, 'can_read_all_group_messages': False, 'supports_inline_queries': False}
+ADMIN_USER_ID = 1
+FIRST_USER_ID = 1000
+BUTTONS_PER_CHAT = 50  # сколько последних кнопок помнить в каждом чате
+
+# Действия после анкеты и их веса
+ACTION_MIX = {'feed': 4, 'feed_page': 2, 'save': 3, 'hide': 2, 'apply': 1, 'saved': 1, 'profile': 1}
+BROADCAST_TEXT = "📢 Нагрузочный тест: новые вакансии уже в ленте"
+
+class RecordingRequest(BaseRequest):
+    """Заглушка Bot API: отвечает успехом, считает вызовы и запоминает кнопки по чатам"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency  # имитация времени ответа Telegram, секунды
+        self.calls = Counter()
+        self.buttons = defaultdict(lambda: deque(maxlen=BUTTONS_PER_CHAT))
+        self._message_ids = itertools.count(1)
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        endpoint = url.rsplit('/', 1)[-1]
+        params = request_data.parameters if request_data else {}
+        self.calls[endpoint] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return 200, json.dumps({'ok': True, 'result': self._result(endpoint, params)}).encode()
+
+    def _result(self, endpoint, params):
+        if endpoint == 'getMe':
+            return STUB_BOT
+        if endpoint not in ('sendMessage', 'editMessageText', 'editMessageReplyMarkup'):
+            return True
+
+        chat_id = params.get('chat_id')
+        message_id = params.get('message_id') or next(self._message_ids)
+        markup = params.get('reply_markup')
+        if isinstance(markup, str):
+            markup = json.loads(markup)
+        for row in (markup or {}).get('inline_keyboard', ()):
+            for button in row:
+                if 'callback_data' in button:
+                    self.buttons[chat_id].append((message_id, button['callback_data']))
+        return {'message_id': message_id, 'date': int(time.time()), 'text': params.get('text', ''),
+                'chat': {'id': chat_id, 'type': 'private'}}
+
+class LoadTest:
+    """Виртуальные пользователи поверх SmartJobBot с заглушкой Bot API"""
+
+    def __init__(self, users=200, concurrency=50, actions=20, vacancies=20000, broadcasts=1,
+                 api_latency=0.0, seed=42):
+        self.users = users
+        self.concurrency = concurrency
+        self.actions = actions
+        self.vacancies = vacancies
+        self.broadcasts = broadcasts
+        self.seed = seed
+        self.request = RecordingRequest(api_latency)
+        self.timings = defaultdict(list)
+        self.errors = Counter()
+        self.error_samples = []
+        self._failed = set()
+        self._update_ids = itertools.count(1)
+        self.elapsed = 0.0
+
+    async def setup(self):
+        directory = tempfile.mkdtemp(prefix='jobbot-load-')
+        db_path = os.path.join(directory, 'load.db')
+        seed_db = job_bot.DatabaseManager(db_path)
+        fill_vacancies(seed_db, self.vacancies, seed=self.seed)
+        seed_db.close()
+
+        # Бот читает настройки модуля при создании
+        job_bot.DB_PATH = db_path
+        job_bot.INGESTION_SOURCES_FILE = os.path.join(directory, 'no-sources.json')
+        job_bot.ADMIN_USERS = [ADMIN_USER_ID]
+        self.bot = job_bot.SmartJobBot(STUB_TOKEN, concurrency=self.concurrency, request=self.request)
+        self.application = self.bot.application
+        self.application.add_error_handler(self._on_error)
+        # Без apscheduler фоновые задачи бота работают на asyncio; предупреждение PTB об этом не нужно
+        warnings.filterwarnings('ignore', message='No `JobQueue` set up')
+        await self.application.initialize()
+        await self.bot.post_init(self.application)
+
+    async def teardown(self):
+        await self.bot.post_stop(self.application)
+        await self.application.shutdown()
+        self.bot.cv_analyzer.close()
+        self.bot.db.close()
+
+    async def _on_error(self, update, context):
+        if isinstance(update, Update):
+            self._failed.add(update.update_id)
+        if len(self.error_samples) < 5:
+            self.error_samples.append(repr(context.error))
+
+    async def process(self, step, data):
+        """Пропускает апдейт (JSON Bot API) через обработчик приложения и записывает время шага"""
+        update = Update.de_json(data, self.application.bot)
+        processor = self.application.update_processor
+        started = time.perf_counter()
+        await processor.process_update(update, self.application.process_update(update))
+        self.timings[step].append((time.perf_counter() - started) * 1000)
+        if update.update_id in self._failed:
+            self._failed.discard(update.update_id)
+            self.errors[step] += 1
+
+    @staticmethod
+    def user(user_id):
+        return {'id': user_id, 'is_bot': False, 'first_name': f"User{user_id}", 'username': f"user{user_id}"}
+
+    async def message(self, step, user_id, text):
+        payload = {'message_id': next(self._update_ids), 'date': int(time.time()), 'text': text,
+                   'from': self.user(user_id), 'chat': {'id': user_id, 'type': 'private'}}
+        if text.startswith('/'):
+            payload['entities'] = [{'offset': 0, 'length': len(text.split()[0]), 'type': 'bot_command'}]
+        await self.process(step, {'update_id': next(self._update_ids), 'message': payload})
+
+    async def tap(self, user_id, route, rng):
+        """Нажимает случайную из последних кнопок маршрута route в чате пользователя"""
+        candidates = []
+        for message_id, data in self.request.buttons[user_id]:
+            try:
+                if parse_callback(data)[0] == route:
+                    candidates.append((message_id, data))
+            except CallbackError:
+                continue
+        if not candidates:
+            return False
+
+        message_id, data = rng.choice(candidates)
+        update_id = next(self._update_ids)
+        await self.process(route, {'update_id': update_id, 'callback_query': {
+            'id': str(update_id), 'from': self.user(user_id), 'chat_instance': str(user_id), 'data': data,
+            'message': {'message_id': message_id, 'date': int(time.time()), 'text': '…',
+                        'chat': {'id': user_id, 'type': 'private'}},
+        }})
+        return True
+
+    async def onboarding(self, user_id, rng):
+        await self.message('start', user_id, '/start')
+        for route in ('role', 'level', 'work_format', 'location_remote'):
+            await self.tap(user_id, route, rng)
+        await self.message('salary', user_id, f"{rng.choice([2000, 3000, 4000])}-{rng.choice([5000, 6000, 8000])} USD")
+        await self.message('cv', user_id, synthetic_cv(rng)[:1500])
+        await self.tap(user_id, 'consent_yes', rng)
+
+    async def session(self, user_id, slots):
+        rng = random.Random(self.seed * 1000003 + user_id)
+        actions, weights = zip(*ACTION_MIX.items())
+        async with slots:
+            await self.onboarding(user_id, rng)
+            for action in rng.choices(actions, weights, k=self.actions):
+                if action == 'feed':
+                    await self.message('feed', user_id, '/feed')
+                elif action == 'saved':
+                    await self.message('saved', user_id, '/saved')
+                elif action == 'profile':
+                    await self.message('profile', user_id, '/profile')
+                elif not await self.tap(user_id, action, rng):
+                    # Нужных кнопок еще нет - сначала открываем ленту
+                    await self.message('feed', user_id, '/feed')
+
+    async def admin_session(self, slots):
+        rng = random.Random(self.seed)
+        async with slots:
+            for _ in range(self.broadcasts):
+                await self.message('admin', ADMIN_USER_ID, '/admin')
+                await self.tap(ADMIN_USER_ID, 'admin_broadcast', rng)
+                await self.message('broadcast', ADMIN_USER_ID, BROADCAST_TEXT)
+
+    async def run(self):
+        await self.setup()
+        try:
+            slots = asyncio.Semaphore(self.concurrency)
+            sessions = [self.session(FIRST_USER_ID + n, slots) for n in range(self.users)]
+            if self.broadcasts:
+                # Рассылка стартует, когда часть пользователей уже прошла анкету
+                sessions.insert(len(sessions) // 2, self.admin_session(slots))
+            started = time.perf_counter()
+            await asyncio.gather(*sessions)
+            self.elapsed = time.perf_counter() - started
+        finally:
+            await self.teardown()
+        return self
+
+    def results(self):
+        """Итог прогона: пропускная способность и перцентили по шагам"""
+        steps = {}
+        for step, timings in sorted(self.timings.items()):
+            timings = sorted(timings)
+            steps[step] = {
+                'updates': len(timings),
+                'errors': self.errors[step],
+                'p50_ms': percentile(timings, 0.50),
+                'p95_ms': percentile(timings, 0.95),
+                'p99_ms': percentile(timings, 0.99),
+            }
+        total = sum(step['updates'] for step in steps.values())
+        return {
+            'users': self.users, 'concurrency': self.concurrency, 'actions': self.actions,
+            'vacancies': self.vacancies, 'api_latency_ms': self.request.latency * 1000,
+            'updates': total, 'seconds': self.elapsed,
+            'updates_per_second': total / self.elapsed if self.elapsed else 0.0,
+            'steps': steps, 'api_calls': dict(self.request.calls.most_common()),
+        }
+
+    def report(self):
+        results = self.results()
+        lines = [
+            f"Пользователей: {self.users}, одновременно: {self.concurrency}, действий: {self.actions}, "
+            f"вакансий: {self.vacancies}, задержка Bot API: {results['api_latency_ms']:g} мс",
+            f"Апдейтов: {results['updates']} за {self.elapsed:.1f} с - "
+            f"{results['updates_per_second']:.0f} апдейтов/с",
+            f"{'шаг':>16} {'апдейтов':>9} {'ошибок':>7} {'p50 мс':>8} {'p95 мс':>8} {'p99 мс':>8}",
+        ]
+        for step, row in results['steps'].items():
+            lines.append(f"{step:>16} {row['updates']:>9} {row['errors']:>7} "
+                         f"{row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} {row['p99_ms']:>8.2f}")
+        lines.append("Вызовы Bot API: " + ', '.join(f"{method} {count}" for method, count in results['api_calls'].items()))
+        lines.extend(f"Ошибка: {sample}" for sample in self.error_samples)
+        return '\n'.join(lines)
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
@@ -0,0 +1,271 @@
+"""Метрики производительности бота.
+
+Metrics собирает гистограммы времени, счетчики ошибок и число выполняющихся
+сейчас вызовов по трем семействам:
+
+- handler - обработчики апдейтов: команды ('/start'), маршруты кнопок
+  ('callback:apply') и обработчики сообщений ('handle_message');
+- db - методы DatabaseManager (время в потоке базы, без ожидания в очереди пула);
+- telegram - запросы к Bot API по методам ('sendMessage'); getUpdates с долгим
+  опросом идет отдельным запросом и не учитывается.
+
+Обертки ставятся только во включенном реестре, поэтому выключенные метрики
+ничего не стоят: вызовы идут напрямую. Снимок в текстовом формате Prometheus
+дает render(); его отдает webhook-сервер по GET /metrics и раз в
+METRICS_DUMP_INTERVAL секунд записывает в файл start_dump (формат подходит
+для textfile collector node_exporter).
+"""
+import asyncio
+import functools
+import inspect
+import logging
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+
+from telegram.request import HTTPXRequest
+
+logger = logging.getLogger(__name__)
+
+METRICS_PREFIX = 'smartjob'
+METRICS_DUMP_INTERVAL = 15  # секунд между записями файла метрик
+# Верхние границы корзин гистограмм, секунды
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Семейство -> (имя метки, что измеряется)
+FAMILIES = {
+    'handler': ('handler', 'обработчиков апдейтов'),
+    'db': ('query', 'методов базы данных'),
+    'telegram': ('method', 'запросов к Bot API'),
+}
+
+class Histogram:
+    """Корзины времени вызовов одной метки"""
+
+    __slots__ = ('buckets', 'count', 'total', 'errors', 'in_flight')
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+        self.in_flight = 0
+
+    def quantile(self, q):
+        """Верхняя граница корзины, в которую попадает квантиль q (None - за последней границей)"""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return bound
+        return None
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class Metrics:
+    """Реестр метрик; в выключенном instrument_* ничего не оборачивают"""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.started = time.time()
+        self._series = {family: {} for family in FAMILIES}
+        self._lock = threading.Lock()  # методы базы пишут метрики из потоков пула
+        self._dump_task = None
+
+    def _enter(self, family, label):
+        with self._lock:
+            series = self._series[family].get(label)
+            if series is None:
+                series = self._series[family][label] = Histogram()
+            series.in_flight += 1
+        return series
+
+    def _leave(self, series, seconds, failed):
+        with self._lock:
+            series.in_flight -= 1
+            series.count += 1
+            series.total += seconds
+            series.errors += failed
+            series.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    def observe(self, family, label, seconds, failed=False):
+        """Добавляет готовое измерение"""
+        self._leave(self._enter(family, label), seconds, failed)
+
+    def timed(self, family, label, func):
+        """Обертка func (обычной функции или корутины), измеряющая каждый вызов"""
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                series = self._enter(family, label)
+                started = time.perf_counter()
+                failed = True
+                try:
+                    result = await func(*args, **kwargs)
+                    failed = False
+                    return result
+                finally:
+                    self._leave(series, time.perf_counter() - started, failed)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                series = self._enter(family, label)
+                started = time.perf_counter()
+                failed = True
+                try:
+                    result = func(*args, **kwargs)
+                    failed = False
+                    return result
+                finally:
+                    self._leave(series, time.perf_counter() - started, failed)
+        return wrapper
+
+    def instrument_application(self, application, skip=()):
+        """Оборачивает обработчики приложения; skip - колбэки, которые измеряются иначе"""
+        if not self.enabled:
+            return
+        for handlers in application.handlers.values():
+            for handler in handlers:
+                if handler.callback in skip:
+                    continue
+                commands = getattr(handler, 'commands', None)
+                label = '/' + min(commands) if commands else handler.callback.__name__
+                handler.callback = self.timed('handler', label, handler.callback)
+
+    def instrument_router(self, router):
+        """Оборачивает обработчики маршрутов CallbackRouter"""
+        if not self.enabled:
+            return
+        for route in router.routes.values():
+            route.handler = self.timed('handler', f"callback:{route.name}", route.handler)
+
+    def instrument_methods(self, obj, family, exclude=()):
+        """Оборачивает публичные методы obj на экземпляре (класс не меняется)"""
+        if not self.enabled:
+            return
+        for name, member in vars(type(obj)).items():
+            if name.startswith('_') or name in exclude or not inspect.isfunction(member):
+                continue
+            setattr(obj, name, self.timed(family, name, getattr(obj, name)))
+
+    def telegram_request(self, **kwargs):
+        """HTTPXRequest для ApplicationBuilder.request, измеряющий запросы к Bot API"""
+        return InstrumentedRequest(self, **kwargs)
+
+    def snapshot(self, family):
+        """Копии гистограмм семейства: {метка: Histogram}"""
+        with self._lock:
+            copies = {}
+            for label, series in self._series[family].items():
+                copy = copies[label] = Histogram()
+                copy.buckets = list(series.buckets)
+                copy.count, copy.total = series.count, series.total
+                copy.errors, copy.in_flight = series.errors, series.in_flight
+            return copies
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus"""
+        lines = [
+            f"# HELP {METRICS_PREFIX}_start_time_seconds Время запуска бота",
+            f"# TYPE {METRICS_PREFIX}_start_time_seconds gauge",
+            f"{METRICS_PREFIX}_start_time_seconds {self.started:.3f}",
+        ]
+        for family, (label_name, what) in FAMILIES.items():
+            name = f"{METRICS_PREFIX}_{family}"
+            series = sorted(self.snapshot(family).items())
+            lines += [f"# HELP {name}_seconds Время {what}", f"# TYPE {name}_seconds histogram"]
+            for label, histogram in series:
+                labels = f'{label_name}="{escape_label(label)}"'
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS, histogram.buckets):
+                    cumulative += count
+                    lines.append(f'{name}_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                lines.append(f'{name}_seconds_sum{{{labels}}} {histogram.total:.6f}')
+                lines.append(f'{name}_seconds_count{{{labels}}} {histogram.count}')
+            lines += [f"# HELP {name}_errors_total Ошибки {what}", f"# TYPE {name}_errors_total counter"]
+            lines += [f'{name}_errors_total{{{label_name}="{escape_label(label)}"}} {histogram.errors}'
+                      for label, histogram in series]
+            lines += [f"# HELP {name}_in_flight Выполняющиеся сейчас вызовы {what}", f"# TYPE {name}_in_flight gauge"]
+            lines += [f'{name}_in_flight{{{label_name}="{escape_label(label)}"}} {histogram.in_flight}'
+                      for label, histogram in series]
+        return '\n'.join(lines) + '\n'
+
+    def summary(self, family, limit=5):
+        """Строки для админ-панели: самые затратные по суммарному времени метки семейства"""
+        lines = []
+        series = sorted(self.snapshot(family).items(), key=lambda item: -item[1].total)
+        for label, histogram in series[:limit]:
+            if not histogram.count:
+                continue
+            p95 = histogram.quantile(0.95)
+            p95_text = f"≤{p95 * 1000:g} мс" if p95 is not None else f">{LATENCY_BUCKETS[-1]:g} с"
+            lines.append(
+                f"{label}: {histogram.count} вызовов, среднее {histogram.total / histogram.count * 1000:.1f} мс, "
+                f"p95 {p95_text}, ошибок {histogram.errors}, сейчас {histogram.in_flight}"
+            )
+        return lines
+
+    def write(self, path):
+        """Атомарно записывает метрики в файл"""
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.metrics-')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as output:
+                output.write(self.render())
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def start_dump(self, path, interval=METRICS_DUMP_INTERVAL):
+        """Периодическая запись метрик в файл задачей asyncio"""
+        if self.enabled and path:
+            self._dump_task = asyncio.create_task(self._dump_loop(path, interval))
+
+    async def stop_dump(self):
+        if self._dump_task:
+            self._dump_task.cancel()
+            await asyncio.gather(self._dump_task, return_exceptions=True)
+            self._dump_task = None
+
+    async def _dump_loop(self, path, interval):
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    self.write(path)
+                except OSError as e:
+                    logger.error(f"Не удалось записать метрики в {path}: {e}")
+        finally:
+            # Последний снимок при остановке
+            try:
+                self.write(path)
+            except OSError:
+                pass
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest, записывающий время и ошибки запросов к Bot API по методам"""
+
+    def __init__(self, metrics, **kwargs):
+        # Как у запроса по умолчанию в ApplicationBuilder
+        kwargs.setdefault('connection_pool_size', 256)
+        super().__init__(**kwargs)
+        self.metrics = metrics
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        # Скачивание файлов идет по пути /file/bot<token>/<путь>: в метку - только вид запроса
+        label = 'downloadFile' if '/file/bot' in url else url.rsplit('/', 1)[-1]
+        series = self.metrics._enter('telegram', label)
+        started = time.perf_counter()
+        failed = True
+        try:
+            code, payload = await super().do_request(url, method, request_data, *args, **kwargs)
+            failed = code >= 400
+            return code, payload
+        finally:
+            self.metrics._leave(series, time.perf_counter() - started, failed)
@@ -0,0 +1,110 @@
+"""Исходящие сообщения с учетом лимитов Telegram.
+
+Bot API допускает около 30 сообщений в секунду суммарно и примерно одно
+сообщение в секунду в один чат. OutboundSender держит общий token bucket и
+интервал на чат, ограничивает число одновременных запросов, при RetryAfter
+приостанавливает всю отправку на указанное время и повторяет сообщение.
+Пользователи, заблокировавшие бота, возвращаются статусом BLOCKED - вызывающий
+код помечает их в базе.
+"""
+import asyncio
+import logging
+import time
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_RATE = 25  # сообщений в секунду, с запасом от лимита ~30
+GLOBAL_BURST = 25
+PER_CHAT_INTERVAL = 1.0  # секунд между сообщениями в один чат
+SEND_CONCURRENCY = 8  # одновременных запросов к Bot API
+SEND_ATTEMPTS = 4
+NETWORK_BACKOFF = 1.0  # секунд, удваивается с каждой попыткой
+
+SENT = 'sent'
+BLOCKED = 'blocked'
+FAILED = 'failed'
+
+# Ошибки BadRequest, после которых чат недоступен навсегда
+UNREACHABLE_ERRORS = ('chat not found', 'user is deactivated', 'peer_id_invalid', 'bot was blocked')
+
+class TokenBucket:
+    """Token bucket: rate токенов в секунду, не больше capacity про запас"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        # Под блокировкой ожидающие получают токены по очереди
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+class OutboundSender:
+    """Отправка сообщений с общим и по-чатовым лимитом"""
+
+    def __init__(self, bot, rate=GLOBAL_RATE, burst=GLOBAL_BURST,
+                 chat_interval=PER_CHAT_INTERVAL, concurrency=SEND_CONCURRENCY):
+        self.bot = bot
+        self.bucket = TokenBucket(rate, burst)
+        self.chat_interval = chat_interval
+        self._slots = asyncio.Semaphore(concurrency)
+        self._chat_next = {}
+        self._paused_until = 0.0
+
+    async def _wait_turn(self, chat_id):
+        while True:
+            now = time.monotonic()
+            delay = max(self._paused_until, self._chat_next.get(chat_id, 0.0)) - now
+            if delay <= 0:
+                break
+            await asyncio.sleep(delay)
+        await self.bucket.acquire()
+        now = time.monotonic()
+        self._chat_next[chat_id] = now + self.chat_interval
+        if len(self._chat_next) > 10000:
+            # Интервалы прошедших отправок больше не нужны
+            self._chat_next = {chat: until for chat, until in self._chat_next.items() if until > now}
+
+    async def send(self, chat_id, text, **kwargs):
+        """Отправляет сообщение; возвращает (статус, описание ошибки)"""
+        error = None
+        async with self._slots:
+            for attempt in range(SEND_ATTEMPTS):
+                await self._wait_turn(chat_id)
+                try:
+                    await self.bot.send_message(chat_id=chat_id, text=text, **kwargs)
+                    return SENT, None
+                except RetryAfter as e:
+                    # Флуд-лимит общий для бота: приостанавливаем все отправки
+                    delay = retry_after_seconds(e)
+                    logger.warning(f"Флуд-лимит Telegram, пауза {delay:.0f} с")
+                    self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                    error = e.message
+                except Forbidden as e:
+                    return BLOCKED, e.message
+                except BadRequest as e:
+                    if any(marker in e.message.lower() for marker in UNREACHABLE_ERRORS):
+                        return BLOCKED, e.message
+                    return FAILED, e.message
+                except NetworkError as e:
+                    # Таймауты и обрывы соединения: повторяем с растущей паузой
+                    error = e.message
+                    await asyncio.sleep(NETWORK_BACKOFF * 2 ** attempt)
+        return FAILED, error
+
+def retry_after_seconds(error):
+    """Пауза из RetryAfter в секундах (int или timedelta в зависимости от версии PTB)"""
+    retry_after = error._retry_after if hasattr(error, '_retry_after') else error.retry_after
+    return retry_after.total_seconds() if hasattr(retry_after, 'total_seconds') else float(retry_after)
@@ -0,0 +1,178 @@
+"""Состояние диалогов в базе бота.
+
+SQLitePersistence хранит user_data, chat_data и bot_data приложения в таблице
+conversation_state, поэтому недоведенная до конца анкета или начатое
+действие администратора переживают перезапуск. Состояние пользователя или
+чата читается из базы при его первом апдейте после запуска, а не целиком на
+старте: к запуску с сотнями тысяч пользователей это ничего не добавляет.
+
+Запись отложенная. Приложение раз в PERSISTENCE_FLUSH_INTERVAL секунд передает
+состояния, затронутые апдейтами; из них записываются только изменившиеся
+(сравнивается хэш JSON с последним сохраненным), одной транзакцией на проход.
+При остановке приложение сбрасывает оставшееся через flush.
+
+Хэши хранятся для PERSISTENCE_KEYS последних ключей каждого вида. Для
+вытесненного ключа следующее изменение записывается без сравнения, а повторная
+загрузка не трогает уже заполненное состояние в памяти приложения.
+"""
+import asyncio
+import json
+import logging
+from collections import OrderedDict
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger(__name__)
+
+PERSISTENCE_FLUSH_INTERVAL = 10  # секунд между записями изменений
+PERSISTENCE_KEYS = 100000  # ключей каждого вида с хэшем в памяти
+BOT_DATA_KEY = 0
+EMPTY_STATE = '{}'
+
+def encode_state(data):
+    return json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+
+class SQLitePersistence(BasePersistence):
+    """Persistence PTB поверх AsyncDatabase с ленивой загрузкой и пакетной записью"""
+
+    def __init__(self, db, update_interval=PERSISTENCE_FLUSH_INTERVAL, max_keys=PERSISTENCE_KEYS):
+        super().__init__(store_data=PersistenceInput(callback_data=False), update_interval=update_interval)
+        self.db = db
+        self.max_keys = max_keys
+        # Хэш последнего сохраненного JSON по ключам в порядке использования;
+        # ключ есть - состояние уже загружено
+        self._stored = {'user': OrderedDict(), 'chat': OrderedDict(), 'bot': OrderedDict()}
+        self._loading = {}
+        self._pending = {}
+        self._flush_task = None
+        self.loads = 0
+        self.writes = 0
+        self.flushes = 0
+        self.unchanged = 0
+        self.evicted = 0
+
+    def _remember(self, kind, key, digest):
+        stored = self._stored[kind]
+        stored[key] = digest
+        stored.move_to_end(key)
+        while len(stored) > self.max_keys:
+            stored.popitem(last=False)
+            self.evicted += 1
+
+    async def _load(self, kind, key, target):
+        stored = self._stored[kind]
+        if key in stored:
+            stored.move_to_end(key)
+            return
+        # Параллельные апдейты одного пользователя ждут одну загрузку
+        waiting = self._loading.get((kind, key))
+        if waiting is not None:
+            await asyncio.shield(waiting)
+            return
+
+        loaded = self._loading[(kind, key)] = asyncio.get_running_loop().create_future()
+        try:
+            text = await self.db.get_conversation_state(kind, key)
+            # Непустое состояние в памяти - загруженное до вытеснения хэша, оно не старее базы
+            if text and not target:
+                target.update(json.loads(text))
+            self._remember(kind, key, hash(text or EMPTY_STATE))
+            self.loads += 1
+        finally:
+            del self._loading[(kind, key)]
+            loaded.set_result(None)
+
+    def _mark(self, kind, key, data):
+        text = encode_state(data)
+        digest = hash(text)
+        if self._stored[kind].get(key) == digest:
+            self._stored[kind].move_to_end(key)
+            self.unchanged += 1
+            return
+        self._remember(kind, key, digest)
+        self._pending[(kind, key)] = None if text == EMPTY_STATE else text
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_soon())
+
+    async def _flush_soon(self):
+        # Приложение передает состояния пачкой корутин; ждем, пока отметятся все
+        await asyncio.sleep(0)
+        await self._write()
+
+    async def _write(self):
+        while self._pending:
+            changes, self._pending = self._pending, {}
+            try:
+                await self.db.save_conversation_states(
+                    [(kind, key, text) for (kind, key), text in changes.items()]
+                )
+            except Exception as e:
+                # Несохраненное вернется в очередь; более новые изменения тех же ключей важнее
+                for state_key, text in changes.items():
+                    self._pending.setdefault(state_key, text)
+                logger.error(f"Не удалось сохранить состояние диалогов ({len(changes)}): {e}")
+                return
+            self.writes += len(changes)
+            self.flushes += 1
+
+    async def get_user_data(self):
+        # Пользователи загружаются по одному при первом апдейте (refresh_user_data)
+        return {}
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        bot_data = {}
+        await self._load('bot', BOT_DATA_KEY, bot_data)
+        return bot_data
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        # ConversationHandler в боте не используется
+        return {}
+
+    async def update_conversation(self, name, key, new_state):
+        pass
+
+    async def refresh_user_data(self, user_id, user_data):
+        await self._load('user', user_id, user_data)
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        await self._load('chat', chat_id, chat_data)
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def update_user_data(self, user_id, data):
+        self._mark('user', user_id, data)
+
+    async def update_chat_data(self, chat_id, data):
+        self._mark('chat', chat_id, data)
+
+    async def update_bot_data(self, data):
+        self._mark('bot', BOT_DATA_KEY, data)
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_user_data(self, user_id):
+        self._mark('user', user_id, {})
+
+    async def drop_chat_data(self, chat_id):
+        self._mark('chat', chat_id, {})
+
+    async def flush(self):
+        """Записывает все отложенные изменения (вызывается при остановке приложения)"""
+        if self._flush_task is not None:
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+        await self._write()
+
+    def report(self):
+        loaded = sum(len(stored) for stored in self._stored.values())
+        return (
+            f"в памяти {loaded}, вытеснено {self.evicted}, записано {self.writes} за {self.flushes} проходов, "
+            f"без изменений {self.unchanged}, ожидают записи {len(self._pending)}"
+        )
@@ -0,0 +1,119 @@
+"""Окончание Premium-подписок.
+
+PremiumSweeper периодически (на job queue бота) снимает истекшие подписки
+пачками и возвращает бесплатную квоту откликов, а за PREMIUM_REMINDER_DAYS до
+окончания напоминает о продлении. Обе выборки идут по частичному индексу
+subscriptions (premium_until) WHERE is_premium, поэтому проверка не читает
+бесплатные подписки. Напоминания отправляются через OutboundSender с его
+лимитами; отметка reminded_until после доставки не дает напомнить дважды об
+одном сроке, а неотправленное напоминание повторяется при следующей проверке.
+
+Проверка между запусками не нужна для корректности: get_subscription и
+apply_to_vacancy сами сравнивают premium_until с текущим временем.
+"""
+import asyncio
+import logging
+from datetime import datetime
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from callbacks import callback_data
+from outbound import BLOCKED, SENT
+
+logger = logging.getLogger(__name__)
+
+PREMIUM_SWEEP_INTERVAL = 3600  # секунд между проверками
+PREMIUM_SWEEP_FIRST_DELAY = 60
+PREMIUM_SWEEP_BATCH = 500
+PREMIUM_REMINDER_DAYS = 3
+
+class PremiumSweeper:
+    """Снятие истекших подписок и напоминания о продлении"""
+
+    def __init__(self, db, sender, interval=PREMIUM_SWEEP_INTERVAL, reminder_days=PREMIUM_REMINDER_DAYS):
+        self.db = db
+        self.sender = sender
+        self.interval = interval
+        self.reminder_days = reminder_days
+        self._task = None
+        self._running = False
+
+    def start(self, job_queue=None):
+        """Планирует проверки; без job queue - собственной задачей asyncio"""
+        if job_queue is not None:
+            job_queue.run_repeating(self._job, interval=self.interval, first=PREMIUM_SWEEP_FIRST_DELAY,
+                                    name='premium-sweep')
+        else:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _job(self, context):
+        await self.sweep()
+
+    async def _loop(self):
+        await asyncio.sleep(PREMIUM_SWEEP_FIRST_DELAY)
+        while True:
+            await self.sweep()
+            await asyncio.sleep(self.interval)
+
+    async def sweep(self):
+        """Одна проверка; возвращает (снято подписок, отправлено напоминаний)"""
+        if self._running:
+            return 0, 0
+        self._running = True
+        try:
+            expired = 0
+            while True:
+                batch = await self.db.expire_premium(PREMIUM_SWEEP_BATCH)
+                expired += len(batch)
+                if len(batch) < PREMIUM_SWEEP_BATCH:
+                    break
+
+            reminded = 0
+            after_user_id = 0
+            while True:
+                reminders = await self.db.get_premium_reminders(self.reminder_days, after_user_id,
+                                                                PREMIUM_SWEEP_BATCH)
+                if not reminders:
+                    break
+                after_user_id = reminders[-1][0]
+                reminded += await self._remind(reminders)
+                if len(reminders) < PREMIUM_SWEEP_BATCH:
+                    break
+        finally:
+            self._running = False
+
+        if expired or reminded:
+            logger.info(f"Premium: снято истекших подписок {expired}, напоминаний о продлении {reminded}")
+        return expired, reminded
+
+    async def _remind(self, reminders):
+        results = await asyncio.gather(*(self._send(user_id, until) for user_id, until in reminders))
+        # Отмечаются только доставленные: после сетевой ошибки или флуд-лимита
+        # напоминание уйдет при следующей проверке, заблокировавших бота выборка пропускает
+        sent = [reminder for reminder, status in zip(reminders, results) if status == SENT]
+        if sent:
+            await self.db.mark_premium_reminded(sent)
+        blocked = [user_id for (user_id, _), status in zip(reminders, results) if status == BLOCKED]
+        if blocked:
+            await self.db.mark_users_blocked(blocked)
+        return len(sent)
+
+    async def _send(self, user_id, premium_until):
+        until = datetime.fromisoformat(premium_until).strftime('%d.%m.%Y')
+        status, error = await self.sender.send(
+            user_id,
+            f"💎 Premium действует до {until}. Продлите подписку, чтобы сохранить безлимитные отклики "
+            f"и видимость компаний.",
+            reply_markup=InlineKeyboardMarkup([[
+                InlineKeyboardButton("💳 Продлить Premium", callback_data=callback_data('premium_info'))
+            ]])
+        )
+        if error and status != BLOCKED:
+            logger.warning(f"Не удалось отправить напоминание о Premium {user_id}: {error}")
+        return status
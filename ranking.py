@@ -0,0 +1,375 @@
+"""Оценка релевантности вакансий профилю пользователя.
+
+Оценка складывается из двух частей:
+- не зависящей от профиля (полнота и качество вакансии) - считается один раз
+  при сохранении вакансии и хранится в vacancies.relevance_score;
+- зависящей от профиля (роль, уровень, формат, зарплата, навыки из резюме).
+
+RelevanceIndex держит признаки вакансий в памяти, сгруппированными по
+сегментам (роль, уровень, формат) и отсортированными по базовой оценке.
+Внутри сегмента вклад роли/уровня/формата одинаков, поэтому top-k для
+пользователя - это слияние сегментов по верхней границе оценки с ранней
+остановкой, а не сортировка всего каталога. RankedScan сохраняет состояние
+слияния между страницами ленты: следующая страница продолжает его с места
+остановки, и ее цена не зависит от номера.
+"""
+import heapq
+import threading
+from bisect import bisect_left, insort
+
+LEVELS = ['junior', 'middle', 'senior', 'lead']
+LEVEL_RANKS = {level: rank for rank, level in enumerate(LEVELS)}
+
+# Роли онбординга шире ролей вакансий: "engineering" покрывает backend, frontend и т.д.
+ROLE_FAMILIES = {
+    'engineering': {'backend', 'frontend', 'fullstack', 'devops', 'mobile', 'qa', 'engineering'},
+    'ai': {'ai', 'ml', 'data', 'data-science'},
+    'design': {'design', 'ui', 'ux'},
+    'product': {'product', 'project'},
+    'marketing': {'marketing', 'growth', 'content'},
+    'content': {'content', 'marketing'},
+    'sales': {'sales', 'business-development'},
+    'support': {'support', 'customer-success'},
+}
+
+WEIGHTS = {
+    'role': 3.0,
+    'level': 2.0,
+    'work_format': 1.0,
+    'salary': 1.5,
+    'skills': 2.5,
+    'base': 1.0,
+}
+MAX_SCORE = sum(WEIGHTS.values())
+
+# Вакансии с оценкой ниже этой доли от максимума в ленту не попадают
+MIN_SCORE = 0.4 * MAX_SCORE
+
+def split_tags(text):
+    """Множество тегов/навыков из строки 'python,sql' или списка"""
+    if not text:
+        return frozenset()
+    if isinstance(text, str):
+        text = text.split(',')
+    return frozenset(tag.strip().lower() for tag in text if tag and tag.strip())
+
+def base_score(vacancy):
+    """Не зависящая от профиля оценка вакансии в диапазоне 0..1"""
+    score = 0.0
+    if vacancy.get('salary_min') or vacancy.get('salary_max'):
+        score += 0.3
+    if vacancy.get('apply_url') or vacancy.get('contacts'):
+        score += 0.2
+    if len(vacancy.get('description_short') or '') >= 60:
+        score += 0.2
+    if vacancy.get('requirements'):
+        score += 0.15
+    if vacancy.get('tags'):
+        score += 0.15
+    return round(score, 4)
+
+def role_score(user_role, vacancy_role):
+    if not user_role or not vacancy_role:
+        return 0.5
+    if user_role == vacancy_role:
+        return 1.0
+    if vacancy_role in ROLE_FAMILIES.get(user_role, ()):
+        return 0.8
+    return 0.0
+
+def level_score(user_level, vacancy_level):
+    """Совпадение уровня - 1, соседний уровень - 0.5"""
+    user_rank = LEVEL_RANKS.get(user_level)
+    vacancy_rank = LEVEL_RANKS.get(vacancy_level)
+    if user_rank is None or vacancy_rank is None:
+        return 0.5
+    return {0: 1.0, 1: 0.5}.get(abs(user_rank - vacancy_rank), 0.0)
+
+def format_score(user_format, vacancy_format):
+    if not user_format or not vacancy_format or user_format == vacancy_format:
+        return 1.0
+    if 'hybrid' in (user_format, vacancy_format) or 'contract' in (user_format, vacancy_format):
+        return 0.4
+    return 0.0
+
+def salary_score(user_min, user_max, vacancy_min, vacancy_max):
+    """Перекрытие зарплатных вилок; если данных нет - нейтральные 0.5"""
+    if not (user_min or user_max) or not (vacancy_min or vacancy_max):
+        return 0.5
+    user_min = user_min or user_max
+    user_max = user_max or user_min
+    vacancy_min = vacancy_min or vacancy_max
+    vacancy_max = vacancy_max or vacancy_min
+    if vacancy_max >= user_min and vacancy_min <= user_max:
+        return 1.0
+    if vacancy_max < user_min:
+        # Вилка ниже ожиданий: штраф растет с разрывом
+        return max(0.0, 1.0 - (user_min - vacancy_max) / user_min * 2)
+    return 0.8
+
+def skills_score(user_skills, vacancy_tags):
+    """Доля тегов вакансии, покрытых навыками пользователя"""
+    if not user_skills or not vacancy_tags:
+        return 0.0
+    return min(1.0, len(user_skills & vacancy_tags) / min(len(vacancy_tags), 5))
+
+class VacancyFeatures:
+    """Признаки вакансии, нужные для ранжирования"""
+
+    __slots__ = ('id', 'role', 'level', 'work_format', 'salary_min', 'salary_max', 'tags', 'base')
+
+    def __init__(self, vacancy):
+        self.id = vacancy['id']
+        self.role = (vacancy.get('role') or '').lower()
+        self.level = (vacancy.get('level') or '').lower()
+        self.work_format = (vacancy.get('work_format') or '').lower()
+        self.salary_min = vacancy.get('salary_min')
+        self.salary_max = vacancy.get('salary_max')
+        self.tags = split_tags(vacancy.get('tags'))
+        relevance = vacancy.get('relevance_score')
+        self.base = relevance if relevance else base_score(vacancy)
+
+    @property
+    def segment(self):
+        return (self.role, self.level, self.work_format)
+
+    def sort_key(self):
+        # Внутри сегмента: базовая оценка по убыванию, затем новые вакансии выше
+        return (-self.base, -self.id)
+
+class UserProfile:
+    """Параметры пользователя для ранжирования"""
+
+    __slots__ = ('role', 'level', 'work_format', 'salary_min', 'salary_max', 'skills')
+
+    def __init__(self, user):
+        analysis = user.get('cv_analysis') or {}
+        self.role = (user.get('role') or '').lower()
+        self.level = (user.get('level') or '').lower()
+        self.work_format = (user.get('work_format') or '').lower()
+        self.salary_min = user.get('salary_min')
+        self.salary_max = user.get('salary_max')
+        self.skills = split_tags(analysis.get('skills') if isinstance(analysis, dict) else None)
+
+    @property
+    def key(self):
+        """Все, от чего зависит оценка: при смене профиля обход ленты начинается заново"""
+        return (self.role, self.level, self.work_format, self.salary_min, self.salary_max, self.skills)
+
+    def segment_score(self, segment):
+        role, level, work_format = segment
+        return (
+            WEIGHTS['role'] * role_score(self.role, role)
+            + WEIGHTS['level'] * level_score(self.level, level)
+            + WEIGHTS['work_format'] * format_score(self.work_format, work_format)
+        )
+
+    def item_score(self, features):
+        """Зависящая от вакансии часть оценки (без сегмента)"""
+        return (
+            WEIGHTS['base'] * features.base
+            + WEIGHTS['salary'] * salary_score(
+                self.salary_min, self.salary_max, features.salary_min, features.salary_max
+            )
+            + WEIGHTS['skills'] * skills_score(self.skills, features.tags)
+        )
+
+    def score(self, features):
+        return self.segment_score(features.segment) + self.item_score(features)
+
+class Segment:
+    """Вакансии одного сегмента (роль, уровень, формат) и их списки по тегам.
+
+    Все списки отсортированы по базовой оценке по убыванию.
+    """
+
+    __slots__ = ('items', 'postings')
+
+    def __init__(self):
+        self.items = []
+        self.postings = {}
+
+    def add(self, features, presorted=False):
+        lists = [self.items] + [self.postings.setdefault(tag, []) for tag in features.tags]
+        for items in lists:
+            if presorted:
+                items.append(features)
+            else:
+                insort(items, features, key=VacancyFeatures.sort_key)
+
+    def remove(self, features):
+        self.items.remove(features)
+        for tag in features.tags:
+            self.postings[tag].remove(features)
+            if not self.postings[tag]:
+                del self.postings[tag]
+
+class RankedScan:
+    """Обход вакансий для профиля в порядке ленты: (оценка, id) по убыванию.
+
+    Каждый сегмент дает несколько потоков, отсортированных по базовой оценке:
+    общий список (граница без вклада навыков - верна для вакансий без общих
+    с пользователем тегов) и списки по каждому навыку пользователя (граница
+    с полным вкладом навыков). Потоки сливаются по верхней границе; вакансия
+    отдается, как только ее оценка не ниже лучшей границы среди потоков.
+
+    Позиции потоков и уже оцененные, но не отданные вакансии хранятся между
+    вызовами next, поэтому страница стоит столько, сколько вакансий нужно
+    просмотреть для нее самой. Если индекс изменился, позиции находятся заново
+    бинарным поиском по следующей вакансии потока; новые вакансии выше уже
+    пройденного места попадут только в новый обход. after - курсор (оценка, id):
+    вакансии не ниже него пропускаются (продолжение ленты без сохраненного обхода).
+    """
+
+    def __init__(self, index, profile, exclude=(), after=None, min_score=MIN_SCORE):
+        self.index = index
+        self.profile = profile
+        self.exclude = exclude
+        self.after = after
+        self.min_score = min_score
+        self._candidates = []  # куча (-оценка, -id) оцененных, но не отданных вакансий
+        self._seen = set()
+
+        salary_cap = 1.0 if profile.salary_min or profile.salary_max else 0.5
+        rest = WEIGHTS['salary'] * salary_cap
+        with index._lock:
+            self.version = index.version
+            self.loads = index.loads
+            self._streams = []
+            for segment_key, segment in index._segments.items():
+                # Чужая роль - жесткий фильтр, остальное влияет только на порядок
+                if not segment.items or profile.role and not role_score(profile.role, segment_key[0]):
+                    continue
+                bonus = profile.segment_score(segment_key)
+                streams = [(segment.items, bonus + rest)]
+                streams.extend(
+                    (segment.postings[skill], bonus + rest + WEIGHTS['skills'])
+                    for skill in profile.skills if skill in segment.postings
+                )
+                for items, offset in streams:
+                    self._push(items, offset, 0)
+            heapq.heapify(self._streams)
+
+    @property
+    def stale(self):
+        """Индекс загружен заново: потоки обхода ему больше не принадлежат"""
+        return self.loads != self.index.loads
+
+    def _push(self, items, offset, position):
+        following = items[position]
+        bound = round(offset + WEIGHTS['base'] * following.base, 6)
+        if bound >= self.min_score:
+            heapq.heappush(self._streams, (-bound, -following.id, id(items), offset, items, position, following))
+
+    def _resync(self):
+        """Позиции потоков после изменения индекса.
+
+        Граница записи остается прежней: вакансии на найденной позиции не выше
+        прежней следующей, поэтому граница остается верхней.
+        """
+        streams = []
+        for negative_bound, negative_id, key, offset, items, _, following in self._streams:
+            position = bisect_left(items, following.sort_key(), key=VacancyFeatures.sort_key)
+            if position < len(items):
+                streams.append((negative_bound, negative_id, key, offset, items, position, following))
+        heapq.heapify(streams)
+        self._streams = streams
+        self.version = self.index.version
+
+    def next(self, k):
+        """Следующие k вакансий обхода: список пар (оценка, id)"""
+        found = []
+        with self.index._lock:
+            if self.version != self.index.version:
+                self._resync()
+            streams, candidates = self._streams, self._candidates
+            while len(found) < k:
+                if candidates:
+                    best = (-candidates[0][0], -candidates[0][1])
+                    # Граница сравнивается вместе с id: при равных оценках выше вакансия с большим id,
+                    # а внутри потока равные базовые оценки идут по убыванию id
+                    if not streams or best >= (-streams[0][0], -streams[0][1]):
+                        heapq.heappop(candidates)
+                        # Вакансию могли скрыть, пока она ждала в куче
+                        if best[1] in self.exclude or self.after is not None and best >= self.after:
+                            continue
+                        found.append(best)
+                        continue
+                if not streams:
+                    break
+
+                _, _, _, offset, items, position, _ = heapq.heappop(streams)
+                if position >= len(items):
+                    continue
+                features = items[position]
+                if position + 1 < len(items):
+                    self._push(items, offset, position + 1)
+
+                if features.id in self._seen or features.id in self.exclude:
+                    continue
+                self._seen.add(features.id)
+                score = round(self.profile.score(features), 6)
+                if score >= self.min_score:
+                    heapq.heappush(candidates, (-score, -features.id))
+        return found
+
+class RelevanceIndex:
+    """Индекс вакансий для ранжирования под профиль"""
+
+    def __init__(self):
+        self._segments = {}
+        self._by_id = {}
+        self._lock = threading.RLock()
+        self.loaded = False
+        self.version = 0  # меняется с каждым изменением индекса
+        self.loads = 0
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def load(self, vacancies):
+        """Полная загрузка индекса"""
+        features_list = sorted((VacancyFeatures(vacancy) for vacancy in vacancies), key=VacancyFeatures.sort_key)
+        with self._lock:
+            self._segments = {}
+            self._by_id = {}
+            for features in features_list:
+                self._by_id[features.id] = features
+                self._segments.setdefault(features.segment, Segment()).add(features, presorted=True)
+            self.loaded = True
+            self.loads += 1
+            self.version += 1
+
+    def add(self, vacancy):
+        """Добавляет или обновляет вакансию"""
+        features = VacancyFeatures(vacancy)
+        with self._lock:
+            self.remove(features.id)
+            self._by_id[features.id] = features
+            self._segments.setdefault(features.segment, Segment()).add(features)
+            self.version += 1
+
+    def remove(self, vacancy_id):
+        with self._lock:
+            features = self._by_id.pop(vacancy_id, None)
+            if features is not None:
+                self._segments[features.segment].remove(features)
+                self.version += 1
+
+    def score(self, profile, vacancy_id):
+        """Оценка одной вакансии для профиля (None, если вакансии нет в индексе)"""
+        features = self._by_id.get(vacancy_id)
+        return round(profile.score(features), 6) if features else None
+
+    def scan(self, profile, exclude=(), after=None, min_score=MIN_SCORE):
+        """Обход ленты профиля, продолжаемый постранично (см. RankedScan)"""
+        return RankedScan(self, profile, exclude=exclude, after=after, min_score=min_score)
+
+    def top_k(self, profile, k, exclude=(), after=None, min_score=MIN_SCORE):
+        """Лучшие k вакансий для профиля: список пар (оценка, id) по убыванию.
+
+        after - курсор (оценка, id) последней показанной вакансии: возвращаются
+        только вакансии строго ниже него в порядке ленты. Для последовательных
+        страниц дешевле продолжать один scan.
+        """
+        return self.scan(profile, exclude=exclude, after=after, min_score=min_score).next(k)
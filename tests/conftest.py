@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from job_bot import DatabaseManager  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path):
+    manager = DatabaseManager(str(tmp_path / 'jobs.db'))
+    yield manager
+    manager.close()
+
+
+@pytest.fixture
+def user(db):
+    """Пользователь с заполненной анкетой"""
+    db.save_user({'user_id': 1001, 'username': 'tester', 'first_name': 'Test', 'role': 'engineering',
+                  'level': 'senior', 'work_format': 'remote', 'location': 'Remote'})
+    return 1001
@@ -0,0 +1,47 @@
+import threading
+
+import pytest
+
+
+def apply_in_parallel(db, user_id, vacancy_ids):
+    """Отклики из отдельных потоков, стартующих одновременно"""
+    barrier = threading.Barrier(len(vacancy_ids))
+    results = [None] * len(vacancy_ids)
+
+    def apply(index, vacancy_id):
+        barrier.wait()
+        results[index] = db.apply_to_vacancy(user_id, vacancy_id)['status']
+
+    threads = [threading.Thread(target=apply, args=item) for item in enumerate(vacancy_ids)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def add_vacancies(db, count):
+    return [db.save_vacancy({'title': f"Parallel {number}", 'company': 'Acme', 'role': 'engineering',
+                             'apply_url': f"https://acme.example/parallel/{number}"})
+            for number in range(count)]
+
+
+@pytest.mark.parametrize('attempts, quota', [(12, 5), (4, 6)])
+def test_parallel_applies_never_exceed_quota(db, user, attempts, quota):
+    db.update_subscription(user, {'free_applications': quota})
+    results = apply_in_parallel(db, user, add_vacancies(db, attempts))
+
+    applied = min(attempts, quota)
+    assert results.count('applied') == applied
+    assert results.count('no_quota') == attempts - applied
+    assert db.get_subscription(user)['free_applications'] == quota - applied
+    assert db.fetchone('SELECT COUNT(*) AS n FROM applications WHERE user_id = ?', (user,))['n'] == applied
+
+
+def test_double_click_charges_once(db, user):
+    db.update_subscription(user, {'free_applications': 3})
+    vacancy_id = add_vacancies(db, 1)[0]
+    results = apply_in_parallel(db, user, [vacancy_id] * 6)
+
+    assert sorted(results) == ['applied'] + ['repeat'] * 5
+    assert db.get_subscription(user)['free_applications'] == 2
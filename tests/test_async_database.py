@@ -0,0 +1,53 @@
+import asyncio
+import threading
+
+from job_bot import AsyncDatabase
+
+
+def hold_write_lock(db, locked, release):
+    """Держит транзакцию записи в отдельном потоке, пока не выставлен release"""
+    with db.transaction() as conn:
+        conn.execute("UPDATE users SET first_name = 'Locked'")
+        locked.set()
+        release.wait(10)
+
+
+def test_handlers_progress_while_write_transaction_is_held(db, user):
+    locked, release = threading.Event(), threading.Event()
+    writer = threading.Thread(target=hold_write_lock, args=(db, locked, release))
+    writer.start()
+    assert locked.wait(5)
+    async_db = AsyncDatabase(db)
+
+    async def scenario():
+        ticks = 0
+
+        async def handler():
+            # Обработчик, которому база не нужна: event loop не должен стоять
+            nonlocal ticks
+            for _ in range(20):
+                await asyncio.sleep(0.005)
+                ticks += 1
+
+        # Запись ждет блокировку в потоке пула, а не в event loop
+        pending_write = asyncio.create_task(async_db.set_search_active(user, False))
+        await asyncio.wait_for(handler(), 2)
+        # Чтение в WAL не ждет писателя
+        profile = await asyncio.wait_for(async_db.get_user(user), 2)
+        assert not pending_write.done()
+
+        release.set()
+        await asyncio.wait_for(pending_write, 5)
+        return ticks, profile
+
+    try:
+        ticks, profile = asyncio.run(scenario())
+    finally:
+        release.set()
+        writer.join()
+        async_db.close()
+
+    assert ticks == 20
+    assert profile['first_name'] == 'Test'
+    assert db.get_user(user)['first_name'] == 'Locked'
+    assert not db.get_user(user)['search_active']
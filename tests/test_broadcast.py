@@ -0,0 +1,40 @@
+import asyncio
+
+from broadcast import BroadcastEngine
+from job_bot import AsyncDatabase
+from outbound import SENT
+
+
+class FakeSender:
+    """OutboundSender, у которого отправка одному пользователю падает не telegram-ошибкой"""
+
+    bot = None
+
+    def __init__(self, broken_user_id):
+        self.broken_user_id = broken_user_id
+
+    async def send(self, chat_id, text, **kwargs):
+        if chat_id == self.broken_user_id:
+            raise RuntimeError('serialization failed')
+        return SENT, None
+
+
+def test_unexpected_send_error_marks_recipient_failed(db, user):
+    for user_id in (1002, 1003):
+        db.save_user({'user_id': user_id, 'username': f"user{user_id}", 'first_name': 'Test'})
+    broadcast_id, total = db.create_broadcast('Hello', admin_chat_id=1)
+    async_db = AsyncDatabase(db)
+    engine = BroadcastEngine(async_db, FakeSender(broken_user_id=1002))
+
+    try:
+        asyncio.run(engine.run(broadcast_id))
+    finally:
+        async_db.close()
+
+    broadcast = db.get_broadcast(broadcast_id)
+    assert total == 3
+    assert broadcast['status'] == 'done'
+    assert (broadcast['sent_count'], broadcast['failed_count']) == (2, 1)
+    assert db.get_pending_recipients(broadcast_id) == []
+    failed = db.fetchone('SELECT status, error FROM broadcast_recipients WHERE user_id = 1002')
+    assert failed == {'status': 'failed', 'error': 'RuntimeError: serialization failed'}
@@ -0,0 +1,37 @@
+from cards import VacancyCards
+
+VACANCY = {'id': 7, 'title': 'Backend Developer', 'company': 'Acme', 'location': 'Berlin',
+           'work_format': 'remote', 'description_short': 'APIs', 'requirements': 'Python'}
+
+
+def test_card_read_before_edit_is_not_served_after_it():
+    cards = VacancyCards()
+    stale = dict(VACANCY)
+    edited = {**VACANCY, 'title': 'Senior Backend Developer'}
+
+    # Вакансия прочитана из базы, затем изменена и сброшена, и только потом собрана карточка
+    cards.on_vacancies([edited], created=False)
+    stale_text, _ = cards.feed(stale, premium=True, can_apply=True, saved=False)
+    text, _ = cards.feed(edited, premium=True, can_apply=True, saved=False)
+
+    assert 'Senior Backend Developer' not in stale_text
+    assert 'Senior Backend Developer' in text
+    assert cards.feed(edited, premium=True, can_apply=True, saved=False)[0] == text
+    assert (cards.hits, cards.misses) == (1, 2)
+
+
+def test_cards_are_cached_per_variant_and_escaped():
+    cards = VacancyCards()
+    vacancy = {**VACANCY, 'title': 'C_developer *remote*'}
+
+    free, _ = cards.feed(vacancy, premium=False, can_apply=False, saved=False)
+    _, saved_markup = cards.feed(vacancy, premium=False, can_apply=True, saved=True)
+    premium, _ = cards.feed(vacancy, premium=True, can_apply=True, saved=False)
+
+    assert 'C\\_developer \\*remote\\*' in free
+    assert '[Premium only]' in free and 'Acme' in premium
+    assert saved_markup.inline_keyboard[0][1].text == "💚 Saved"
+    assert (cards.hits, cards.misses) == (1, 2)
+
+    cards.on_vacancies([vacancy], created=False)
+    assert len(cards) == 0 and cards.invalidations == 2
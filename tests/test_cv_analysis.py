@@ -0,0 +1,29 @@
+import pytest
+
+from cv_analysis import ANALYZER_VERSION, SKILLS, analyze_cv, build_matcher
+
+
+def test_short_words_in_ordinary_text_are_not_skills():
+    text = ("Worked at TS Logistics and JS Bank, wrote ML of reports per day, "
+            "UI claims desk, go lang go! Took 5 ml of syrup. Сеньор, 6 лет опыта.")
+    analysis = analyze_cv(text)
+
+    assert analysis['skills'] == []
+    assert analysis['seniority'] == 'senior'
+    assert analysis['experience'] == 6
+    assert analysis['version'] == ANALYZER_VERSION
+
+
+def test_full_names_and_phrases_are_recognized():
+    text = ("ML engineer: TypeScript, JavaScript and Golang services on k8s. "
+            "UX research and UI designer work in Figma. Node.js, React.js.")
+    skills = set(analyze_cv(text)['skills'])
+
+    assert skills == {'machine-learning', 'typescript', 'javascript', 'go', 'kubernetes',
+                      'ux', 'ui', 'figma', 'node', 'react'}
+
+
+def test_short_synonyms_are_rejected(monkeypatch):
+    monkeypatch.setitem(SKILLS, 'typescript', ['typescript', 'ts'])
+    with pytest.raises(ValueError):
+        build_matcher()
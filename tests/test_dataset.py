@@ -0,0 +1,93 @@
+import sqlite3
+from datetime import date, datetime, timezone
+
+import pytest
+
+from dataset import LOADED_TABLES, generate
+from job_bot import FREE_APPLICATIONS, DatabaseManager
+
+SIZES = {'users': 200, 'vacancies': 500, 'actions': 4000, 'days': 60, 'end': date(2026, 1, 1), 'seed': 7,
+         'premium_ratio': 0.4}
+
+
+def utc(text):
+    return datetime.fromisoformat(text).replace(tzinfo=timezone.utc).timestamp()
+
+
+def dump(path):
+    conn = sqlite3.connect(path)
+    try:
+        return {table: conn.execute(f'SELECT * FROM {table} ORDER BY 1, 2').fetchall() for table in LOADED_TABLES}
+    finally:
+        conn.close()
+
+
+@pytest.fixture(scope='module')
+def dataset(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('dataset') / 'synthetic.db')
+    counts = generate(path, report=lambda line: None, **SIZES)
+    return path, counts
+
+
+def test_same_seed_gives_same_database(dataset, tmp_path):
+    path, counts = dataset
+    again = str(tmp_path / 'again.db')
+    assert generate(again, report=lambda line: None, **SIZES) == counts
+    assert dump(again) == dump(path)
+    other = str(tmp_path / 'other.db')
+    generate(other, report=lambda line: None, **{**SIZES, 'seed': 8})
+    assert dump(other)['user_actions'] != dump(path)['user_actions']
+
+
+def test_applications_and_quotas_are_consistent(dataset):
+    path, counts = dataset
+    conn = sqlite3.connect(path)
+    try:
+        assert counts['users'] == SIZES['users'] and counts['vacancies'] == SIZES['vacancies']
+        applied = set(conn.execute("SELECT user_id, vacancy_id FROM user_actions WHERE action = 'applied'"))
+        applications = conn.execute('SELECT user_id, vacancy_id FROM applications').fetchall()
+        assert applied and set(applications) == applied and len(applications) == len(applied)
+
+        after_expiry = 0
+        for user_id, active, until, free_left in conn.execute(
+                'SELECT user_id, is_premium, premium_until, free_applications FROM subscriptions'):
+            paid = conn.execute("SELECT MIN(created_at) FROM payments WHERE user_id = ? AND status = 'succeeded'",
+                                (user_id,)).fetchone()[0]
+            start = utc(paid) if until else float('inf')
+            until = datetime.fromisoformat(until).timestamp() if until else float('inf')
+            before, during, after = [0, 0], [0, 0], [0, 0]
+            for created_at, charged in conn.execute(
+                    'SELECT created_at, charged FROM applications WHERE user_id = ?', (user_id,)):
+                moment = utc(created_at)
+                (before if moment < start else during if moment < until else after)[charged] += 1
+
+            # Без списания - только отклики в оплаченный период Premium
+            assert during[1] == 0 and before[0] == after[0] == 0
+            assert before[1] <= FREE_APPLICATIONS and after[1] <= FREE_APPLICATIONS
+            # Окончание Premium восстанавливает квоту, как expire_premium
+            assert free_left == FREE_APPLICATIONS - (before[1] if active or until == float('inf') else after[1])
+            after_expiry += after[1]
+        assert after_expiry
+
+        # Действия идут после регистрации, ID растут вместе со временем
+        assert not conn.execute('''
+            SELECT 1 FROM user_actions a JOIN users u ON u.user_id = a.user_id WHERE a.created_at < u.created_at
+        ''').fetchone()
+        times = [row[0] for row in conn.execute('SELECT created_at FROM user_actions ORDER BY id')]
+        assert times == sorted(times)
+    finally:
+        conn.close()
+
+
+def test_indexes_and_search_are_restored(dataset, tmp_path):
+    path, _ = dataset
+    fresh = DatabaseManager(str(tmp_path / 'fresh.db'))
+    generated = DatabaseManager(path)
+    try:
+        schema = "SELECT type, name FROM sqlite_master WHERE type IN ('index', 'trigger') ORDER BY 1, 2"
+        assert generated.fetchall(schema) == fresh.fetchall(schema)
+        title = generated.fetchone('SELECT title FROM vacancies ORDER BY id LIMIT 1')['title']
+        assert generated.search_vacancy_ids(title.split()[-1], limit=5)
+    finally:
+        fresh.close()
+        generated.close()
@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+
+from documents import (FIXTURES_DIR, DocumentError, DocumentProcessor, DocumentQueueFull, DocumentTooLarge,
+                       FixtureDocumentSource, parse_document)
+from job_bot import AsyncDatabase
+
+
+class InlineAnalyzer:
+    """CVAnalyzer без пула процессов"""
+
+    async def run(self, func, *args):
+        return func(*args)
+
+
+class CountingSource(FixtureDocumentSource):
+    def __init__(self):
+        super().__init__()
+        self.fetches = 0
+
+    async def fetch(self, file_id, max_size):
+        self.fetches += 1
+        return await super().fetch(file_id, max_size)
+
+
+@pytest.mark.parametrize('file_name, skills, experience, seniority', [
+    ('cv_backend.docx', {'python', 'django', 'postgresql', 'docker'}, 6, 'senior'),
+    ('cv_data.pdf', {'python', 'machine-learning', 'spark', 'sql'}, 4, 'lead'),
+    ('cv_designer.doc', {'figma'}, 3, 'middle'),
+])
+def test_fixture_documents_are_parsed(file_name, skills, experience, seniority):
+    text, analysis = parse_document((FIXTURES_DIR / file_name).read_bytes(), file_name)
+
+    assert text and '  ' not in text
+    assert skills <= set(analysis['skills'])
+    assert (analysis['experience'], analysis['seniority']) == (experience, seniority)
+
+
+def test_broken_document_gives_empty_text():
+    assert parse_document(b'PK\x03\x04 not a zip', 'cv.docx') == ('', parse_document(b'', 'cv.txt')[1])
+
+
+def test_processor_caches_by_unique_id_and_rejects_bad_files(db):
+    async_db = AsyncDatabase(db)
+    source = CountingSource()
+
+    async def scenario():
+        processor = DocumentProcessor(async_db, InlineAnalyzer())
+        first = await processor.process(source, 'cv_backend.docx', 'unique-1', 'cv_backend.docx')
+        again = await processor.process(source, 'other-file-id', 'unique-1', 'cv_backend.docx')
+
+        with pytest.raises(DocumentTooLarge):
+            await DocumentProcessor(async_db, InlineAnalyzer(), max_size=100).process(
+                source, 'cv_data.pdf', 'unique-2', 'cv_data.pdf')
+        with pytest.raises(DocumentError):
+            await processor.process(source, 'cv_designer.doc', 'unique-3', 'cv_designer.docx')
+
+        full = DocumentProcessor(async_db, InlineAnalyzer(), queue_limit=0)
+        with pytest.raises(DocumentQueueFull):
+            await full.process(source, 'cv_data.pdf', 'unique-4', 'cv_data.pdf')
+        return first, again, processor.pending
+
+    try:
+        first, again, pending = asyncio.run(scenario())
+    finally:
+        async_db.close()
+
+    assert not first['cached'] and again['cached']
+    assert again['cv_text'] == first['cv_text'] and again['cv_analysis'] == first['cv_analysis']
+    assert source.fetches == 3
+    assert pending == 0
+    assert db.get_cv_file('unique-3') is None
+
+
+def test_processor_runs_at_most_workers_documents_at_once(db):
+    async_db = AsyncDatabase(db)
+
+    class SlowSource(FixtureDocumentSource):
+        active = peak = 0
+
+        async def fetch(self, file_id, max_size):
+            SlowSource.active += 1
+            SlowSource.peak = max(SlowSource.peak, SlowSource.active)
+            await asyncio.sleep(0.01)
+            SlowSource.active -= 1
+            return await super().fetch(file_id, max_size)
+
+    async def scenario():
+        processor = DocumentProcessor(async_db, InlineAnalyzer(), workers=2)
+        return await asyncio.gather(*(
+            processor.process(SlowSource(), 'cv_data.pdf', f"unique-{number}", 'cv_data.pdf') for number in range(6)
+        ))
+
+    try:
+        results = asyncio.run(scenario())
+    finally:
+        async_db.close()
+
+    assert SlowSource.peak == 2
+    assert all(not result['cached'] and 'spark' in result['cv_analysis']['skills'] for result in results)
@@ -0,0 +1,61 @@
+import threading
+
+from job_bot import EXCLUSION_MERGE_MIN, ExclusionCache, ExclusionSet
+
+
+def test_exclusion_set_merges_additions_in_batches():
+    excluded = ExclusionSet(range(0, 2000, 2))
+    for vacancy_id in range(1, 2 * EXCLUSION_MERGE_MIN + 400, 2):
+        excluded.add(vacancy_id)
+        assert vacancy_id in excluded
+    excluded.add(4)
+
+    assert len(excluded) == 1000 + EXCLUSION_MERGE_MIN + 200
+    assert list(excluded.ids) == sorted(excluded.ids)
+    assert len(excluded.recent) <= max(EXCLUSION_MERGE_MIN, len(excluded.ids) // 8)
+    assert all(vacancy_id in excluded for vacancy_id in range(0, 2000, 2))
+    assert 2001 not in excluded
+
+
+def test_concurrent_notes_are_not_lost():
+    cache = ExclusionCache()
+    cache.put(1, ExclusionSet())
+
+    def hide(start):
+        for vacancy_id in range(start, start + 500):
+            cache.note(1, vacancy_id)
+
+    threads = [threading.Thread(target=hide, args=(n * 500,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(cache.get(1)) == 2000
+    assert all(vacancy_id in cache.get(1) for vacancy_id in range(2000))
+
+
+def test_hide_during_load_is_kept():
+    cache = ExclusionCache()
+
+    def read_ids():
+        # Скрытие записано после чтения истории из базы, но до появления множества в кэше
+        cache.note(1, 99)
+        return [1, 2]
+
+    excluded = cache.load(1, read_ids)
+    assert 99 in excluded and 1 in excluded
+    assert cache.load(1, lambda: []) is excluded
+
+
+def test_exclusions_are_loaded_once_and_kept_current(db, user):
+    vacancy_ids = [row['id'] for row in db.fetchall('SELECT id FROM vacancies ORDER BY id LIMIT 3')]
+    db.save_user_action(user, vacancy_ids[0], 'hidden')
+
+    excluded = db.get_exclusions(user)
+    assert vacancy_ids[0] in excluded
+    db.save_user_action(user, vacancy_ids[1], 'hidden')
+    db.apply_to_vacancy(user, vacancy_ids[2])
+
+    assert db.get_exclusions(user) is excluded
+    assert all(vacancy_id in excluded for vacancy_id in vacancy_ids)
@@ -0,0 +1,76 @@
+import asyncio
+
+import httpx
+
+from ingestion import FEEDS_DIR, FixtureServer, HttpFeedSource, IngestionScheduler, load_sources
+from job_bot import AsyncDatabase
+
+
+def run_scheduler(db, sources, passes):
+    async_db = AsyncDatabase(db)
+
+    async def scenario():
+        scheduler = IngestionScheduler(async_db, sources)
+        try:
+            return [{run.name: run for run in await scheduler.run_all()} for _ in range(passes)]
+        finally:
+            await scheduler.stop()
+
+    try:
+        return asyncio.run(scenario())
+    finally:
+        async_db.close()
+
+
+def test_second_pass_over_fixture_feeds_is_not_modified(db):
+    before = db.get_stats()['vacancies_count']
+    with FixtureServer() as server:
+        first, second = run_scheduler(db, load_sources(FEEDS_DIR / 'sources.json', server.base_url), passes=2)
+
+    inserted = sum(run.counts['inserted'] for run in first.values())
+    assert inserted > 0 and all(not run.errors for run in first.values())
+    assert db.get_stats()['vacancies_count'] == before + inserted
+    assert first['remote_board'].not_modified == 0
+    # Сервер отвечает 304 по Last-Modified, файл не изменился - ничего не разбирается
+    assert (second['remote_board'].not_modified, second['ml_partner'].not_modified) == (2, 1)
+    assert all(run.counts['fetched'] == 0 for run in second.values())
+    assert set(db.get_ingestion_state('remote_board')) == set(load_sources(
+        FEEDS_DIR / 'sources.json', server.base_url)[0].locations)
+
+
+def test_http_source_sends_validators_and_drops_stale_items(db):
+    requests = []
+    jobs = [
+        {'id': 1, 'title': 'Python Developer', 'company': 'Acme', 'updated_at': 100,
+         'apply_url': 'https://acme.example/1'},
+        {'id': 2, 'title': 'Go Developer', 'company': 'Acme', 'updated_at': 200, 'apply_url': 'https://acme.example/2'},
+    ]
+
+    def handler(request):
+        requests.append(request)
+        if request.url.host == 'broken.example':
+            return httpx.Response(500)
+        etag = f'"v{len(jobs)}"'
+        if request.headers.get('If-None-Match') == etag:
+            return httpx.Response(304)
+        # Сервер без поддержки since отдает все элементы, в том числе старые
+        return httpx.Response(200, json={'items': jobs}, headers={'ETag': etag})
+
+    source = HttpFeedSource('board', ['https://board.example/jobs', 'https://broken.example/jobs'],
+                            since_param='since', transport=httpx.MockTransport(handler))
+    first, second = run_scheduler(db, [source], passes=2)
+    jobs.append({'id': 3, 'title': 'Data Engineer', 'company': 'Acme', 'updated_at': 300,
+                 'apply_url': 'https://acme.example/3'})
+    third, = run_scheduler(db, [source], passes=1)
+
+    assert first['board'].counts['inserted'] == 2
+    assert len(first['board'].errors) == 1 and 'HTTP 500' in first['board'].errors[0]
+    assert second['board'].not_modified == 1
+    repeated = [request for request in requests if request.url.host == 'board.example'][1]
+    assert repeated.headers['If-None-Match'] == '"v2"' and repeated.url.params['since'] == '200'
+    # Элемент со старой отметкой отброшен, с равной - записан повторно без изменений
+    assert third['board'].counts == {'fetched': 3, 'stale': 1, 'inserted': 1, 'updated': 0, 'skipped': 1,
+                                     'failed': 0}
+    state = db.get_ingestion_state('board')
+    assert state['https://board.example/jobs'] == {'etag': '"v3"', 'high_water': 300}
+    assert 'https://broken.example/jobs' not in state
@@ -0,0 +1,90 @@
+import asyncio
+import re
+
+import pytest
+
+from metrics import LATENCY_BUCKETS, METRICS_PREFIX, Metrics
+
+# Строка экспозиции Prometheus: имя, необязательные метки и значение
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{((?:[a-zA-Z_]\w*="(?:\\.|[^"\\])*",?)*)\})? (\S+)$')
+LABEL = re.compile(r'([a-zA-Z_]\w*)="((?:\\.|[^"\\])*)"')
+
+
+def parse(text):
+    """{(имя, метки): значение} с проверкой формата каждой строки"""
+    assert text.endswith('\n')
+    samples = {}
+    types = {}
+    for line in text.splitlines():
+        if line.startswith('# TYPE '):
+            _, _, name, kind = line.split(' ')
+            assert kind in ('gauge', 'counter', 'histogram') and name not in types
+            types[name] = kind
+            continue
+        if line.startswith('# HELP '):
+            continue
+        match = SAMPLE.match(line)
+        assert match, line
+        name, labels, value = match.groups()
+        family = re.sub(r'_(bucket|sum|count)$', '', name) if types.get(name) is None else name
+        assert family in types, line
+        samples[(name, tuple(LABEL.findall(labels or '')))] = float(value)
+    return samples
+
+
+class Store:
+    def find(self, vacancy_id):
+        return vacancy_id
+
+    def fail(self):
+        raise RuntimeError('locked')
+
+
+def test_render_is_valid_prometheus_text():
+    metrics = Metrics(enabled=True)
+    store = Store()
+    metrics.instrument_methods(store, 'db')
+    store.find(1)
+    store.find(2)
+    with pytest.raises(RuntimeError):
+        store.fail()
+
+    async def handler():
+        await asyncio.sleep(0)
+    asyncio.run(metrics.timed('handler', 'callback:apply', handler)())
+    metrics.observe('telegram', 'sendMessage', 0.003)
+    metrics.observe('telegram', 'sendMessage', 30.0, failed=True)
+    metrics.observe('handler', 'say "hi"\n', 0.02)
+
+    samples = parse(metrics.render())
+    name = f"{METRICS_PREFIX}_telegram_seconds"
+    label = (('method', 'sendMessage'),)
+    buckets = [samples[(f"{name}_bucket", label + (('le', str(bound)),))] for bound in LATENCY_BUCKETS]
+    assert buckets == sorted(buckets) and buckets[0] == 0 and buckets[-1] == 1
+    assert samples[(f"{name}_bucket", label + (('le', '+Inf'),))] == 2
+    assert samples[(f"{name}_count", label)] == 2
+    assert samples[(f"{name}_sum", label)] == pytest.approx(30.003)
+    assert samples[(f"{METRICS_PREFIX}_telegram_errors_total", label)] == 1
+
+    assert samples[(f"{METRICS_PREFIX}_db_seconds_count", (('query', 'find'),))] == 2
+    assert samples[(f"{METRICS_PREFIX}_db_errors_total", (('query', 'fail'),))] == 1
+    assert samples[(f"{METRICS_PREFIX}_db_in_flight", (('query', 'fail'),))] == 0
+    assert samples[(f"{METRICS_PREFIX}_handler_seconds_count", (('handler', 'callback:apply'),))] == 1
+    assert samples[(f"{METRICS_PREFIX}_handler_errors_total", (('handler', 'say \\"hi\\"\\n'),))] == 0
+
+
+def test_disabled_metrics_do_not_wrap_methods():
+    store = Store()
+    Metrics(enabled=False).instrument_methods(store, 'db')
+    assert 'find' not in vars(store)
+
+
+def test_written_file_matches_render(tmp_path):
+    metrics = Metrics(enabled=True)
+    metrics.observe('db', 'get_user', 0.0004)
+    path = tmp_path / 'metrics.prom'
+    metrics.write(path)
+
+    assert path.read_text(encoding='utf-8') == metrics.render()
+    assert [entry.name for entry in tmp_path.iterdir()] == ['metrics.prom']
+    assert metrics.summary('db') == ['get_user: 1 вызовов, среднее 0.4 мс, p95 ≤1 мс, ошибок 0, сейчас 0']
@@ -0,0 +1,65 @@
+import asyncio
+
+from job_bot import AsyncDatabase
+from persistence import SQLitePersistence
+
+
+def run_with(db, scenario, **kwargs):
+    async_db = AsyncDatabase(db)
+    try:
+        return asyncio.run(scenario(SQLitePersistence(async_db, **kwargs)))
+    finally:
+        async_db.close()
+
+
+def test_state_survives_restart(db):
+    async def before_restart(persistence):
+        user_data = {}
+        await persistence.refresh_user_data(1001, user_data)
+        user_data.update({'awaiting': 'cv', 'step': 2})
+        await persistence.update_user_data(1001, user_data)
+        await persistence.update_bot_data({'broadcast_draft': 'Hello'})
+        await persistence.update_user_data(1002, {})
+        await persistence.flush()
+        return persistence.writes
+
+    async def after_restart(persistence):
+        user_data, empty = {}, {}
+        await persistence.refresh_user_data(1001, user_data)
+        await persistence.refresh_user_data(1002, empty)
+        # Неизмененное состояние после загрузки не записывается повторно
+        await persistence.update_user_data(1001, user_data)
+        await persistence.flush()
+        return user_data, empty, await persistence.get_bot_data(), persistence.writes
+
+    assert run_with(db, before_restart) == 3
+    user_data, empty, bot_data, writes = run_with(db, after_restart)
+    assert user_data == {'awaiting': 'cv', 'step': 2}
+    assert empty == {}
+    assert bot_data == {'broadcast_draft': 'Hello'}
+    assert writes == 0
+
+
+def test_digests_are_bounded_and_eviction_keeps_newer_memory_state(db):
+    async def scenario(persistence):
+        first = {}
+        await persistence.refresh_user_data(1, first)
+        first['step'] = 1
+        await persistence.update_user_data(1, first)
+        for user_id in range(2, 10):
+            await persistence.update_user_data(user_id, {'step': user_id})
+        await persistence.flush()
+
+        # Хэш пользователя 1 вытеснен; изменение в памяти еще не передано persistence
+        first['step'] = 2
+        await persistence.refresh_user_data(1, first)
+        reloaded = dict(first)
+        await persistence.update_user_data(1, first)
+        await persistence.flush()
+        return persistence, reloaded
+
+    persistence, reloaded = run_with(db, scenario, max_keys=4)
+    assert len(persistence._stored['user']) == 4
+    assert persistence.evicted == 6
+    assert reloaded == {'step': 2}
+    assert db.get_conversation_state('user', 1) == '{"step":2}'
@@ -0,0 +1,46 @@
+import asyncio
+
+from job_bot import AsyncDatabase
+from outbound import BLOCKED, FAILED, SENT
+from premium import PremiumSweeper
+
+
+class FakeSender:
+    """OutboundSender с заданным статусом отправки для каждого чата"""
+
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.sent = []
+
+    async def send(self, chat_id, text, **kwargs):
+        status = self.statuses.get(chat_id, SENT)
+        if status == SENT:
+            self.sent.append(chat_id)
+        return status, None if status == SENT else 'error'
+
+
+def test_only_delivered_reminders_are_marked(db, user):
+    for user_id in (1002, 1003):
+        db.save_user({'user_id': user_id, 'username': f"user{user_id}", 'first_name': 'Test'})
+    for user_id in (1001, 1002, 1003):
+        db.extend_premium(user_id, days=2)
+    async_db = AsyncDatabase(db)
+    sender = FakeSender({1002: FAILED, 1003: BLOCKED})
+    sweeper = PremiumSweeper(async_db, sender)
+
+    async def scenario():
+        first = await sweeper.sweep()
+        # Сеть восстановилась: напоминание 1002 уходит при следующей проверке
+        sender.statuses[1002] = SENT
+        second = await sweeper.sweep()
+        third = await sweeper.sweep()
+        return first, second, third
+
+    try:
+        sweeps = asyncio.run(scenario())
+    finally:
+        async_db.close()
+
+    assert sweeps == ((0, 1), (0, 1), (0, 0))
+    assert sender.sent == [1001, 1002]
+    assert db.get_user(1003)['blocked_at'] is not None
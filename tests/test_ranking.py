@@ -0,0 +1,123 @@
+import random
+
+from job_bot import FEED_PAGE_SIZE, ExclusionSet
+from ranking import MIN_SCORE, RelevanceIndex, UserProfile, role_score
+
+ROLES = ['backend', 'frontend', 'devops', 'ml', 'design']
+TAGS = ['python', 'sql', 'docker', 'go', 'react', 'aws', 'figma']
+USER = {'role': 'engineering', 'level': 'middle', 'work_format': 'remote', 'salary_min': 3000,
+        'cv_analysis': {'skills': ['python', 'docker']}}
+
+
+def random_vacancy(rng, vacancy_id):
+    salary_min = rng.choice([None, 2000, 3000, 5000])
+    return {
+        'id': vacancy_id, 'role': rng.choice(ROLES), 'level': rng.choice(['junior', 'middle', 'senior']),
+        'work_format': rng.choice(['remote', 'hybrid', 'office']), 'salary_min': salary_min,
+        'salary_max': salary_min and salary_min + 1000, 'tags': ','.join(rng.sample(TAGS, rng.randint(0, 3))),
+        'relevance_score': rng.choice([0.2, 0.5, 0.65, 0.85, 1.0]),
+    }
+
+
+def build_index(count=3000, seed=1):
+    rng = random.Random(seed)
+    index = RelevanceIndex()
+    index.load(random_vacancy(rng, vacancy_id) for vacancy_id in range(1, count + 1))
+    return index
+
+
+def full_sort(index, profile, exclude=()):
+    ranked = []
+    for features in index._by_id.values():
+        if features.id in exclude or not role_score(profile.role, features.role):
+            continue
+        score = round(profile.score(features), 6)
+        if score >= MIN_SCORE:
+            ranked.append((score, features.id))
+    return sorted(ranked, reverse=True)
+
+
+class CountingProfile(UserProfile):
+    __slots__ = ('scored',)
+
+    def score(self, features):
+        self.scored += 1
+        return super().score(features)
+
+
+def test_pages_of_one_scan_match_full_sort():
+    index = build_index()
+    profile = UserProfile(USER)
+    exclude = ExclusionSet(range(1, 3000, 7))
+
+    scan = index.scan(profile, exclude=exclude)
+    pages = []
+    while page := scan.next(FEED_PAGE_SIZE):
+        pages.extend(page)
+
+    assert pages == full_sort(index, profile, exclude)
+    assert index.top_k(profile, FEED_PAGE_SIZE, after=pages[9]) == pages[10:10 + FEED_PAGE_SIZE]
+
+
+def test_deep_page_does_not_rescore_earlier_pages():
+    index = build_index(count=20000)
+    profile = CountingProfile(USER)
+    profile.scored = 0
+    scan = index.scan(profile)
+    for _ in range(200):
+        scan.next(FEED_PAGE_SIZE)
+
+    scored = profile.scored
+    assert len(scan.next(FEED_PAGE_SIZE)) == FEED_PAGE_SIZE
+    # Страница продолжает слияние: пересчитываются единицы вакансий, а не все 1000 выше нее
+    assert profile.scored - scored < 200
+
+
+def test_scan_survives_index_changes_between_pages():
+    index = build_index()
+    profile = UserProfile(USER)
+    scan = index.scan(profile)
+    first = scan.next(50)
+    upcoming = index.scan(profile).next(150)[50:]
+
+    removed = upcoming[3][1]
+    index.remove(removed)
+    # Новая вакансия выше пройденного места достается только новому обходу
+    index.add({'id': 99999, 'role': 'backend', 'level': 'middle', 'work_format': 'remote', 'salary_min': 3000,
+               'tags': 'python,docker', 'relevance_score': 1.0})
+    rest = scan.next(50)
+
+    shown = [vacancy_id for _, vacancy_id in first + rest]
+    assert len(shown) == len(set(shown))
+    assert removed not in shown
+    assert rest == [item for item in upcoming if item[1] != removed][:50]
+
+
+def test_feed_pages_resume_and_skip_vacancies_hidden_meanwhile(db, user):
+    rng = random.Random(5)
+    for number in range(300):
+        vacancy = random_vacancy(rng, number)
+        del vacancy['id'], vacancy['relevance_score']
+        db.save_vacancy({**vacancy, 'title': f"Vacancy {number}", 'company': 'Acme',
+                         'apply_url': f"https://acme.example/{number}", 'description_short': 'x' * 80})
+    profile_user = db.get_user(user)
+    expected = [vacancy['id'] for vacancy in db.get_ranked_vacancies(profile_user, limit=1000)]
+    assert len(expected) > 3 * FEED_PAGE_SIZE
+
+    # Как show_feed: страница на одну вакансию больше, курсор - последняя показанная
+    first = db.get_ranked_vacancies(profile_user, limit=FEED_PAGE_SIZE + 1)
+    cursor = first[FEED_PAGE_SIZE - 1]['id']
+    hidden = expected[FEED_PAGE_SIZE + 1]
+    db.save_user_action(user, hidden, 'hidden')
+    session = db.feed_sessions.get(user)
+    second = db.get_ranked_vacancies(profile_user, limit=FEED_PAGE_SIZE + 1, after_id=cursor)
+
+    assert db.feed_sessions.get(user) is session
+    assert [vacancy['id'] for vacancy in second] == [
+        vacancy_id for vacancy_id in expected if vacancy_id != hidden
+    ][FEED_PAGE_SIZE:2 * FEED_PAGE_SIZE + 1]
+
+    # Без сохраненного обхода курсор продолжает ленту по оценке
+    db.feed_sessions.discard(user)
+    again = db.get_ranked_vacancies(profile_user, limit=FEED_PAGE_SIZE + 1, after_id=cursor)
+    assert [vacancy['id'] for vacancy in again] == [vacancy['id'] for vacancy in second]
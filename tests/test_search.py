@@ -0,0 +1,61 @@
+from callbacks import callback_data, parse_callback
+
+
+def add_vacancies(db, count, start=0):
+    return [db.save_vacancy({
+        'title': f"Python Engineer {number}", 'company': 'Acme', 'apply_url': f"https://acme.example/{number}",
+        'tags': 'python,sql', 'description_short': 'python ' * (number % 7 + 1),
+    }) for number in range(start, start + count)]
+
+
+def page_ids(db, user_id, search_id, offset, limit=5):
+    vacancies, _ = db.get_search_page(user_id, search_id, offset, limit)
+    return [vacancy['id'] for vacancy in vacancies]
+
+
+def test_snapshot_follows_rank_order_with_snippets(db):
+    add_vacancies(db, 20)
+    session = db.start_search(1, 'python')
+    everything = []
+    for offset in range(0, len(session.ids), 3):
+        vacancies, total = db.get_search_page(1, session.search_id, offset, 3)
+        assert total == len(session.ids)
+        assert all('\x02' in vacancy['search_snippet'] for vacancy in vacancies)
+        everything.extend(vacancy['id'] for vacancy in vacancies)
+
+    assert everything == session.ids == db.search_vacancy_ids('python')
+    assert len(everything) == len(set(everything)) >= 20
+
+
+def test_writes_between_pages_do_not_shift_the_snapshot(db):
+    add_vacancies(db, 20)
+    session = db.start_search(1, 'python')
+    first = page_ids(db, 1, session.search_id, 0)
+
+    # Новые вакансии меняют статистику BM25 и ранги всех совпадений
+    added = add_vacancies(db, 30, start=100)
+    db.save_vacancy({'title': 'Python Engineer 3', 'company': 'Acme', 'apply_url': 'https://acme.example/3',
+                     'tags': 'go'})
+    rest = []
+    for offset in range(5, len(session.ids), 5):
+        rest.extend(page_ids(db, 1, session.search_id, offset))
+
+    assert first + rest == session.ids
+    assert not set(rest) & set(added)
+
+
+def test_button_of_an_older_search_is_rejected(db):
+    add_vacancies(db, 12)
+    older = db.start_search(1, 'python')
+    newer = db.start_search(1, 'sql')
+
+    assert db.get_search_page(1, older.search_id, 5) is None
+    assert db.get_search_page(2, newer.search_id, 5) is None
+    assert page_ids(db, 1, newer.search_id, 5)
+
+
+def test_search_page_round_trips_through_callback_data():
+    data = callback_data('search_page', 2 ** 32 - 1, 995)
+    assert len(data.encode()) <= 64
+    assert parse_callback(data) == ('search_page', [2 ** 32 - 1, 995])
+    assert parse_callback(callback_data('search_page', 7)) == ('search_page', [7])
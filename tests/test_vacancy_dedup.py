@@ -0,0 +1,63 @@
+from job_bot import vacancy_fingerprint
+
+VACANCY = {'title': 'Python Backend Developer', 'company': 'Acme', 'apply_url': 'https://acme.example/jobs/1',
+           'tags': 'python,django', 'role': 'backend', 'level': 'senior'}
+
+
+def add_stale_duplicate(db, vacancy):
+    """Копия вакансии со старым отпечатком, как до смены нормализации"""
+    with db.transaction() as conn:
+        return conn.execute(
+            "INSERT INTO vacancies (title, company, apply_url, tags, fingerprint) VALUES (?, ?, ?, ?, 'stale')",
+            (vacancy['title'].upper(), vacancy['company'], vacancy['apply_url'], vacancy['tags'])
+        ).lastrowid
+
+
+def actions(db, user_id, vacancy_id):
+    return [row['action'] for row in db.fetchall(
+        'SELECT action FROM user_actions WHERE user_id = ? AND vacancy_id = ? ORDER BY id', (user_id, vacancy_id)
+    )]
+
+
+def test_compaction_keeps_resaved_vacancy(db, user):
+    kept = db.save_vacancy(VACANCY)
+    duplicate = add_stale_duplicate(db, VACANCY)
+    assert db.set_saved(user, kept, True)
+    assert db.set_saved(user, kept, False)
+    assert db.set_saved(user, kept, True)
+    db.save_user_action(user, duplicate, 'hidden')
+    db.save_user_action(user, kept, 'hidden')
+
+    assert db.compact_vacancies() == 1
+
+    assert db.get_saved_vacancy_ids(user) == [kept]
+    assert actions(db, user, kept) == ['saved', 'hidden']
+    assert db.fetchone('SELECT fingerprint FROM vacancies WHERE id = ?', (kept,))['fingerprint'] == \
+        vacancy_fingerprint(VACANCY)
+
+
+def test_compaction_keeps_latest_saved_state_across_duplicates(db, user):
+    kept = db.save_vacancy(VACANCY)
+    duplicate = add_stale_duplicate(db, VACANCY)
+    db.set_saved(user, duplicate, True)
+    db.set_saved(user, kept, True)
+    db.set_saved(user, duplicate, False)
+
+    db.compact_vacancies()
+
+    assert db.get_saved_vacancy_ids(user) == []
+    assert actions(db, user, kept) == ['unsaved']
+
+
+def test_compaction_leaves_unrelated_history_alone(db, user):
+    other = db.save_vacancy({**VACANCY, 'apply_url': 'https://acme.example/jobs/2'})
+    db.set_saved(user, other, True)
+    db.set_saved(user, other, False)
+    db.set_saved(user, other, True)
+    db.save_vacancy(VACANCY)
+    add_stale_duplicate(db, VACANCY)
+
+    db.compact_vacancies()
+
+    assert actions(db, user, other) == ['saved', 'unsaved', 'saved']
+    assert db.get_saved_vacancy_ids(user) == [other]
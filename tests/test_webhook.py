@@ -0,0 +1,91 @@
+import asyncio
+import json
+import random
+
+import httpx
+from telegram import Update
+
+from webhook import SECRET_HEADER, PerUserUpdateProcessor, WebhookServer
+
+
+def message_update(update_id, user_id):
+    return {'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': 0, 'text': f"step {update_id}",
+        'chat': {'id': user_id, 'type': 'private'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': 'Test'},
+    }}
+
+
+class FakeApplication:
+    bot = None
+
+    def __init__(self):
+        self.update_queue = asyncio.Queue()
+
+
+async def dispatch(processor, updates, handle):
+    """Как Application с concurrent_updates: задача на каждый апдейт в порядке очереди"""
+    tasks = [asyncio.create_task(processor.process_update(update, handle(update))) for update in updates]
+    await asyncio.gather(*tasks)
+
+
+def test_webhook_updates_are_processed_in_order_per_user():
+    async def scenario():
+        application = FakeApplication()
+        server = WebhookServer(application, listen='127.0.0.1', port=0, secret='s3cret')
+        await server.start()
+        port = server._server.sockets[0].getsockname()[1]
+        url = f"http://127.0.0.1:{port}{server.path}"
+        try:
+            async with httpx.AsyncClient() as client:
+                forged = await client.post(url, content=json.dumps(message_update(1, 7)))
+                for update_id in range(1, 31):
+                    response = await client.post(url, content=json.dumps(message_update(update_id, 100 + update_id % 3)),
+                                                 headers={SECRET_HEADER: 's3cret'})
+                    assert response.status_code == 200
+        finally:
+            await server.stop()
+
+        updates = [application.update_queue.get_nowait() for _ in range(application.update_queue.qsize())]
+        processed = {}
+        rng = random.Random(3)
+
+        async def handle(update):
+            await asyncio.sleep(rng.random() / 200)
+            processed.setdefault(update.effective_user.id, []).append(update.update_id)
+
+        processor = PerUserUpdateProcessor(max_processing=8)
+        await dispatch(processor, updates, handle)
+        return forged.status_code, server.responses, processed, processor
+
+    forged_status, responses, processed, processor = asyncio.run(scenario())
+    assert forged_status == 403
+    assert responses == {'200 OK': 30, '403 Forbidden': 1}
+    assert processed == {user_id: [n for n in range(1, 31) if 100 + n % 3 == user_id] for user_id in (100, 101, 102)}
+    assert processor._locks == {}
+
+
+def test_burst_from_one_user_does_not_take_all_slots():
+    async def scenario():
+        release = asyncio.Event()
+        other_done = asyncio.Event()
+
+        async def handle(update):
+            if update.effective_user.id == 1:
+                await release.wait()
+            else:
+                other_done.set()
+
+        processor = PerUserUpdateProcessor(max_processing=2)
+        burst = [Update.de_json(message_update(n, 1), None) for n in range(1, 11)]
+        other = Update.de_json(message_update(11, 2), None)
+        running = asyncio.create_task(dispatch(processor, burst + [other], handle))
+
+        # Первый апдейт серии держит свой слот; второй пользователь получает свободный
+        await asyncio.wait_for(other_done.wait(), 1)
+        busy = processor.processing
+        release.set()
+        await asyncio.wait_for(running, 1)
+        return busy
+
+    assert asyncio.run(scenario()) == 1
@@ -0,0 +1,258 @@
+"""Прием апдейтов через webhook и их параллельная обработка.
+
+WebhookServer - небольшой HTTP/1.1-сервер на asyncio: принимает POST с
+апдейтом на WEBHOOK_PATH, проверяет секрет из заголовка
+X-Telegram-Bot-Api-Secret-Token и кладет апдейт в очередь приложения;
+Telegram получает ответ сразу, не дожидаясь обработки. TLS предполагается на
+обратном прокси перед ботом. Без публичного адреса сервер работает локально:
+setWebhook не вызывается, а записанные апдейты можно отправить скриптом:
+
+    python webhook.py fixtures/updates/onboarding.jsonl --url http://127.0.0.1:8443/telegram
+
+PerUserUpdateProcessor обрабатывает до max_processing апдейтов
+одновременно (и в webhook, и в polling), но апдейты одного пользователя - по
+очереди и в порядке поступления: шаги анкеты и двойные нажатия не обгоняют
+друг друга. Слот обработки апдейт занимает только в свою очередь, поэтому
+разные пользователи не ждут друг друга. Все это делается в do_process_update -
+точке расширения BaseUpdateProcessor, без переопределения process_update.
+
+Если метрики включены, сервер отдает их по GET /metrics в формате Prometheus.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import signal
+from collections import Counter
+
+import httpx
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+MAX_CONCURRENT_UPDATES = 32
+MAX_PENDING_UPDATES = 10000  # принятых апдейтов: обрабатываемых и ждущих в очередях пользователей
+WEBHOOK_LISTEN = '0.0.0.0'
+WEBHOOK_PORT = 8443
+WEBHOOK_PATH = '/telegram'
+WEBHOOK_MAX_BODY = 1024 * 1024  # апдейты Telegram намного меньше
+WEBHOOK_IDLE_TIMEOUT = 60  # секунд ожидания следующего запроса в keep-alive соединении
+SECRET_HEADER = 'x-telegram-bot-api-secret-token'
+METRICS_PATH = '/metrics'
+METRICS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка апдейтов с сохранением порядка в пределах пользователя.
+
+    max_concurrent_updates базового класса (его семафор process_update берет
+    до вызова do_process_update) ограничивает только число принятых апдейтов -
+    max_pending_updates. Одновременную обработку ограничивают собственные слоты
+    (max_processing): апдейт берет слот уже после своей очереди пользователя,
+    поэтому апдейты, ждущие предыдущих от того же пользователя, слотов не занимают.
+    """
+
+    def __init__(self, max_processing=MAX_CONCURRENT_UPDATES, max_pending_updates=MAX_PENDING_UPDATES):
+        if max_processing < 1:
+            raise ValueError("max_processing должен быть положительным")
+        super().__init__(max(max_pending_updates, max_processing))
+        self.max_processing = max_processing
+        self._slots = asyncio.Semaphore(max_processing)
+        self._processing = 0
+        # Ключ -> [блокировка, число апдейтов, ожидающих или держащих ее]
+        self._locks = {}
+
+    @property
+    def processing(self):
+        """Апдейтов, обрабатываемых сейчас (без ждущих своей очереди)"""
+        return self._processing
+
+    @staticmethod
+    def ordering_key(update):
+        if isinstance(update, Update):
+            if update.effective_user:
+                return update.effective_user.id
+            if update.effective_chat:
+                return update.effective_chat.id
+        return None
+
+    async def do_process_update(self, update, coroutine):
+        key = self.ordering_key(update)
+        if key is None:
+            await self._run(coroutine)
+            return
+
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await self._run(coroutine)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+
+    async def _run(self, coroutine):
+        async with self._slots:
+            self._processing += 1
+            try:
+                await coroutine
+            finally:
+                self._processing -= 1
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+class WebhookServer:
+    """HTTP-сервер, передающий апдейты из webhook в очередь приложения"""
+
+    def __init__(self, application, listen=WEBHOOK_LISTEN, port=WEBHOOK_PORT, path=WEBHOOK_PATH, secret=None,
+                 metrics=None):
+        self.application = application
+        self.listen = listen
+        self.port = port
+        self.path = path
+        self.secret = secret
+        self.metrics = metrics  # включенный реестр метрик отдается по GET METRICS_PATH
+        self.responses = Counter()
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, self.listen, self.port)
+        logger.info(f"Webhook принимает апдейты на http://{self.listen}:{self.port}{self.path}")
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _serve(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), WEBHOOK_IDLE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                if not request_line:
+                    break
+                status, keep_alive, *content = await self._handle(request_line, reader)
+                self.responses[status] += 1
+                content = content[0].encode() if content else b''
+                content_type = f"Content-Type: {METRICS_CONTENT_TYPE}\r\n" if content else ''
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Length: {len(content)}\r\n{content_type}"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + content
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _handle(self, request_line, reader):
+        """Статус ответа, можно ли продолжать соединение и, для метрик, текст ответа"""
+        try:
+            method, target, _ = request_line.decode('latin-1').split(' ', 2)
+        except ValueError:
+            return '400 Bad Request', False
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        keep_alive = headers.get('connection', '').lower() != 'close'
+
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            return '400 Bad Request', False
+        if length > WEBHOOK_MAX_BODY:
+            return '413 Payload Too Large', False
+        body = await reader.readexactly(length) if length else b''
+
+        target = target.split('?', 1)[0]
+        if target == METRICS_PATH and method == 'GET' and self.metrics is not None and self.metrics.enabled:
+            return '200 OK', keep_alive, self.metrics.render()
+        if target != self.path:
+            return '404 Not Found', keep_alive
+        if method != 'POST':
+            return '405 Method Not Allowed', keep_alive
+        if self.secret and headers.get(SECRET_HEADER) != self.secret:
+            logger.warning("Webhook: запрос с неверным секретом")
+            return '403 Forbidden', keep_alive
+
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning(f"Webhook: некорректный апдейт ({e})")
+            return '400 Bad Request', keep_alive
+        await self.application.update_queue.put(update)
+        return '200 OK', keep_alive
+
+async def serve_webhook(application, server, webhook_url=None):
+    """Запускает приложение с приемом апдейтов через server до SIGINT/SIGTERM.
+
+    Повторяет жизненный цикл run_polling: initialize, post_init, start, ...,
+    stop, post_stop, shutdown. webhook_url - публичный HTTPS-адрес для
+    setWebhook; без него сервер доступен только локально.
+    """
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+
+    async with application:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        await server.start()
+        try:
+            if webhook_url:
+                await application.bot.set_webhook(
+                    url=webhook_url, secret_token=server.secret, allowed_updates=Update.ALL_TYPES,
+                    max_connections=application.update_processor.max_processing
+                )
+                logger.info(f"Webhook зарегистрирован: {webhook_url}")
+            await stopping.wait()
+        finally:
+            await server.stop()
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+
+async def post_updates(path, url, secret=None):
+    """Отправляет записанные апдейты (JSONL, по апдейту на строку) на webhook по порядку"""
+    headers = {SECRET_HEADER: secret} if secret else {}
+    statuses = Counter()
+    async with httpx.AsyncClient(timeout=10) as client:
+        with open(path, encoding='utf-8') as updates:
+            for line in updates:
+                if line.strip():
+                    response = await client.post(url, content=line.strip(), headers={
+                        'Content-Type': 'application/json', **headers
+                    })
+                    statuses[response.status_code] += 1
+    return statuses
+
+def main():
+    parser = argparse.ArgumentParser(description="Отправка записанных апдейтов на локальный webhook")
+    parser.add_argument('updates', help="файл JSONL с апдейтами")
+    parser.add_argument('--url', default=f"http://127.0.0.1:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+    parser.add_argument('--secret', help="секрет webhook, если он задан у бота")
+    args = parser.parse_args()
+    statuses = asyncio.run(post_updates(args.updates, args.url, args.secret))
+    print(', '.join(f"HTTP {status}: {count}" for status, count in sorted(statuses.items())))
+
+if __name__ == '__main__':
+    main()